@@ -1,12 +1,41 @@
-import re
-import math
 import numpy as np
 import pandas as pd
 import streamlit as st
-from bs4 import BeautifulSoup
-import unicodedata
 import hashlib
+import os
 import time
+import altair as alt
+import uuid
+import cache_registry
+import ingest
+import instrumentation
+import preferences
+import pipeline
+import profiling
+import score_store
+import sensitivity
+import styling
+from cache_registry import cached
+from charts import MAX_SCATTER_POINTS, RADAR_ATTRIBUTES, density_sample, radar_figure, scatter_figure
+from similarity import SimilarityIndex, filter_mask
+from sketches import merge_columns
+from styling import (
+    NUMERIC_COLUMNS, ADAPTIVE_TIER_QUANTILES, TIER_NAMES, adaptive_thresholds, build_display_table, table_styles,
+    tier_codes, tier_counts, tier_filter
+)
+from assignment import (
+    solve_xi, solve_batch, solve_constrained_xi, reoptimize_xi, k_best_xis,
+    simulate_availability, marginal_gains, build_top_k_index
+)
+from formations import (
+    FORMATIONS, DEFAULT_FORMATION, ROLES,
+    formation_positions, formation_slot_keys, formation_role_columns
+)
+from pipeline import (
+    CANONICAL_ATTRIBUTES, WEIGHTS_BY_ROLE, parse_players_from_stream, merge_duplicate_columns, known_transfer_value,
+    create_name_key, unavailable_mask, calculate_role_scores, ELIGIBILITY_MODES, apply_position_eligibility,
+    attribute_contributions
+)
 
 # Page config with custom styling and performance optimizations
 st.set_page_config(
@@ -109,53 +138,81 @@ if 'custom_first_xi' not in st.session_state:
     st.session_state.custom_first_xi = {}
 if 'custom_second_xi' not in st.session_state:
     st.session_state.custom_second_xi = {}
+if 'custom_first_excluded' not in st.session_state:
+    st.session_state.custom_first_excluded = []
+if 'custom_second_excluded' not in st.session_state:
+    st.session_state.custom_second_excluded = []
+if 'xi_warm_state' not in st.session_state:
+    st.session_state.xi_warm_state = {}
 if 'use_custom_teams' not in st.session_state:
     st.session_state.use_custom_teams = False
 if 'last_upload_time' not in st.session_state:
     st.session_state.last_upload_time = None
 if 'file_hash' not in st.session_state:
     st.session_state.file_hash = None
+if 'file_fingerprints' not in st.session_state:
+    st.session_state.file_fingerprints = {}
+if 'score_lease' not in st.session_state:
+    # This session's hold on the score arrays shared between sessions
+    st.session_state.score_lease = score_store.Lease()
+
+# Opt-in profiling of the whole rerun (PLAYER_RANKER_PROFILE=1 or ?profile=1)
+profiling_requested = profiling.enabled(st.query_params.get("profile") if hasattr(st, 'query_params') else None)
+rerun_profiler = profiling.start() if profiling_requested else None
+
+# Stage timings for this rerun, shown in the sidebar Performance panel
+rerun_trace = instrumentation.RerunTrace()
+
+def finish_profile():
+    """Stop this rerun's profiler and write its dumps"""
+    if rerun_profiler is not None:
+        st.session_state.profile_dump = profiling.finish(
+            rerun_profiler, rerun_trace.tag, {"_timings.json": rerun_trace.to_json()}
+        )
+
+def end_rerun(rerun=False, write_profile=True):
+    """st.stop() (or st.rerun()) that first switches this rerun's profiler off, writing its dumps or dropping them"""
+    if write_profile:
+        finish_profile()
+    elif rerun_profiler is not None:
+        profiling.cancel(rerun_profiler)
+    if rerun:
+        st.rerun()
+    st.stop()
 
-# Initialize persistent user preferences
+# Function to identify the user whose preferences are stored
+def preference_user_id():
+    """Login email when authentication is on, otherwise a per-user id kept in the URL"""
+    try:
+        email = st.user.get("email")
+    except Exception:
+        email = None
+    if email:
+        return email
+
+    if not hasattr(st, 'query_params'):
+        return uuid.uuid4().hex[:12]
+    user_id = st.query_params.get("user")
+    if not user_id:
+        user_id = uuid.uuid4().hex[:12]
+        st.query_params["user"] = user_id
+    return user_id
+
+# Initialize persistent user preferences, read from disk once per session
 if 'user_preferences' not in st.session_state:
-    st.session_state.user_preferences = {
+    st.session_state.preferences_user = preference_user_id()
+    st.session_state.user_preferences = preferences.load(st.session_state.preferences_user, {
         'default_view': 'Full Table',
         'auto_refresh': False,
         'show_advanced_stats': False,
+        'adaptive_colours': False,
         'theme_preference': 'dark'
-    }
+    })
 
 # Function to save preferences to file
 def save_preferences():
-    """Save user preferences to a file"""
-    import json
-    import os
-    
-    # Create a hidden directory for preferences
-    prefs_dir = ".streamlit"
-    os.makedirs(prefs_dir, exist_ok=True)
-    
-    prefs_file = os.path.join(prefs_dir, "user_preferences.json")
-    with open(prefs_file, 'w') as f:
-        json.dump(st.session_state.user_preferences, f)
-
-# Function to load preferences from file
-def load_preferences():
-    """Load user preferences from file"""
-    import json
-    import os
-    
-    prefs_file = os.path.join(".streamlit", "user_preferences.json")
-    if os.path.exists(prefs_file):
-        try:
-            with open(prefs_file, 'r') as f:
-                saved_prefs = json.load(f)
-                st.session_state.user_preferences.update(saved_prefs)
-        except (json.JSONDecodeError, FileNotFoundError):
-            pass  # Use default preferences if file is corrupted
-
-# Load preferences on startup
-load_preferences()
+    """Queue a debounced, atomic write of this user's preferences"""
+    preferences.save(st.session_state.preferences_user, st.session_state.user_preferences)
 
 # Header
 st.markdown("""
@@ -164,333 +221,85 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-CANONICAL_ATTRIBUTES = [
-    "Corners", "Crossing", "Dribbling", "Finishing", "First Touch", "Free Kick Taking",
-    "Heading", "Long Shots", "Long Throws", "Marking", "Passing", "Penalty Taking",
-    "Tackling", "Technique", "Aggression", "Anticipation", "Bravery", "Composure",
-    "Concentration", "Decisions", "Determination", "Flair", "Leadership", "Off The Ball",
-    "Positioning", "Teamwork", "Vision", "Work Rate", "Acceleration", "Agility",
-    "Balance", "Jumping Reach", "Natural Fitness", "Pace", "Stamina", "Strength",
-    "Weaker Foot", "Aerial Reach", "Command of Area", "Communication", "Eccentricity",
-    "Handling", "Kicking", "One on Ones", "Punching (Tendency)", "Reflexes",
-    "Rushing Out (Tendency)", "Throwing"
-]
-
-WEIGHTS_BY_ROLE = {
-    "GK": {
-        "Corners": 0.0, "Crossing": 0.0, "Dribbling": 0.0, "Finishing": 0.0, "First Touch": 0.0, "Free Kick Taking": 0.0,
-        "Heading": 1.0, "Long Shots": 0.0, "Long Throws": 0.0, "Marking": 0.0, "Passing": 0.0, "Penalty Taking": 0.0,
-        "Tackling": 0.0, "Technique": 1.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 6.0, "Composure": 2.0,
-        "Concentration": 6.0, "Decisions": 10.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 2.0, "Off The Ball": 0.0,
-        "Positioning": 5.0, "Teamwork": 2.0, "Vision": 1.0, "Work Rate": 1.0, "Acceleration": 6.0, "Agility": 8.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 3.0, "Stamina": 1.0, "Strength": 4.0,
-        "Weaker Foot": 3.0, "Aerial Reach": 6.0, "Command of Area": 6.0, "Communication": 5.0, "Eccentricity": 0.0,
-        "Handling": 8.0, "Kicking": 5.0, "One on Ones": 4.0, "Punching (Tendency)": 0.0, "Reflexes": 8.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 3.0
-    },
-    "DL/DR": {
-        "Corners": 1.0, "Crossing": 2.0, "Dribbling": 1.0, "Finishing": 1.0, "First Touch": 3.0, "Free Kick Taking": 1.0,
-        "Heading": 2.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 2.0, "Penalty Taking": 1.0,
-        "Tackling": 4.0, "Technique": 2.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 2.0, "Composure": 2.0,
-        "Concentration": 4.0, "Decisions": 7.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 1.0,
-        "Positioning": 4.0, "Teamwork": 2.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 7.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 2.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 6.0, "Strength": 4.0,
-        "Weaker Foot": 4.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "CB": {
-        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 1.0, "Finishing": 1.0, "First Touch": 2.0, "Free Kick Taking": 1.0,
-        "Heading": 5.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 8.0, "Passing": 2.0, "Penalty Taking": 1.0,
-        "Tackling": 5.0, "Technique": 1.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 2.0, "Composure": 2.0,
-        "Concentration": 4.0, "Decisions": 10.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 2.0, "Off The Ball": 1.0,
-        "Positioning": 8.0, "Teamwork": 1.0, "Vision": 1.0, "Work Rate": 2.0, "Acceleration": 6.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 6.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 3.0, "Strength": 6.0,
-        "Weaker Foot": 4.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "WBL/WBR": {
-        "Corners": 1.0, "Crossing": 3.0, "Dribbling": 2.0, "Finishing": 1.0, "First Touch": 3.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 2.0, "Passing": 3.0, "Penalty Taking": 1.0,
-        "Tackling": 3.0, "Technique": 3.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 2.0,
-        "Concentration": 3.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
-        "Positioning": 3.0, "Teamwork": 2.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 8.0, "Agility": 5.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 6.0, "Stamina": 7.0, "Strength": 4.0,
-        "Weaker Foot": 4.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "DM": {
-        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 2.0, "Finishing": 2.0, "First Touch": 4.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 4.0, "Penalty Taking": 1.0,
-        "Tackling": 7.0, "Technique": 3.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 1.0, "Composure": 2.0,
-        "Concentration": 3.0, "Decisions": 8.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 1.0,
-        "Positioning": 5.0, "Teamwork": 2.0, "Vision": 4.0, "Work Rate": 4.0, "Acceleration": 6.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 4.0, "Stamina": 4.0, "Strength": 5.0,
-        "Weaker Foot": 5.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "ML/MR": {
-        "Corners": 1.0, "Crossing": 5.0, "Dribbling": 3.0, "Finishing": 2.0, "First Touch": 4.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 3.0, "Penalty Taking": 1.0,
-        "Tackling": 2.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 2.0,
-        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
-        "Positioning": 1.0, "Teamwork": 2.0, "Vision": 3.0, "Work Rate": 3.0, "Acceleration": 8.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 6.0, "Stamina": 5.0, "Strength": 3.0,
-        "Weaker Foot": 5.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "CM": {
-        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 2.0, "Finishing": 2.0, "First Touch": 6.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 6.0, "Penalty Taking": 1.0,
-        "Tackling": 3.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
-        "Concentration": 2.0, "Decisions": 7.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 3.0,
-        "Positioning": 3.0, "Teamwork": 2.0, "Vision": 6.0, "Work Rate": 3.0, "Acceleration": 6.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 6.0, "Strength": 4.0,
-        "Weaker Foot": 6.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "AML/AMR": {
-        "Corners": 1.0, "Crossing": 5.0, "Dribbling": 5.0, "Finishing": 2.0, "First Touch": 5.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 2.0, "Penalty Taking": 1.0,
-        "Tackling": 2.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
-        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
-        "Positioning": 1.0, "Teamwork": 2.0, "Vision": 3.0, "Work Rate": 3.0, "Acceleration": 10.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 10.0, "Stamina": 7.0, "Strength": 3.0,
-        "Weaker Foot": 5.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "AMC": {
-        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 3.0, "Finishing": 3.0, "First Touch": 5.0, "Free Kick Taking": 1.0,
-        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 4.0, "Penalty Taking": 1.0,
-        "Tackling": 2.0, "Technique": 5.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
-        "Concentration": 2.0, "Decisions": 6.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 3.0,
-        "Positioning": 2.0, "Teamwork": 2.0, "Vision": 6.0, "Work Rate": 3.0, "Acceleration": 9.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 7.0, "Stamina": 6.0, "Strength": 3.0,
-        "Weaker Foot": 7.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    },
-    "ST": {
-        "Corners": 1.0, "Crossing": 2.0, "Dribbling": 5.0, "Finishing": 8.0, "First Touch": 6.0, "Free Kick Taking": 1.0,
-        "Heading": 6.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 2.0, "Penalty Taking": 1.0,
-        "Tackling": 1.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 1.0, "Composure": 6.0,
-        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 6.0,
-        "Positioning": 2.0, "Teamwork": 1.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 10.0, "Agility": 6.0,
-        "Balance": 2.0, "Jumping Reach": 5.0, "Natural Fitness": 0.0, "Pace": 7.0, "Stamina": 6.0, "Strength": 6.0,
-        "Weaker Foot": 7.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
-        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
-        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
-    }
-}
-
-ABBR_MAP = {
-    "Name": "Name", "Position": "Position", "Inf": "Inf", "Age": "Age", "Transfer Value": "Transfer Value",
-    "Cor": "Corners", "Cro": "Crossing", "Dri": "Dribbling", "Fin": "Finishing", "Fir": "First Touch", "Fre": "Free Kick Taking",
-    "Hea": "Heading", "Lon": "Long Shots", "L Th": "Long Throws", "LTh": "Long Throws", "Mar": "Marking", "Pas": "Passing", "Pen": "Penalty Taking",
-    "Tck": "Tackling", "Tec": "Technique", "Agg": "Aggression", "Ant": "Anticipation", "Bra": "Bravery", "Cmp": "Composure", "Cnt": "Concentration",
-    "Dec": "Decisions", "Det": "Determination", "Fla": "Flair", "Ldr": "Leadership", "OtB": "Off The Ball", "Pos": "Positioning", "Tea": "Teamwork", "Vis": "Vision", "Wor": "Work Rate",
-    "Acc": "Acceleration", "Agi": "Agility", "Bal": "Balance", "Jum": "Jumping Reach", "Nat": "Natural Fitness", "Pac": "Pace", "Sta": "Stamina", "Str": "Strength",
-    "Weaker Foot": "Weaker Foot", "Aer": "Aerial Reach", "Cmd": "Command of Area", "Com": "Communication", "Ecc": "Eccentricity", "Han": "Handling", "Kic": "Kicking",
-    "1v1": "One on Ones", "Pun": "Punching (Tendency)", "Ref": "Reflexes", "TRO": "Rushing Out (Tendency)", "Thr": "Throwing"
-}
-
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def parse_players_from_html(html_text: str):
-    soup = BeautifulSoup(html_text, "html.parser")
-    table = soup.find("table")
-    if table is None:
-        return None, "No <table> found in HTML."
-
-    header_row = table.find("tr")
-    if header_row is None:
-        return None, "No rows in table."
-
-    ths = header_row.find_all(["th", "td"])
-    header_cells = [th.get_text(strip=True) for th in ths]
-    canonical = [ABBR_MAP.get(h, h) for h in header_cells]
-
-    rows = []
-    for tr in table.find_all("tr")[1:]:
-        cols = [td.get_text(strip=True) for td in tr.find_all(["td", "th"])]
-        if not cols or all(not c for c in cols):
-            continue
-
-        if len(cols) < len(canonical):
-            cols += [""] * (len(canonical) - len(cols))
-        cols = cols[:len(canonical)]
-
-        row = {col_name: val for col_name, val in zip(canonical, cols) if col_name}
-
-        name = (row.get("Name") or "").strip()
-        if not name or name.lower() == "name":
-            continue
-
-        rows.append(row)
-
-    if not rows:
-        return None, "No data rows parsed from HTML table."
-
-    df = pd.DataFrame(rows)
-
-    # convert numeric-like columns except textual ones
-    for c in df.columns:
-        if c in ("Name", "Position", "Transfer Value", "Inf"):
-            continue
-        df[c] = df[c].astype(str).str.extract(r'(-?\d+(?:\.\d+)?)')[0]
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-
-    if "Age" in df.columns:
-        df["Age"] = pd.to_numeric(df["Age"], errors="coerce").astype("Int64")
-
+@cached("parse", ttl=3600)  # Cache for 1 hour
+def load_upload(file_key, _uploaded, _on_chunk=None):
+    """Stream-parse one uploaded file, keyed by its content fingerprint"""
+    _uploaded.seek(0)
+    return parse_players_from_stream(_uploaded, total_bytes=getattr(_uploaded, 'size', None), on_chunk=_on_chunk)
+
+@cached("parse", ttl=3600)  # Cache for 1 hour
+def merge_upload(file_key, _df):
+    """Merge repeated columns of one parsed upload"""
+    return merge_duplicate_columns(_df).reset_index(drop=True)
+
+def ingest_file(file_key, uploaded, on_chunk, trace):
+    """Parse and merge one upload, run by the background ingest job"""
+    with trace.stage(f"parse: {uploaded.name}") as span:
+        parsed, err = span.output(load_upload(file_key, uploaded, _on_chunk=on_chunk))
+        span.rows = 0 if parsed is None else len(parsed)
+    if parsed is None:
+        return None, err
+    with trace.stage(f"merge: {uploaded.name}") as span:
+        df = span.output(merge_upload(file_key, parsed))
     return df, None
 
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def merge_duplicate_columns(df: pd.DataFrame) -> pd.DataFrame:
-    cols = list(df.columns)
-    if not any(cols.count(c) > 1 for c in cols):
-        return df
-
-    unique_order = []
-    for c in cols:
-        if c not in unique_order:
-            unique_order.append(c)
-
-    merged = pd.DataFrame(index=df.index)
-    for col in unique_order:
-        same_cols = [c for c in cols if c == col]
-        if len(same_cols) == 1:
-            merged[col] = df[col]
-        else:
-            subset = df.loc[:, same_cols]
-            subset_num = subset.apply(pd.to_numeric, errors="coerce")
-            if subset_num.notna().sum().sum() > 0:
-                merged[col] = subset_num.mean(axis=1)
-            else:
-                merged[col] = subset.apply(lambda r: next((v for v in r if isinstance(v, str) and v.strip()), ""), axis=1)
-
-    return merged
+@cached("parse", ttl=3600)  # Cache for 1 hour
+def combine_uploads(upload_key, _dfs):
+    """Concatenate the parsed uploads and assign stable integer player IDs"""
+    df = pd.concat(_dfs, ignore_index=True)
+    # Stable integer player IDs, assigned once at ingest (rows move around during deduplication)
+    df['Player ID'] = np.arange(len(df), dtype=np.int64)
+    return df
 
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def parse_transfer_value(x):
-    """Parse transfer value strings into numeric values"""
-    try:
-        if pd.isna(x):
-            return 0.0
-        s = str(x).strip()
-        if not s or s == "-" or s.lower() in {"n/a", "none"}:
-            return 0.0
-
-        s2 = re.sub(r'[^0-9\.,kKmM]', '', s)
-        if s2 == "":
-            m = re.search(r'(-?\d+(?:\.\d+)?)', s)
-            if m:
-                try:
-                    return float(m.group(1).replace(',', ''))
-                except Exception:
-                    return 0.0
-            return 0.0
-
-        m = re.match(r'([0-9\.,]+)\s*([kKmM]?)', s2)
-        if not m:
-            try:
-                return float(s2.replace(',', ''))
-            except Exception:
-                return 0.0
-
-        num = m.group(1).replace(',', '')
-        try:
-            val = float(num)
-        except Exception:
-            val = 0.0
-
-        suf = m.group(2).lower()
-        if suf == 'k':
-            val *= 1_000.0
-        elif suf == 'm':
-            val *= 1_000_000.0
-
-        return val
-    except Exception:
-        return 0.0
-
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def create_name_key(name):
-    """Create name key for deduplication"""
-    if pd.isna(name) or not name:
-        return f"_empty_{id(name)}"
-
-    name_str = str(name).strip()
-    if not name_str:
-        return f"_empty_{id(name)}"
-
-    normalized = re.sub(r'\s+', ' ', name_str.lower().strip())
-    normalized = normalized.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-    normalized = normalized.replace('ñ', 'n').replace('ç', 'c')
-
-    return normalized
-
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def deduplicate_players(df):
+@cached("dedup", ttl=3600)  # Cache for 1 hour
+def deduplicate_players(upload_key, _df):
     """Deduplicate players by name, keeping best version"""
-    if len(df) <= 1:
-        return df
-
-    df = df.copy()
-    
-    # Check if Name column exists
-    if 'Name' not in df.columns:
-        st.warning("⚠️ No 'Name' column found, skipping deduplication.")
-        return df
-    
-    df['_name_key'] = df['Name'].apply(create_name_key)
-    df['_transfer_val_numeric'] = df.get('Transfer Value', '').apply(parse_transfer_value)
-
-    # Calculate average score across all roles for deduplication
-    available_attrs = [a for a in CANONICAL_ATTRIBUTES if a in df.columns]
-    if available_attrs:
-        attrs_df = df[available_attrs].fillna(0).astype(float)
-        avg_scores = []
-        for _, player in attrs_df.iterrows():
-            player_scores = []
-            for role, weights in WEIGHTS_BY_ROLE.items():
-                w = pd.Series({a: float(weights.get(a, 0.0)) for a in available_attrs}).reindex(available_attrs).fillna(0.0)
-                score = player.values.dot(w.values.astype(float))
-                player_scores.append(score)
-            avg_scores.append(np.mean(player_scores))
-        df['_avg_score'] = avg_scores
-    else:
-        df['_avg_score'] = 0
+    return pipeline.deduplicate_players(_df)
 
-    df_sorted = df.sort_values(['_avg_score', '_transfer_val_numeric'], ascending=[False, False])
-    df_deduped = df_sorted.drop_duplicates(subset=['_name_key'], keep='first')
-    df_deduped = df_deduped.drop(columns=['_name_key', '_transfer_val_numeric', '_avg_score'])
+def file_fingerprint(uploaded):
+    """Content hash of one uploaded file, computed once per upload and reused on reruns"""
+    file_id = getattr(uploaded, 'file_id', None)
+    fingerprints = st.session_state.file_fingerprints
+    if file_id is not None and file_id in fingerprints:
+        return fingerprints[file_id]
 
-    duplicates_removed = len(df) - len(df_deduped)
-    if duplicates_removed > 0:
-        st.success(f"✅ Removed {duplicates_removed} duplicate player(s)")
+    fingerprint = hashlib.md5(uploaded.getvalue()).hexdigest()
+    if file_id is not None:
+        fingerprints[file_id] = fingerprint
+    return fingerprint
 
-    return df_deduped.reset_index(drop=True)
+def combine_fingerprints(file_keys):
+    """Key for a set of uploads from their per-file fingerprints"""
+    return hashlib.md5(":".join(file_keys).encode()).hexdigest()
 
 def create_file_hash(uploaded_files):
-    """Create a hash of uploaded files to detect changes"""
-    file_contents = []
-    for file in uploaded_files:
-        file.seek(0)  # Reset file pointer
-        file_contents.append(file.read())
-        file.seek(0)  # Reset for later use
-    combined_content = b''.join(file_contents)
-    return hashlib.md5(combined_content).hexdigest()
+    """Fingerprint of all uploaded files, the upstream key for every cached stage"""
+    return combine_fingerprints(file_fingerprint(file) for file in uploaded_files)
 
 def should_refresh_cache(current_hash, last_hash):
     """Determine if cache should be refreshed based on file changes"""
     return current_hash != last_hash
 
+# How long the rerun that starts an ingest job waits for it before showing progress
+INGEST_FIRST_WAIT_SECONDS = 1.0
+
+@st.fragment(run_every=1.0)
+def render_ingest_progress(job, shown_files):
+    """Row-level progress of the background ingest, rerunning the app as files finish"""
+    if job.done or len(job.finished_files()) != shown_files:
+        end_rerun(rerun=True, write_profile=False)
+
+    current = job.current_file()
+    if current is not None:
+        text = f"Parsing {current.name}: {current.rows:,} rows read"
+    else:
+        text = "Waiting to parse..."
+    st.progress(job.fraction(), text=f"{text} ({shown_files} of {len(job.files)} files done)")
+    if st.button("Cancel processing", key="cancel_ingest"):
+        job.cancel()
+        job.wait(5)
+        end_rerun(rerun=True, write_profile=False)
+
 # Sidebar Configuration
 with st.sidebar:
     # User Preferences
@@ -516,6 +325,16 @@ with st.sidebar:
     if show_advanced != st.session_state.user_preferences['show_advanced_stats']:
         st.session_state.user_preferences['show_advanced_stats'] = show_advanced
         save_preferences()
+
+    # Adaptive colour thresholds toggle
+    adaptive_colours = st.checkbox(
+        "Adaptive Colours",
+        value=st.session_state.user_preferences['adaptive_colours'],
+        help="Colour the Full Table relative to the uploaded players (percentiles) instead of fixed top-division thresholds"
+    )
+    if adaptive_colours != st.session_state.user_preferences['adaptive_colours']:
+        st.session_state.user_preferences['adaptive_colours'] = adaptive_colours
+        save_preferences()
     
     # Auto-refresh toggle
     auto_refresh = st.checkbox(
@@ -529,24 +348,51 @@ with st.sidebar:
     
     # Cache management
     st.markdown("### Cache Management")
+    cache_stage = st.selectbox(
+        "Cache Stage",
+        ["All Stages"] + list(cache_registry.STAGES),
+        help="Stage to clear: parse, dedup, scoring, styling or assignment"
+    )
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("🗑️ Clear Cache", help="Clear all cached data to refresh calculations"):
-            st.cache_data.clear()
+        if st.button("🗑️ Clear Cache", help="Clear cached data for the selected stage to refresh calculations"):
+            cache_registry.clear(None if cache_stage == "All Stages" else cache_stage)
             st.success("Cache cleared!")
-            st.rerun()
+            end_rerun(rerun=True, write_profile=False)
     
     with col2:
-        if st.button("📊 Cache Stats", help="Show cache statistics"):
-            cache_size = len(st.cache_data._cache) if hasattr(st.cache_data, '_cache') else 0
-            st.info(f"Cache entries: {cache_size}")
+        show_cache_stats = st.button("📊 Cache Stats", help="Show cache statistics")
+    if show_cache_stats:
+        cache_stats_df = pd.DataFrame(cache_registry.stats())
+        st.dataframe(
+            pd.DataFrame({
+                'Stage': cache_stats_df['stage'],
+                'Entries': cache_stats_df['entries'].astype(str) + "/" + cache_stats_df['max_entries'].astype(str),
+                'MB': (cache_stats_df['resident_bytes'] / cache_registry.MB).round(1),
+                'Budget MB': (cache_stats_df['max_bytes'] / cache_registry.MB).round(0).astype(int),
+                'Hits': cache_stats_df['hits'],
+                'Misses': cache_stats_df['misses'],
+                'Evicted': cache_stats_df['evictions'],
+                'Hit %': (cache_stats_df['hit_rate'] * 100).round(1),
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+        store_stats = score_store.stats()
+        st.caption(
+            f"Shared score store: {len(store_stats)} dataset(s), "
+            f"{sum(d['nbytes'] for d in store_stats) / cache_registry.MB:.1f} MB, "
+            f"{sum(d['refs'] for d in store_stats)} session hold(s)"
+        )
     
     # Performance monitoring
     st.markdown("### Performance")
     if st.session_state.last_upload_time:
         upload_time = time.strftime("%H:%M:%S", time.localtime(st.session_state.last_upload_time))
         st.caption(f"Last upload: {upload_time}")
+    # Filled in at the end of the run, once every stage has been timed
+    performance_panel = st.container()
 
 
 # Create tabs for different views with user preference
@@ -621,10 +467,13 @@ uploaded_files = st.file_uploader(
 )
 
 if not uploaded_files:
-    st.stop()
+    # Nothing was done yet, so there is nothing worth a dump
+    end_rerun(write_profile=False)
 
 # Check for file changes and optimize processing
-current_file_hash = create_file_hash(uploaded_files)
+with rerun_trace.stage("upload hash", rows=len(uploaded_files)):
+    current_file_hash = create_file_hash(uploaded_files)
+rerun_trace.tag["upload_fingerprint"] = current_file_hash
 file_changed = should_refresh_cache(current_file_hash, st.session_state.file_hash)
 
 if file_changed:
@@ -632,51 +481,57 @@ if file_changed:
     st.session_state.last_upload_time = time.time()
     # Clear cache if files changed and auto-refresh is enabled
     if st.session_state.user_preferences['auto_refresh']:
-        st.cache_data.clear()
+        cache_registry.clear()
         st.success("🔄 Files changed! Cache cleared and refreshing...")
 
-# Process files and show summary
-dfs = []
-file_results = []
-successful_files = 0
-failed_files = 0
-
-# Create progress bar
-progress_bar = st.progress(0)
-status_text = st.empty()
-
-for i, uploaded in enumerate(uploaded_files):
-    # Update progress
-    progress_bar.progress((i + 1) / len(uploaded_files))
-    status_text.text(f'Processing {uploaded.name}...')
-    
-    raw = uploaded.read()
-    try:
-        html_text = raw.decode('utf-8', errors='ignore')
-    except Exception:
-        html_text = raw.decode('latin-1', errors='ignore')
-
-    df, err = parse_players_from_html(html_text)
-    if df is None:
-        file_results.append(f"❌ {uploaded.name}: Failed to read")
-        failed_files += 1
-        continue
-
-    df = merge_duplicate_columns(df)
-    df = df.reset_index(drop=True)
-    dfs.append(df)
-    file_results.append(f"✅ {uploaded.name}: {len(df)} players loaded")
-    successful_files += 1
-
-# Complete the progress bar
-progress_bar.progress(1.0)
-status_text.text('Processing complete!')
+# Parse in a background job; reruns pick up the running job instead of restarting it
+with rerun_trace.stage("ingest", rows=len(uploaded_files)) as span:
+    ingest_job = st.session_state.get('ingest_job')
+    if ingest_job is None or ingest_job.upload_key != current_file_hash:
+        if ingest_job is not None:
+            ingest_job.cancel()
+        ingest_job = ingest.IngestJob(
+            current_file_hash,
+            [(uploaded.name, file_fingerprint(uploaded), uploaded.size, uploaded) for uploaded in uploaded_files],
+            ingest_file
+        ).start()
+        st.session_state.ingest_job = ingest_job
+        # Small uploads are done before the first render, without a progress phase
+        ingest_job.wait(INGEST_FIRST_WAIT_SECONDS)
+    finished_files = ingest_job.finished_files()
+    span.rows = ingest_job.rows_parsed()
+# Per-file parse and merge timings from the worker, in the rerun that first sees each file finish
+for finished in ingest_job.unreported_files():
+    if finished.trace is not None:
+        rerun_trace.adopt(finished.trace)
+
+dfs = [f.result for f in finished_files if f.result is not None]
+file_results = [
+    f"✅ {f.name}: {len(f.result)} players loaded" if f.result is not None else f"❌ {f.name}: Failed to read"
+    for f in finished_files
+]
+successful_files = len(dfs)
+failed_files = len(finished_files) - successful_files
+
+if not ingest_job.done:
+    render_ingest_progress(ingest_job, len(finished_files))
+    if successful_files == 0:
+        end_rerun()
+    st.info(f"Showing partial rankings from {len(finished_files)} of {len(ingest_job.files)} files while the rest are parsed")
+elif ingest_job.cancelled and len(finished_files) < len(ingest_job.files):
+    st.warning(f"Processing cancelled: showing {len(finished_files)} of {len(ingest_job.files)} files.")
+    if st.button("Process remaining files", key="resume_ingest"):
+        # Files already parsed come straight back from the parse cache
+        del st.session_state.ingest_job
+        end_rerun(rerun=True, write_profile=False)
+    if successful_files == 0:
+        end_rerun()
 
 # Determine upload status
 if successful_files == 0:
     st.session_state.upload_status = 'failed'
     st.error("❌ No valid player data parsed from any uploaded file.")
-    st.stop()
+    end_rerun()
 elif failed_files > 0:
     st.session_state.upload_status = 'partial'
 else:
@@ -686,61 +541,86 @@ else:
 for result in file_results:
     st.write(result)
 
+# Everything downstream is keyed on the files actually ingested (a subset while parsing or after a cancel)
+current_file_hash = combine_fingerprints(f.file_key for f in finished_files)
+
 # Combine all data
-df = pd.concat(dfs, ignore_index=True)
+with rerun_trace.stage("combine") as span:
+    df = span.output(combine_uploads(current_file_hash, dfs))
 available_attrs = [a for a in CANONICAL_ATTRIBUTES if a in df.columns]
 
 if not available_attrs:
     st.error("❌ No matching attribute columns found. Detected columns: " + ", ".join(list(df.columns)))
-    st.stop()
+    end_rerun()
 
 # Deduplicate players first
-df_final = deduplicate_players(df)
+with rerun_trace.stage("dedup", rows=len(df)) as span:
+    df_final = span.output(deduplicate_players(current_file_hash, df), rows=len(df))
+duplicates_removed = len(df) - len(df_final)
+if duplicates_removed > 0:
+    st.success(f"✅ Removed {duplicates_removed} duplicate player(s)")
 
 # Check if we have any players left after deduplication
 if len(df_final) == 0:
     st.error("❌ No players remaining after deduplication.")
-    st.stop()
+    end_rerun()
 
 # Check if Name column exists
 if 'Name' not in df_final.columns:
     st.error("❌ Name column not found in player data.")
-    st.stop()
-
-@st.cache_data(ttl=1800)  # Cache for 30 minutes
-def calculate_role_scores(df_final, available_attrs):
-    """Calculate role scores for all players"""
-    attrs_df_final = df_final[available_attrs].fillna(0).astype(float)
-    attrs_norm_final = attrs_df_final
-    
-    role_scores = {}
-    for role, weights in WEIGHTS_BY_ROLE.items():
-        w = pd.Series({a: float(weights.get(a, 0.0)) for a in available_attrs}).reindex(available_attrs).fillna(0.0)
-        scores = attrs_norm_final.values.dot(w.values.astype(float))
-        role_scores[role] = scores
-    
-    return role_scores, attrs_norm_final
-
-# Calculate scores for all roles
-role_scores, attrs_norm_final = calculate_role_scores(df_final, available_attrs)
-
-@st.cache_data(ttl=1800)  # Cache for 30 minutes
-def create_comprehensive_table(df_final, role_scores):
+    end_rerun()
+
+@cached("dedup", ttl=1800)  # Cache for 30 minutes
+def build_player_index(upload_key, _player_ids):
+    """Array lookup from player ID to df_final row (-1 for IDs removed by deduplication)"""
+    id_to_row = np.full(int(_player_ids.max()) + 1, -1, dtype=np.int64)
+    id_to_row[_player_ids] = np.arange(len(_player_ids))
+    return id_to_row
+
+# Tag the rerun's timings so exported reports identify the dataset
+rerun_trace.tag["players"] = len(df_final)
+
+player_ids = df_final['Player ID'].to_numpy(dtype=np.int64)
+id_to_row = build_player_index(current_file_hash, player_ids)
+
+# Calculate scores for all roles, held once per upload fingerprint and shared by every session
+with rerun_trace.stage("scoring", rows=len(df_final)) as span:
+    score_data = span.output(st.session_state.score_lease.acquire(
+        "squad", current_file_hash, lambda: calculate_role_scores(df_final, available_attrs)
+    ), rows=len(df_final))
+attrs_matrix = score_data["attrs"]
+role_score_matrix = score_data["role_scores"]
+role_scores = {role: role_score_matrix[:, i] for i, role in enumerate(ROLES)}
+# Per-role ranking of the top players, used to prune the XI solves
+top_k_index = score_data["top_k"]
+# Role bitmask per player, parsed from the Position column
+position_masks = score_data["positions"]
+
+@cached("scoring", ttl=3600)  # Cache for 1 hour
+def file_score_sketches(file_key, _df):
+    """Per-role score quantile sketches of one upload"""
+    return pipeline.role_score_sketches(_df)
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def dataset_thresholds(upload_key, _files):
+    """Adaptive (role thresholds, floors), merging the cached sketch of each ingested file"""
+    merged = merge_columns(file_score_sketches(f.file_key, f.result) for f in _files if f.result is not None)
+    cut_points = {role: merged[ROLES.index(role)].quantiles(ADAPTIVE_TIER_QUANTILES) for role in NUMERIC_COLUMNS}
+    return adaptive_thresholds(cut_points)
+
+@cached("styling", ttl=1800)  # Cache for 30 minutes
+def role_tier_codes(tier_key, _role_score_matrix, _role_thresholds, _empty_cell_floors):
+    """int8 players x ROLES tier codes, read by the tier filter and counts"""
+    return tier_codes(_role_score_matrix, ROLES, _role_thresholds, _empty_cell_floors)
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def create_comprehensive_table(upload_key, _df_final, _role_scores):
     """Create the comprehensive player rankings table"""
-    comprehensive_data = {
-        'Rank': range(1, len(df_final) + 1),
-        'Name': df_final['Name'],
-        'Age': df_final.get('Age', pd.Series(['N/A'] * len(df_final)))
-    }
-    
-    # Add scores for each role
-    for role in ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']:
-        comprehensive_data[role] = role_scores[role].round(0).astype(int)
-    
-    return pd.DataFrame(comprehensive_data)
+    return pipeline.create_comprehensive_table(_df_final, _role_scores)
 
 # Create the new comprehensive table
-comprehensive_df = create_comprehensive_table(df_final, role_scores)
+with rerun_trace.stage("table build") as span:
+    comprehensive_df = span.output(create_comprehensive_table(current_file_hash, df_final, role_scores))
 
 # Now create the tabs for additional features
 with tab1:
@@ -763,556 +643,415 @@ with tab1:
         with col3:
             # Find best overall player (highest average score across all positions)
             role_columns = ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']
-            comprehensive_df['Overall_Avg'] = comprehensive_df[role_columns].mean(axis=1)
+            comprehensive_df = comprehensive_df.assign(Overall_Avg=comprehensive_df[role_columns].mean(axis=1))
             best_player = comprehensive_df.loc[comprehensive_df['Overall_Avg'].idxmax(), 'Name']
             st.metric("Best Overall", best_player)
         
         with col4:
             # Most versatile player (lowest standard deviation across positions)
-            comprehensive_df['Versatility'] = comprehensive_df[role_columns].std(axis=1)
+            comprehensive_df = comprehensive_df.assign(Versatility=comprehensive_df[role_columns].std(axis=1))
             most_versatile = comprehensive_df.loc[comprehensive_df['Versatility'].idxmin(), 'Name']
             st.metric("Most Versatile", most_versatile)
         
         st.markdown("---")
     
-    # Create a styled dataframe with colors that's sortable
-    def get_score_color(val, role):
-        """Get color for score based on role thresholds"""
-        if pd.isna(val) or val == 0:
-            return '#666666'
-        
-        if role == "GK":
-            if val >= 1600: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1550: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1400: return '#ffffff'             # WHITE
-            elif val >= 1300: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 1200: return 'rgb(255, 150, 0)'    # VIBRANT ORANGE
-            elif val >= 1100: return 'rgb(255, 0, 0)'      # VIBRANT RED
-            else: return ''                                # BLACK (1000 and below)
-        elif role == "DL/DR":
-            if val >= 1300: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1250: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1100: return '#ffffff'             # WHITE
-            elif val >= 1000: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 900: return 'rgb(255, 150, 0)'     # VIBRANT ORANGE
-            elif val >= 800: return 'rgb(255, 0, 0)'       # VIBRANT RED
-            else: return ''                                # BLACK (700 and below)
-        elif role == "CB":
-            if val >= 1500: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1450: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1300: return '#ffffff'             # WHITE
-            elif val >= 1200: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 1100: return 'rgb(255, 150, 0)'    # VIBRANT ORANGE
-            elif val >= 1000: return 'rgb(255, 0, 0)'      # VIBRANT RED
-            else: return ''                                # BLACK (900 and below)
-        elif role == "DM":
-            if val >= 1400: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1350: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1200: return '#ffffff'             # WHITE
-            elif val >= 1100: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 1000: return 'rgb(255, 150, 0)'    # VIBRANT ORANGE
-            elif val >= 900: return 'rgb(255, 0, 0)'       # VIBRANT RED
-            else: return ''                                # BLACK (800 and below)
-        elif role in ["AML/AMR", "AMC"]:
-            if val >= 1500: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1450: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1300: return '#ffffff'             # WHITE
-            elif val >= 1200: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 1100: return 'rgb(255, 150, 0)'    # VIBRANT ORANGE
-            elif val >= 1000: return 'rgb(255, 0, 0)'      # VIBRANT RED
-            else: return ''                                # BLACK (900 and below)
-        elif role == "ST":
-            if val >= 1700: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1650: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1450: return '#ffffff'             # WHITE
-            elif val >= 1300: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 1200: return 'rgb(255, 150, 0)'    # VIBRANT ORANGE
-            elif val >= 1100: return 'rgb(255, 0, 0)'      # VIBRANT RED
-            else: return ''                                # BLACK (1000 and below)
-        else:  # WBL/WBR, ML/MR, CM (use DL/DR thresholds)
-            if val >= 1300: return 'rgb(0, 255, 255)'      # BLUE
-            elif val >= 1250: return 'rgb(0, 255, 0)'      # VIBRANT GREEN
-            elif val >= 1100: return '#ffffff'             # WHITE
-            elif val >= 1000: return 'rgb(255, 255, 0)'    # VIBRANT YELLOW
-            elif val >= 900: return 'rgb(255, 150, 0)'     # VIBRANT ORANGE
-            elif val >= 800: return 'rgb(255, 0, 0)'       # VIBRANT RED
-            else: return ''                                # BLACK (700 and below)
-    
-    # Create styled dataframe with colors that's sortable
-    # Only apply colors to positions with specified thresholds
-    role_columns = ['GK', 'DL/DR', 'CB', 'DM', 'AML/AMR', 'AMC', 'ST']
-    
-    # Positions that should show empty cells for low scores
-    empty_cell_columns = ['WBL/WBR', 'ML/MR', 'CM']
-    
-    # Create a styled dataframe using pandas styling
-    def style_scores(val, role):
-        if role in role_columns and pd.notna(val) and val != 0:
-            color = get_score_color(val, role)
-            if color == '':  # Empty string means don't display the value
-                return 'color: transparent; font-weight: bold;'
-            else:
-                return f'color: {color}; font-weight: bold;'
-        elif role in empty_cell_columns and pd.notna(val) and val != 0:
-            # Check thresholds for empty cells
-            if role in ['WBL/WBR', 'ML/MR'] and val < 700:
-                return 'color: transparent; font-weight: bold;'  # Empty for WBL/WBR, ML/MR below 700
-            elif role == 'CM' and val < 800:
-                return 'color: transparent; font-weight: bold;'  # Empty for CM below 800
-        return ''
-    
-    # Create a copy of the dataframe and modify values for display
-    display_df = comprehensive_df.copy()
-    
-    # Apply empty cell logic to WBL/WBR, ML/MR, CM
-    for col in empty_cell_columns:
-        if col in display_df.columns:
-            if col in ['WBL/WBR', 'ML/MR']:
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 700 else x)
-            elif col == 'CM':
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 800 else x)
-    
-    # Apply empty cell logic to colored columns (very poor scores - BLACK zone)
-    for col in role_columns:
-        if col in display_df.columns:
-            if col == "GK":
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 1000 else x)  # 1000 and below = BLACK
-            elif col == "DL/DR":
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 700 else x)   # 700 and below = BLACK
-            elif col == "CB":
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 900 else x)   # 900 and below = BLACK
-            elif col == "DM":
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 800 else x)   # 800 and below = BLACK
-            elif col in ["AML/AMR", "AMC"]:
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 900 else x)   # 900 and below = BLACK
-            elif col == "ST":
-                display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and x < 1000 else x)  # 1000 and below = BLACK
-    
-    # First, handle empty cells for black zone scores and non-colored positions
-    display_df = comprehensive_df.copy()
-    
-    # Handle WBL/WBR and ML/MR (empty if below 700)
-    for col in ['WBL/WBR', 'ML/MR']:
-        if col in display_df.columns:
-            display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and float(x) < 700 else x)
-    
-    # Handle CM (empty if below 800)
-    if 'CM' in display_df.columns:
-        display_df['CM'] = display_df['CM'].apply(lambda x: '' if pd.notna(x) and float(x) < 800 else x)
-    
-    # Handle colored positions with black zones (everything under red threshold)
-    black_zone_thresholds = {
-        'GK': 1100,      # Hide < 1100 (under red)
-        'DL/DR': 800,    # Hide < 800 (under red)
-        'CB': 1000,      # Hide < 1000 (under red)
-        'DM': 900,       # Hide < 900 (under red)
-        'AML/AMR': 1000, # Hide < 1000 (under red)
-        'AMC': 1000,     # Hide < 1000 (under red)
-        'ST': 1100       # Hide < 1100 (under red)
-    }
-    
-    for col, threshold in black_zone_thresholds.items():
-        if col in display_df.columns:
-            display_df[col] = display_df[col].apply(lambda x: '' if pd.notna(x) and float(x) < threshold else x)
-    
-    # Create the style function for colors
-    def style_df(df):
-        def color_score(val, col):
-            try:
-                if pd.isna(val) or val == '' or val == 0:
-                    return ''
-                
-                val_float = float(val)
-                
-                # Color coding for each position
-                if col == 'GK':
-                    if val_float >= 1600: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1550: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1400: return 'color: white'               # WHITE
-                    elif val_float >= 1300: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 1200: return 'color: rgb(255, 150, 0)'    # VIBRANT ORANGE
-                    elif val_float >= 1100: return 'color: rgb(255, 0, 0)'      # VIBRANT RED
-                    else: return ''                                             # Hide < 1100 (under red)
-                elif col == 'DL/DR':
-                    if val_float >= 1300: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1250: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1100: return 'color: white'               # WHITE
-                    elif val_float >= 1000: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 900: return 'color: rgb(255, 150, 0)'     # VIBRANT ORANGE
-                    elif val_float >= 800: return 'color: rgb(255, 0, 0)'       # VIBRANT RED
-                    else: return ''                                             # Hide < 800 (under red)
-                elif col == 'CB':
-                    if val_float >= 1500: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1450: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1300: return 'color: white'               # WHITE
-                    elif val_float >= 1200: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 1100: return 'color: rgb(255, 150, 0)'    # VIBRANT ORANGE
-                    elif val_float >= 1000: return 'color: rgb(255, 0, 0)'      # VIBRANT RED
-                    else: return ''                                             # Hide < 1000 (under red)
-                elif col == 'DM':
-                    if val_float >= 1400: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1350: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1200: return 'color: white'               # WHITE
-                    elif val_float >= 1100: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 1000: return 'color: rgb(255, 150, 0)'    # VIBRANT ORANGE
-                    elif val_float >= 900: return 'color: rgb(255, 0, 0)'       # VIBRANT RED
-                    else: return ''                                             # Hide < 900 (under red)
-                elif col in ['AML/AMR', 'AMC']:
-                    if val_float >= 1500: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1450: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1300: return 'color: white'               # WHITE
-                    elif val_float >= 1200: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 1100: return 'color: rgb(255, 150, 0)'    # VIBRANT ORANGE
-                    elif val_float >= 1000: return 'color: rgb(255, 0, 0)'      # VIBRANT RED
-                    else: return ''                                             # Hide < 1000 (under red)
-                elif col == 'ST':
-                    if val_float >= 1700: return 'color: rgb(0, 255, 255)'      # BLUE
-                    elif val_float >= 1650: return 'color: rgb(0, 255, 0)'      # VIBRANT GREEN
-                    elif val_float >= 1450: return 'color: white'               # WHITE
-                    elif val_float >= 1300: return 'color: rgb(255, 255, 0)'    # VIBRANT YELLOW
-                    elif val_float >= 1200: return 'color: rgb(255, 150, 0)'    # VIBRANT ORANGE
-                    elif val_float >= 1100: return 'color: rgb(255, 0, 0)'      # VIBRANT RED
-                    else: return ''                                             # Hide < 1100 (under red)
-            except (ValueError, TypeError):
-                return ''
-            return ''
-        
-        # Create a style DataFrame with the same shape as our data
-        styles = pd.DataFrame('', index=df.index, columns=df.columns)
-        
-        # Apply colors only to specified columns
-        for col in df.columns:
-            if col in black_zone_thresholds:
-                styles[col] = df[col].apply(lambda x: color_score(x, col))
-        
-        return styles
-    
-    # Optimize table display for performance while keeping functionality
-    @st.cache_data(ttl=300)  # Cache data processing
-    def prepare_table_data(df, numeric_columns):
-        """Process table data with caching for better performance"""
-        # Create a copy for processing
-        processed_df = df.copy()
-        
-        # Process all numeric columns at once using vectorized operations
-        for col in numeric_columns:
-            if col in processed_df.columns:
-                # Convert to numeric and handle empty cells
-                processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce')
-                
-                # Apply thresholds for empty cells
-                if col in ['WBL/WBR', 'ML/MR']:
-                    mask = processed_df[col] < 700
-                    processed_df.loc[mask, col] = ''
-                elif col == 'CM':
-                    mask = processed_df[col] < 800
-                    processed_df.loc[mask, col] = ''
-                elif col == 'GK':
-                    mask = processed_df[col] < 1100
-                    processed_df.loc[mask, col] = ''
-                elif col == 'DL/DR':
-                    mask = processed_df[col] < 800
-                    processed_df.loc[mask, col] = ''
-                elif col == 'CB':
-                    mask = processed_df[col] < 1000
-                    processed_df.loc[mask, col] = ''
-                elif col == 'DM':
-                    mask = processed_df[col] < 900
-                    processed_df.loc[mask, col] = ''
-                elif col in ['AML/AMR', 'AMC']:
-                    mask = processed_df[col] < 1000
-                    processed_df.loc[mask, col] = ''
-                elif col == 'ST':
-                    mask = processed_df[col] < 1100
-                    processed_df.loc[mask, col] = ''
-                
-                # Format remaining values as integers
-                processed_df[col] = processed_df[col].apply(lambda x: f"{int(x)}" if pd.notna(x) and x != '' else '')
-        
-        return processed_df
-
-    @st.cache_data(ttl=300)  # Cache styling
-    def apply_table_styling(df, numeric_columns):
+    @cached("styling", ttl=300)  # Cache styling
+    def apply_table_styling(table_key, _df, numeric_columns, _role_thresholds):
         """Apply styling with caching for better performance"""
-        styles = pd.DataFrame('', index=df.index, columns=df.columns)
-        
-        for col in numeric_columns:
-            if col in df.columns:
-                if col == 'GK':
-                    styles[col] = df[col].apply(lambda x: _get_gk_style(x) if x != '' else '')
-                elif col == 'DL/DR':
-                    styles[col] = df[col].apply(lambda x: _get_dldr_style(x) if x != '' else '')
-                elif col == 'CB':
-                    styles[col] = df[col].apply(lambda x: _get_cb_style(x) if x != '' else '')
-                elif col == 'DM':
-                    styles[col] = df[col].apply(lambda x: _get_dm_style(x) if x != '' else '')
-                elif col in ['AML/AMR', 'AMC']:
-                    styles[col] = df[col].apply(lambda x: _get_am_style(x) if x != '' else '')
-                elif col == 'ST':
-                    styles[col] = df[col].apply(lambda x: _get_st_style(x) if x != '' else '')
-        
-        return styles
+        return table_styles(_df, numeric_columns, _role_thresholds)
+
+    colour_mode = "adaptive" if st.session_state.user_preferences['adaptive_colours'] else "fixed"
+    if colour_mode == "adaptive":
+        with rerun_trace.stage("adaptive thresholds", rows=len(finished_files)):
+            role_thresholds, empty_cell_floors = dataset_thresholds(current_file_hash, finished_files)
+        st.caption(
+            "Adaptive colours: tiers start at the "
+            + "/".join(f"{q * 100:g}" for q in ADAPTIVE_TIER_QUANTILES)
+            + "th percentiles of the uploaded players' scores"
+        )
+    else:
+        role_thresholds, empty_cell_floors = styling.ROLE_THRESHOLDS, styling.EMPTY_CELL_FLOORS
 
-    # Color interpolation helper
-    def _interpolate_color(val, thresholds):
-        """Interpolate between color thresholds"""
-        if val >= thresholds[0][0]:  # Above highest threshold
-            return thresholds[0][1]
-        
-        if val < thresholds[-1][0]:  # Below lowest threshold
-            return ''  # Empty for black zone
-        
-        # Find the two thresholds we're between
-        for i in range(len(thresholds) - 1):
-            high_val, high_color = thresholds[i]
-            low_val, low_color = thresholds[i + 1]
-            
-            if low_val <= val < high_val:
-                # Calculate how far we are between thresholds (0.0 to 1.0)
-                ratio = (val - low_val) / (high_val - low_val)
-                
-                # Parse colors
-                h1 = [int(high_color[0]), int(high_color[1]), int(high_color[2])]
-                h2 = [int(low_color[0]), int(low_color[1]), int(low_color[2])]
-                
-                # Interpolate each RGB component
-                r = int(h2[0] + (h1[0] - h2[0]) * ratio)
-                g = int(h2[1] + (h1[1] - h2[1]) * ratio)
-                b = int(h2[2] + (h1[2] - h2[2]) * ratio)
-                
-                return (r, g, b)
-        
-        return thresholds[-1][1]  # Fallback to lowest threshold color
-
-    # Define color thresholds for each position (RGB tuples)
-    BLUE = (0, 255, 255)
-    GREEN = (0, 255, 0)
-    WHITE = (255, 255, 255)
-    YELLOW = (255, 255, 0)
-    ORANGE = (255, 150, 0)
-    RED = (255, 0, 0)
-
-    GK_THRESHOLDS = [
-        (1600, BLUE), (1550, GREEN), (1400, WHITE),
-        (1300, YELLOW), (1200, ORANGE), (1100, RED)
-    ]
-
-    DLDR_THRESHOLDS = [
-        (1300, BLUE), (1250, GREEN), (1100, WHITE),
-        (1000, YELLOW), (900, ORANGE), (800, RED)
-    ]
-
-    CB_THRESHOLDS = [
-        (1500, BLUE), (1450, GREEN), (1300, WHITE),
-        (1200, YELLOW), (1100, ORANGE), (1000, RED)
-    ]
-
-    DM_THRESHOLDS = [
-        (1400, BLUE), (1350, GREEN), (1200, WHITE),
-        (1100, YELLOW), (1000, ORANGE), (900, RED)
-    ]
-
-    AM_THRESHOLDS = [
-        (1500, BLUE), (1450, GREEN), (1300, WHITE),
-        (1200, YELLOW), (1100, ORANGE), (1000, RED)
-    ]
-
-    ST_THRESHOLDS = [
-        (1700, BLUE), (1650, GREEN), (1450, WHITE),
-        (1300, YELLOW), (1200, ORANGE), (1100, RED)
-    ]
-
-    # Helper functions for color styles with interpolation
-    def _get_gk_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, GK_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    def _get_dldr_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, DLDR_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    def _get_cb_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, CB_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    def _get_dm_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, DM_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    def _get_am_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, AM_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    def _get_st_style(x):
-        try:
-            val = float(x)
-            color = _interpolate_color(val, ST_THRESHOLDS)
-            if color:
-                return f'color: rgb{color}; font-weight: bold'
-        except (ValueError, TypeError):
-            pass
-        return ''
-
-    # Process and display the table
-    numeric_columns = ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']
-    
-    # Create a copy for sorting (keep numeric values)
-    sort_df = display_df.copy()
-    
-    # Convert to numeric for proper sorting
-    for col in numeric_columns:
-        if col in sort_df.columns:
-            sort_df[col] = pd.to_numeric(sort_df[col], errors='coerce')
-    
-    # Create display version with formatted numbers
-    display_df = sort_df.copy()
-    for col in numeric_columns:
-        if col in display_df.columns:
-            display_df[col] = display_df[col].apply(lambda x: f"{int(x)}" if pd.notna(x) and x != '' else '')
-    
-    # Apply styling with caching
-    styles = apply_table_styling(display_df, numeric_columns)
+    # Process and display the table: blank out black-zone scores, keep a numeric copy for sorting
+    with rerun_trace.stage("table display") as span:
+        sort_df, display_df = build_display_table(comprehensive_df, role_thresholds, empty_cell_floors)
+        span.output(display_df)
+
+    # Apply styling with caching, keyed by the upload fingerprint, colour mode and the displayed columns
+    table_key = f"{current_file_hash}:{colour_mode}:{','.join(display_df.columns)}"
+    with rerun_trace.stage("styling") as span:
+        styles = span.output(apply_table_styling(table_key, display_df, NUMERIC_COLUMNS, role_thresholds))
     
+    # Tier code per player and role, computed once per dataset and colour mode
+    with rerun_trace.stage("tier codes") as span:
+        codes = span.output(role_tier_codes(f"{current_file_hash}:{colour_mode}", role_score_matrix, role_thresholds, empty_cell_floors))
+
+    with st.expander("Tier Filter"):
+        use_tier_filter = st.checkbox("Only show players at these tiers", value=False)
+        tier_col, count_col, roles_col = st.columns([1, 1, 2])
+        with tier_col:
+            best_tier = st.selectbox("At least", TIER_NAMES[:-1], index=TIER_NAMES.index('green'), help="Tier colour a score must reach")
+        with count_col:
+            min_roles = st.number_input("At how many roles", min_value=1, max_value=len(ROLES), value=1, step=1)
+        with roles_col:
+            tier_roles = st.multiselect("Roles", ROLES, default=ROLES)
+        tier_mask = tier_filter(codes, TIER_NAMES.index(best_tier), int(min_roles), [ROLES.index(r) for r in tier_roles])
+        st.caption(f"{int(tier_mask.sum())} of {len(tier_mask)} players are {best_tier} or better at {int(min_roles)}+ of the selected roles")
+        st.dataframe(tier_counts(codes, ROLES).T, use_container_width=True)
+
+    if use_tier_filter:
+        sort_df, styles = sort_df[tier_mask], styles[tier_mask]
+
     # Create final styled dataframe using the numeric dataframe for sorting
     styled_df = sort_df.style.apply(lambda _: styles, axis=None).format(precision=0, na_rep='')
     
     # Display with optimized settings and proper sorting
-    st.dataframe(
-        styled_df,
-        use_container_width=True,
-        height=400,
-        hide_index=True
-    )
+    with rerun_trace.stage("render: table", rows=len(sort_df)):
+        table_event = st.dataframe(
+            styled_df,
+            use_container_width=True,
+            height=400,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key="full_table"
+        )
+
+    # Score breakdown for the clicked player, computed from their row of the attribute matrix only
+    selected_rows = table_event.selection.rows if table_event is not None else []
+    if selected_rows and selected_rows[0] < len(sort_df):
+        breakdown_row = int(sort_df.index[selected_rows[0]])
+        st.markdown(f"### Why {df_final['Name'].iat[breakdown_row]} scores what they do")
+        breakdown_role = st.selectbox(
+            "Role", ROLES, index=int(np.argmax(role_score_matrix[breakdown_row])), key="breakdown_role"
+        )
+        with rerun_trace.stage("score breakdown"):
+            breakdown = attribute_contributions(
+                attrs_matrix, score_data["weights"], top_k_index, available_attrs, breakdown_row, breakdown_role
+            )
+        st.caption(
+            f"{breakdown_role} score {int(round(breakdown['Contribution'].sum()))} "
+            f"vs {int(round(breakdown['Top Avg'].sum()))} for the role's top {breakdown.attrs['reference_players']} average; "
+            "bars are weight x attribute value, ticks the top players' average"
+        )
+        # Rows come sorted by contribution, so both layers keep the frame's order
+        bars = alt.Chart(breakdown).mark_bar().encode(
+            x=alt.X('Contribution:Q', title='Weight x value'),
+            y=alt.Y('Attribute:N', sort=None, title=None),
+            color=alt.condition(alt.datum.Difference >= 0, alt.value('#00d4aa'), alt.value('#ff6b6b')),
+            tooltip=['Attribute', 'Value', 'Weight', 'Contribution', alt.Tooltip('Top Avg:Q', format='.1f'), alt.Tooltip('Difference:Q', format='.1f')]
+        )
+        ticks = alt.Chart(breakdown).mark_tick(color='white', thickness=2).encode(
+            x='Top Avg:Q',
+            y=alt.Y('Attribute:N', sort=None)
+        )
+        st.altair_chart((bars + ticks).properties(height=max(200, 22 * len(breakdown))), use_container_width=True)
+    else:
+        st.caption("Click a row to see how each attribute adds up to that player's score")
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def weight_sensitivity(sensitivity_key, _attrs_matrix, role, n_samples, noise):
+    """Rank intervals and weight importance for one role under perturbed weights"""
+    weights = np.array([float(WEIGHTS_BY_ROLE[role].get(a, 0.0)) for a in available_attrs])
+    return sensitivity.weight_sensitivity(_attrs_matrix, weights, n_samples, noise)
+
+with tab1:
+    # Weight sensitivity: how much of the ranking is down to the exact weights chosen
+    st.markdown("### Ranking Sensitivity")
+    show_sensitivity = st.checkbox("Perturb the role weights", value=False, help="Re-rank with thousands of randomly perturbed weight vectors")
+    if show_sensitivity:
+        sens_col1, sens_col2, sens_col3 = st.columns(3)
+        with sens_col1:
+            sensitivity_role = st.selectbox("Role", ROLES, key="sensitivity_role")
+        with sens_col2:
+            n_weight_samples = st.number_input("Samples", min_value=100, max_value=10000, value=2000, step=500)
+        with sens_col3:
+            weight_noise = st.slider("Weight noise (%)", min_value=5, max_value=50, value=20, step=5, help="Typical relative change of each weight")
+
+        sensitivity_key = f"{current_file_hash}:{sensitivity_role}:{int(n_weight_samples)}:{weight_noise}"
+        with rerun_trace.stage("weight sensitivity", rows=len(df_final)):
+            sens = weight_sensitivity(sensitivity_key, attrs_matrix, sensitivity_role, int(n_weight_samples), weight_noise / 100)
+
+        window = sens["window"]
+        tracked = sens["tracked"]
+        rank_label = lambda r: f">{window}" if r > window else str(int(r))
+        st.caption(
+            f"On average {sens['overlap'].mean():.1f} of the top 20 stay in the top 20; "
+            f"{len(sens['entrants'])} other players break into it in at least one sample"
+        )
+        intervals_col, importance_col = st.columns([3, 2])
+        with intervals_col:
+            st.dataframe(pd.DataFrame({
+                'Rank': np.arange(1, len(tracked) + 1),
+                'Name': df_final['Name'].to_numpy()[tracked],
+                'Rank Range (5-95%)': [f"{rank_label(lo)}-{rank_label(hi)}" for lo, hi in zip(sens['rank_low'], sens['rank_high'])],
+                'Median Rank': [rank_label(r) for r in sens['rank_median']],
+                'Top 20 (%)': np.round(sens['top_share'] * 100, 1),
+            }), use_container_width=True, hide_index=True, height=400)
+        with importance_col:
+            weighted = ~np.isnan(sens['importance'])
+            st.dataframe(pd.DataFrame({
+                'Attribute': np.asarray(available_attrs)[weighted],
+                'Weight': [WEIGHTS_BY_ROLE[sensitivity_role].get(a, 0.0) for a in np.asarray(available_attrs)[weighted]],
+                'Top 20 Influence': np.round(sens['importance'][weighted], 3),
+            }).sort_values('Top 20 Influence', ascending=False), use_container_width=True, hide_index=True, height=400)
+        if len(sens['entrants']):
+            st.markdown("**Outside the top 20, but reaching it under some weights**")
+            st.dataframe(pd.DataFrame({
+                'Name': df_final['Name'].to_numpy()[sens['entrants'][:20]],
+                'Rank': sens['entrant_base_rank'][:20],
+                'Top 20 (%)': np.round(sens['entrant_share'][:20] * 100, 1),
+            }), use_container_width=True, hide_index=True)
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def eligible_role_scores(team_key, _role_score_matrix, _top_k_index, _position_masks, mode, bonus, leave_out_flagged):
+    """Role scores and top-k index with the position eligibility settings applied"""
+    unavailable = unavailable_mask(df_final) if leave_out_flagged else None
+    adjusted = apply_position_eligibility(_role_score_matrix, _position_masks, mode, bonus, unavailable)
+    # Masked players drop out of the rebuilt index, so the pruned solves get smaller too
+    return {"role_scores": adjusted, "top_k": build_top_k_index(adjusted, _top_k_index.shape[1])}
 
 with tab2:
     st.markdown("## Automatic Teambuilder")
     st.markdown("""
     <div class="info-box">
         <strong>Formation Analysis:</strong><br>
-        Hungarian algorithm used to create the best starting 11, it also creates a secondary team with 0 overlap in players from the first team. Some ridiculous options occur like a DM being recommended as a ST but it should theoretically be true as long as their hidden attributes aren't terrible.
+        Hungarian algorithm used to create the best starting 11, it also creates a secondary team with 0 overlap in players from the first team. Some ridiculous options occur like a DM being recommended as a ST but it should theoretically be true as long as their hidden attributes aren't terrible. Use Position Eligibility below to favour or require each player's listed positions.
     </div>
     """, unsafe_allow_html=True)
     
     st.session_state.use_custom_teams = False
 
+    # Listed positions (Position column) and availability flags (Inf column) applied before every solve
+    with st.expander("Position Eligibility"):
+        mode_col, bonus_col = st.columns(2)
+        with mode_col:
+            eligibility_mode = st.radio(
+                "Listed positions",
+                ELIGIBILITY_MODES,
+                horizontal=True,
+                help="Bonus: boost scores at the positions in each player's Position string. Strict: only use players at their listed positions."
+            )
+        with bonus_col:
+            natural_bonus = st.slider("Bonus at listed positions (%)", min_value=0, max_value=25, value=5, disabled=eligibility_mode != "Bonus")
+        leave_out_flagged = st.checkbox("Leave out injured, banned and suspended players (Inf column)", value=False)
+    if eligibility_mode != "Bonus":
+        natural_bonus = 0
+    # Upload fingerprint + eligibility settings, the key for everything solved below
+    team_key = f"{current_file_hash}:{eligibility_mode}:{natural_bonus}:{int(leave_out_flagged)}"
+    # Adjusted scores only steer the picks; every score and total shown is the raw role score
+    eligibility_adjusted = eligibility_mode != "Ignore" or leave_out_flagged
+    if eligibility_adjusted:
+        team_scores = eligible_role_scores(
+            team_key, role_score_matrix, top_k_index, position_masks, eligibility_mode, natural_bonus / 100, leave_out_flagged
+        )
+    else:
+        # The leased arrays as they are: a cache entry holding them would outlive the lease
+        team_scores = {"role_scores": role_score_matrix, "top_k": top_k_index}
+    team_role_matrix = team_scores["role_scores"]
+    team_top_k = team_scores["top_k"]
+
+    def raw_xi_total(chosen, formation_name):
+        """Raw role-score total of an XI given as {slot: player}"""
+        columns = formation_role_columns(formation_name)
+        return float(sum(role_score_matrix[p, columns[slot]] for slot, p in chosen.items()))
+
+    @cached("assignment", ttl=1800)  # Cache for 30 minutes
+    def rank_formations(upload_key, _role_score_matrix, _top_k_index):
+        """Solve the first XI for every formation in parallel and rank by XI total"""
+        names = list(FORMATIONS)
+        matrices = [_role_score_matrix[:, formation_role_columns(name)] for name in names]
+        ranked = [_top_k_index[formation_role_columns(name)] for name in names]
+        results = solve_batch(matrices, ranked)
+        ranking = [(name, total, chosen) for name, (total, chosen) in zip(names, results)]
+        return sorted(ranking, key=lambda r: r[1], reverse=True)
+
+    formation_col, best_col = st.columns([2, 1])
+    with best_col:
+        best_formation_mode = st.checkbox(
+            "Best formation",
+            value=False,
+            help="Solve every formation and use the one with the highest First XI total"
+        )
+
+    if best_formation_mode:
+        with rerun_trace.stage("assignment: formations"):
+            formation_ranking = rank_formations(team_key, team_role_matrix, team_top_k)
+        selected_formation = formation_ranking[0][0]
+        with formation_col:
+            st.selectbox("Formation", [selected_formation], disabled=True)
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    (name, int(round(raw_xi_total(chosen, name))), int(round(raw_xi_total(chosen, name) / max(len(chosen), 1))))
+                    for name, total, chosen in formation_ranking
+                ],
+                columns=['Formation', 'XI Total', 'Average']
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        with formation_col:
+            selected_formation = st.selectbox(
+                "Formation",
+                list(FORMATIONS),
+                index=list(FORMATIONS).index(DEFAULT_FORMATION)
+            )
+
+    # Transfer planning constraints (budget / average age) for the automatic XIs
+    with st.expander("Transfer Planning Constraints"):
+        budget_col, age_col = st.columns(2)
+        with budget_col:
+            use_budget = st.checkbox("Limit total transfer value", value=False)
+            max_budget_m = st.number_input("Max total transfer value (€M)", min_value=0.0, value=100.0, step=5.0, disabled=not use_budget)
+        with age_col:
+            use_age_cap = st.checkbox("Limit average age", value=False)
+            max_avg_age = st.number_input("Max average age", min_value=15.0, max_value=45.0, value=24.0, step=0.5, disabled=not use_age_cap)
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def compute_score_matrix(score_key, _role_score_matrix, formation_name):
+    """Score matrix for team building, sliced from the shared role score matrix"""
+    return pipeline.compute_score_matrix(_role_score_matrix, formation_name)
+
+# Compute score matrix: eligibility-adjusted scores pick the XIs, raw role scores are what gets shown and totalled
+score_matrix = compute_score_matrix(team_key, team_role_matrix, selected_formation)
+display_score_matrix = compute_score_matrix(current_file_hash, role_score_matrix, selected_formation)
+score_matrix_ranked = team_top_k[formation_role_columns(selected_formation)]
+
+# Cheap cache key for the score matrix: upload fingerprint + eligibility settings + formation
+score_matrix_key = f"{team_key}:{selected_formation}"
+
 with tab3:
     st.markdown("## Custom Teambuilder")
     st.markdown("""
     <div class="info-box">
         <strong>Custom Team Builder:</strong><br>
-        Build your teams manually by selecting players for each position. Use the dropdowns to assign players to positions.
+        Build your teams manually by selecting players for each position. Picking a player locks that slot, excluded players are never used, and every slot left on Auto is filled optimally around your choices.
     </div>
     """, unsafe_allow_html=True)
     
     st.session_state.use_custom_teams = True
     
-    # Formation positions
-    formation_positions = [
-        ("GK", "GK"),
-        ("RB", "DL/DR"), ("CB1", "CB"), ("CB2", "CB"), ("LB", "DL/DR"),
-        ("DM1", "DM"), ("DM2", "DM"),
-        ("AMR", "AML/AMR"), ("AMC", "AMC"), ("AML", "AML/AMR"),
-        ("ST", "ST")
-    ]
+    # Formation positions (unique slot labels like CB1/CB2 for the widget keys)
+    custom_positions = list(zip(
+        formation_slot_keys(selected_formation),
+        [role for _, role in formation_positions(selected_formation)]
+    ))
+    
+    # Top 20 rows per role; widgets carry player IDs and labels are looked up by row
+    top_rows_by_role = {
+        role: comprehensive_df[role].nlargest(20).index.to_numpy()
+        for role in dict.fromkeys(role for _, role in custom_positions)
+    }
+    
+    # Players offered for exclusion: the top 20 at any of the formation's roles
+    exclude_options = list(dict.fromkeys(
+        int(player_ids[row]) for rows in top_rows_by_role.values() for row in rows
+    ))
+    
+    def resolve_player(player_id):
+        """df_final row for a player ID, or None if it is not in the current data"""
+        if player_id is None or not 0 <= player_id < len(id_to_row) or id_to_row[player_id] < 0:
+            return None
+        return int(id_to_row[player_id])
+    
+    def player_label(player_id, role=None):
+        """Dropdown label for a player ID, with the role score when given"""
+        row = resolve_player(player_id)
+        if row is None:
+            return "Auto"
+        name = comprehensive_df.at[row, 'Name']
+        return f"{name} ({int(comprehensive_df.at[row, role])})" if role else name
+    
+    def custom_xi_controls(side):
+        """Slot lock dropdowns and player exclusions for one team, returns (locks, excluded IDs)"""
+        excluded_ids = st.multiselect(
+            "Exclude players",
+            exclude_options,
+            format_func=player_label,
+            key=f"{side}_excluded",
+            help="Excluded players are never auto-filled into this XI"
+        )
+        selections = {}
+        for pos_label, role in custom_positions:
+            # Dropdown of player IDs for this role (top 20 by score); Auto slots are filled optimally
+            player_options = [None] + [int(player_ids[row]) for row in top_rows_by_role[role]]
+            selected = st.selectbox(
+                f"{pos_label} ({role})",
+                player_options,
+                format_func=lambda player_id, role=role: player_label(player_id, role),
+                key=f"{side}_{pos_label}"
+            )
+            
+            if selected is not None:
+                selections[pos_label] = selected
+        return selections, excluded_ids
+    
+    def fill_custom_xi(side, selections, excluded_ids, extra_excluded=()):
+        """Lock the picked slots and fill the rest, warm-started from this side's last solve"""
+        locked = {}
+        for i, (pos_label, _) in enumerate(custom_positions):
+            if pos_label in selections:
+                player_idx = resolve_player(selections[pos_label])
+                if player_idx is not None and player_idx not in locked.values():
+                    locked[i] = player_idx
+        excluded = set(extra_excluded)
+        excluded.update(idx for idx in map(resolve_player, excluded_ids) if idx is not None)
+        
+        # One state per side, dropped when the score matrix changes (formation, eligibility or upload)
+        matrix_key, warm = st.session_state.xi_warm_state.get(side, (None, None))
+        chosen, warm = reoptimize_xi(
+            score_matrix, locked, excluded, score_matrix_ranked,
+            warm if matrix_key == score_matrix_key else None
+        )
+        st.session_state.xi_warm_state[side] = (score_matrix_key, warm)
+        return chosen, locked
+    
+    def custom_xi_summary(chosen, locked):
+        """Summary table of a custom XI, marking locked and auto-filled slots"""
+        return pd.DataFrame([
+            (pos_label,
+             comprehensive_df.at[chosen[i], 'Name'] if i in chosen else "---",
+             int(round(display_score_matrix[chosen[i], i])) if i in chosen else 0,
+             "Locked" if i in locked else "Auto")
+            for i, (pos_label, _) in enumerate(custom_positions)
+        ], columns=['Position', 'Player', 'Score', 'Status'])
     
     # Create two columns for the two teams
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### First XI")
-        first_xi_selections = {}
-        
-        for pos_label, role in formation_positions:
-            # Get available players for this role (top 20 by score)
-            top_players = comprehensive_df.nlargest(20, role)[['Name', role]]
-            
-            # Create dropdown for player selection
-            player_options = ["Select Player"] + [f"{name} ({int(score)})" for name, score in zip(top_players['Name'], top_players[role])]
-            selected = st.selectbox(f"{pos_label} ({role})", player_options, key=f"first_{pos_label}")
-            
-            if selected != "Select Player":
-                player_name = selected.split(" (")[0]
-                first_xi_selections[pos_label] = player_name
-        
+        first_xi_selections, first_xi_excluded = custom_xi_controls("first")
         st.session_state.custom_first_xi = first_xi_selections
+        st.session_state.custom_first_excluded = first_xi_excluded
     
     with col2:
         st.markdown("### Second XI")
-        second_xi_selections = {}
-        
-        for pos_label, role in formation_positions:
-            # Get available players for this role (top 20 by score)
-            top_players = comprehensive_df.nlargest(20, role)[['Name', role]]
-            
-            # Create dropdown for player selection
-            player_options = ["Select Player"] + [f"{name} ({int(score)})" for name, score in zip(top_players['Name'], top_players[role])]
-            selected = st.selectbox(f"{pos_label} ({role})", player_options, key=f"second_{pos_label}")
-            
-            if selected != "Select Player":
-                player_name = selected.split(" (")[0]
-                second_xi_selections[pos_label] = player_name
-        
+        second_xi_selections, second_xi_excluded = custom_xi_controls("second")
         st.session_state.custom_second_xi = second_xi_selections
+        st.session_state.custom_second_excluded = second_xi_excluded
+    
+    # Fill the open slots; the Second XI never reuses First XI players
+    custom_first_choice, custom_first_locked = fill_custom_xi("first", first_xi_selections, first_xi_excluded)
+    custom_second_choice, custom_second_locked = fill_custom_xi(
+        "second", second_xi_selections, second_xi_excluded, extra_excluded=custom_first_choice.values()
+    )
     
     # Show team summaries
-    if st.session_state.custom_first_xi:
-        st.markdown("#### First XI Summary")
-        first_xi_df = pd.DataFrame(list(st.session_state.custom_first_xi.items()), columns=['Position', 'Player'])
-        st.dataframe(first_xi_df, use_container_width=True)
+    st.markdown("#### First XI Summary")
+    st.dataframe(custom_xi_summary(custom_first_choice, custom_first_locked), use_container_width=True, hide_index=True)
     
-    if st.session_state.custom_second_xi:
-        st.markdown("#### Second XI Summary")
-        second_xi_df = pd.DataFrame(list(st.session_state.custom_second_xi.items()), columns=['Position', 'Player'])
-        st.dataframe(second_xi_df, use_container_width=True)
-
-# Fixed Formation Setup
-formation_lines = [
-    ("GK", "GK"),
-    ("EMPTY", "EMPTY"),
-    ("RB", "DL/DR"),
-    ("CB", "CB"),
-    ("CB", "CB"),
-    ("LB", "DL/DR"),
-    ("EMPTY", "EMPTY"),
-    ("DM", "DM"),
-    ("DM", "DM"),
-    ("EMPTY", "EMPTY"),
-    ("AMR", "AML/AMR"),
-    ("AMC", "AMC"),
-    ("AML", "AML/AMR"),
-    ("EMPTY", "EMPTY"),
-    ("ST", "ST")
-]
+    st.markdown("#### Second XI Summary")
+    st.dataframe(custom_xi_summary(custom_second_choice, custom_second_locked), use_container_width=True, hide_index=True)
+
+# Formation Setup: registry lines with EMPTY spacers between them for rendering
+formation_lines = []
+for line in FORMATIONS[selected_formation]:
+    if formation_lines:
+        formation_lines.append(("EMPTY", "EMPTY"))
+    formation_lines.extend(line)
 
 # Filter out EMPTY positions for the actual team selection
 positions = [(label, role) for label, role in formation_lines if role != "EMPTY"]
@@ -1325,97 +1064,75 @@ player_names = df_final["Name"].astype(str).tolist()
 if n_players < n_positions:
     st.warning(f"⚠️ Only {n_players} players available, but formation requires {n_positions} positions. Some positions may be empty.")
 
-@st.cache_data(ttl=1800)  # Cache for 30 minutes
-def compute_score_matrix(df_final, available_attrs, positions):
-    """Compute the score matrix for team building"""
-    n_players = len(df_final)
-    n_positions = len(positions)
-    
-    # Precompute role weight vectors
-    role_weight_vectors = {}
-    for _, role_key in positions:
-        if role_key not in role_weight_vectors: # Avoid re-computing for same role
-            rw = WEIGHTS_BY_ROLE.get(role_key, {})
-            role_weight_vectors[role_key] = np.array([float(rw.get(a, 0.0)) for a in available_attrs], dtype=float)
-
-    # Compute score matrix
-    score_matrix = np.zeros((n_players, n_positions), dtype=float)
-    attrs_norm_final = df_final[available_attrs].fillna(0).astype(float)
-    
-    for i_idx in range(n_players):
-        player_attr_vals = attrs_norm_final.iloc[i_idx].values if len(available_attrs) > 0 else np.zeros((len(available_attrs),), dtype=float)
-        for p_idx, (_, role_key) in enumerate(positions):
-            w = role_weight_vectors[role_key]
-            score_matrix[i_idx, p_idx] = float(np.dot(player_attr_vals, w))
-    
-    return score_matrix
-
-# Compute score matrix
-score_matrix = compute_score_matrix(df_final, available_attrs, positions)
-
-# Hungarian algorithm assignment
-try:
-    from scipy.optimize import linear_sum_assignment
-except Exception:
-    linear_sum_assignment = None
-
-@st.cache_data(ttl=1800)  # Cache for 30 minutes
-def choose_starting_xi(available_player_indices, current_score_matrix):
-    avail = list(available_player_indices)
-    num_avail = len(avail)
-    num_pos = current_score_matrix.shape[1]
-
-    if num_avail == 0 or num_pos == 0:
-        return {}
-
-    # Cost matrix for assignment
-    cost_matrix = -current_score_matrix[avail, :]
-
-    if linear_sum_assignment is None or num_avail < num_pos:
-        # Greedy fallback if scipy is missing or not enough players
-        chosen = {}
-        used_players = set()
-        for p_idx in range(num_pos):
-            best_player_idx = -1
-            best_score = -1e9
-            for i_idx in avail:
-                if i_idx not in used_players:
-                    score = current_score_matrix[i_idx, p_idx]
-                    if score > best_score:
-                        best_score = score
-                        best_player_idx = i_idx
-            if best_player_idx != -1:
-                chosen[p_idx] = best_player_idx
-                used_players.add(best_player_idx)
-        return chosen
+@cached("assignment", ttl=1800)  # Cache for 30 minutes
+def choose_starting_xi(matrix_key, excluded_player_indices, _current_score_matrix, _ranked=None):
+    """Pick the best XI (Hungarian algorithm on the pruned candidates), cached on the score matrix key"""
+    _, chosen = solve_xi(_current_score_matrix, excluded_player_indices, _ranked)
+    return chosen
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def get_constraint_columns(upload_key, _df_final):
+    """Numeric transfer values and ages aligned with df_final rows (NaN where unknown or not for sale)"""
+    if 'Transfer Value' in _df_final.columns:
+        transfer_values = _df_final['Transfer Value'].apply(known_transfer_value).to_numpy(dtype=float)
+    else:
+        transfer_values = np.full(len(_df_final), np.nan)
+    if 'Age' in _df_final.columns:
+        player_ages = pd.to_numeric(_df_final['Age'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
     else:
-        row_ind, col_ind = linear_sum_assignment(cost_matrix)
-        chosen = {c: avail[r] for r, c in zip(row_ind, col_ind)}
-        return chosen
+        player_ages = np.full(len(_df_final), np.nan)
+    return transfer_values, player_ages
+
+@cached("assignment", ttl=1800)  # Cache for 30 minutes
+def choose_constrained_xi(matrix_key, constraint_key, excluded_player_indices, _current_score_matrix, _constraints):
+    """Best XI under budget / age constraints, with its optimality gap"""
+    return solve_constrained_xi(_current_score_matrix, _constraints, excluded_player_indices)
+
+@cached("assignment", ttl=1800)  # Cache for 30 minutes
+def rank_lineups(matrix_key, k, _current_score_matrix, _slot_roles):
+    """Top-k distinct lineups (ranked assignments), cached on the score matrix key"""
+    return k_best_xis(_current_score_matrix, k, _slot_roles)
+
+@cached("assignment", ttl=1800)  # Cache for 30 minutes
+def simulate_squad(matrix_key, n_scenarios, p_out, remove_flagged, _current_score_matrix, _ranked, _always_out):
+    """Availability Monte Carlo for the XI, cached on the score matrix key and settings"""
+    return simulate_availability(_current_score_matrix, _ranked, p_out, n_scenarios, _always_out)
+
+@cached("scoring", ttl=1800)  # Cache for 30 minutes
+def build_similarity_index(index_key, _attrs_matrix, role):
+    """KD-tree over the attribute vectors, weighted by a role's attribute weights (any other value: unweighted)"""
+    weights = None
+    if role in WEIGHTS_BY_ROLE:
+        weights = np.array([float(WEIGHTS_BY_ROLE[role].get(a, 0.0)) for a in available_attrs])
+    return SimilarityIndex(_attrs_matrix, weights)
+
+@cached("dedup", ttl=1800)  # Cache for 30 minutes
+def load_scouting_players(scouting_key, _files, _squad_names):
+    """Parse, merge and deduplicate the scouting uploads, dropping players already in the squad"""
+    frames = []
+    for file in _files:
+        file_key = file_fingerprint(file)
+        scouted, _ = load_upload(file_key, file)
+        if scouted is not None:
+            frames.append(merge_upload(file_key, scouted))
+    if not frames:
+        return None
+
+    scouted = deduplicate_players(scouting_key, pd.concat(frames, ignore_index=True))
+    if 'Name' in scouted.columns:
+        squad_keys = set(_squad_names.apply(create_name_key))
+        scouted = scouted[~scouted['Name'].apply(create_name_key).isin(squad_keys)].reset_index(drop=True)
+    return scouted
+
+@cached("assignment", ttl=1800)  # Cache for 30 minutes
+def rank_transfer_targets(matrix_key, scouting_key, _current_score_matrix, _ranked, _candidate_scores, _values):
+    """Marginal XI gain of every scouted player, cached on the squad and scouting keys"""
+    return marginal_gains(_current_score_matrix, _candidate_scores, _ranked, _values)
 
 def render_xi(chosen_map, team_name="Team"):
     rows = []
     position_index = 0
     
-    # Fixed formation lines
-    formation_lines = [
-        ("GK", "GK"),
-        ("EMPTY", "EMPTY"),
-        ("RB", "DL/DR"),
-        ("CB", "CB"),
-        ("CB", "CB"),
-        ("LB", "DL/DR"),
-        ("EMPTY", "EMPTY"),
-        ("DM", "DM"),
-        ("DM", "DM"),
-        ("EMPTY", "EMPTY"),
-        ("AMR", "AML/AMR"),
-        ("AMC", "AMC"),
-        ("AML", "AML/AMR"),
-        ("EMPTY", "EMPTY"),
-        ("ST", "ST")
-    ]
-    
     # Build rows including empty spaces for visual formatting
     for line_label, line_role in formation_lines:
         if line_role == "EMPTY":
@@ -1424,7 +1141,7 @@ def render_xi(chosen_map, team_name="Team"):
             if position_index in chosen_map:
                 p_idx = chosen_map[position_index]
                 name = player_names[p_idx]
-                sel_score = score_matrix[p_idx, position_index]
+                sel_score = display_score_matrix[p_idx, position_index]
                 rows.append((line_label, name, sel_score, line_role))
             else:
                 rows.append((line_label, "---", 0.0, line_role))
@@ -1534,57 +1251,367 @@ def render_xi(chosen_map, team_name="Team"):
 
 # Generate teams and display them in tabs
 with tab2:
-    st.markdown("### Meta Formation (4-2-3-1)")
+    st.markdown(f"### Formation ({selected_formation})")
     
     # Generate teams based on selection mode
-    if st.session_state.use_custom_teams and st.session_state.custom_first_xi:
-        # Use custom teams
-        first_choice = {}
-        second_choice = {}
-        
-        # Convert custom selections to team format
-        formation_positions = [
-            ("GK", "GK"),
-            ("RB", "DL/DR"), ("CB1", "CB"), ("CB2", "CB"), ("LB", "DL/DR"),
-            ("DM1", "DM"), ("DM2", "DM"),
-            ("AMR", "AML/AMR"), ("AMC", "AMC"), ("AML", "AML/AMR"),
-            ("ST", "ST")
-        ]
-        
-        # Map custom selections to team indices
-        for i, (pos_label, role) in enumerate(formation_positions):
-            if pos_label in st.session_state.custom_first_xi:
-                player_name = st.session_state.custom_first_xi[pos_label]
-                # Find player index
-                player_idx = comprehensive_df[comprehensive_df['Name'] == player_name].index
-                if len(player_idx) > 0:
-                    first_choice[i] = player_idx[0]
-            
-            if pos_label in st.session_state.custom_second_xi:
-                player_name = st.session_state.custom_second_xi[pos_label]
-                # Find player index
-                player_idx = comprehensive_df[comprehensive_df['Name'] == player_name].index
-                if len(player_idx) > 0:
-                    second_choice[i] = player_idx[0]
-    else:
-        # Use Hungarian algorithm
-        all_player_indices = list(range(n_players))
-        first_choice = choose_starting_xi(all_player_indices, score_matrix)
-        used_player_indices = set(first_choice.values())
-        remaining_players = [i for i in all_player_indices if i not in used_player_indices]
-        second_choice = choose_starting_xi(remaining_players, score_matrix)
+    custom_teams_active = any([
+        st.session_state.custom_first_xi, st.session_state.custom_second_xi,
+        st.session_state.custom_first_excluded, st.session_state.custom_second_excluded
+    ])
+    with rerun_trace.stage("assignment", rows=n_players):
+        if st.session_state.use_custom_teams and custom_teams_active:
+            # Use custom teams (locked slots plus optimal auto-fill)
+            first_choice = custom_first_choice
+            second_choice = custom_second_choice
+        else:
+            if use_budget or use_age_cap:
+                # Constrained optimizer (Lagrangian relaxation + branch-and-bound)
+                transfer_values, player_ages = get_constraint_columns(current_file_hash, df_final)
+                constraints = []
+                constraint_key = []
+                unchecked = np.zeros(len(df_final), dtype=bool)
+                if use_budget:
+                    # Players not for sale or without a known value can't be priced, so they are left out
+                    constraints.append((np.nan_to_num(transfer_values), max_budget_m * 1_000_000.0))
+                    constraint_key.append(f"value<={max_budget_m}")
+                    unchecked |= np.isnan(transfer_values)
+                if use_age_cap:
+                    # Average age <= A over a full XI is total age <= A * slots; unknown ages can't be checked
+                    constraints.append((np.nan_to_num(player_ages), max_avg_age * n_positions))
+                    constraint_key.append(f"age<={max_avg_age}")
+                    unchecked |= np.isnan(player_ages)
+                excluded_player_indices = tuple(np.flatnonzero(unchecked).tolist())
+                constraint_key = ",".join(constraint_key)
+
+                first_result = choose_constrained_xi(score_matrix_key, constraint_key, excluded_player_indices, score_matrix, constraints)
+                used_player_indices = tuple(sorted(set(excluded_player_indices) | set(first_result["chosen"].values())))
+                second_result = choose_constrained_xi(score_matrix_key, constraint_key, used_player_indices, score_matrix, constraints)
+                first_choice = first_result["chosen"]
+                second_choice = second_result["chosen"]
+
+                for label, result in (("First XI", first_result), ("Second XI", second_result)):
+                    if result["total"] is None:
+                        st.warning(f"⚠️ {label}: no lineup satisfies the constraints.")
+                    elif result["optimal"]:
+                        st.caption(f"{label}: proven optimal under the constraints ({result['nodes']} nodes)")
+                    else:
+                        st.caption(f"{label}: within {result['gap']:.2%} of optimal (bound {int(round(result['bound']))}, {result['nodes']} nodes)")
+            else:
+                # Use Hungarian algorithm
+                first_choice = choose_starting_xi(score_matrix_key, (), score_matrix, score_matrix_ranked)
+                used_player_indices = tuple(sorted(first_choice.values()))
+                second_choice = choose_starting_xi(score_matrix_key, used_player_indices, score_matrix, score_matrix_ranked)
 
     st.markdown("<br>", unsafe_allow_html=True)
     # Display both teams side by side
-    col1, col2 = st.columns(2)
+    with rerun_trace.stage("render: XIs"):
+        col1, col2 = st.columns(2)
 
-    with col1:
-        team_name = "Custom First XI" if st.session_state.use_custom_teams else "First XI"
-        first_xi_html = render_xi(first_choice, team_name)
-        st.markdown(first_xi_html, unsafe_allow_html=True)
+        with col1:
+            team_name = "Custom First XI" if st.session_state.use_custom_teams else "First XI"
+            first_xi_html = render_xi(first_choice, team_name)
+            st.markdown(first_xi_html, unsafe_allow_html=True)
 
-    with col2:
-        team_name = "Custom Second XI" if st.session_state.use_custom_teams else "Second XI"
-        second_xi_html = render_xi(second_choice, team_name)
-        st.markdown(second_xi_html, unsafe_allow_html=True)
+        with col2:
+            team_name = "Custom Second XI" if st.session_state.use_custom_teams else "Second XI"
+            second_xi_html = render_xi(second_choice, team_name)
+            st.markdown(second_xi_html, unsafe_allow_html=True)
+
+        if eligibility_adjusted:
+            # The eligibility settings only steer the picks; show how much they moved the totals
+            adjusted_totals = [sum(score_matrix[p, slot] for slot, p in choice.items()) for choice in (first_choice, second_choice)]
+            raw_totals = [raw_xi_total(choice, selected_formation) for choice in (first_choice, second_choice)]
+            st.caption(
+                "Scores shown are raw role scores. With the position eligibility settings the XIs total "
+                + " and ".join(f"{int(round(adjusted))} ({adjusted - raw:+.0f})" for adjusted, raw in zip(adjusted_totals, raw_totals))
+            )
+
+    # Next-best lineups (ranked assignments) for scouting how close the alternatives are
+    st.markdown("### Next-Best Lineups")
+    show_ranked_lineups = st.checkbox("Show ranked lineups", value=False, help="Enumerate the best distinct lineups in score order")
+    if show_ranked_lineups:
+        n_lineups = st.number_input("Number of lineups", min_value=2, max_value=50, value=10, step=1)
+        ranked_lineups = rank_lineups(score_matrix_key, int(n_lineups), score_matrix, [role for _, role in positions])
+        if ranked_lineups:
+            best_total, best_lineup = ranked_lineups[0]
+            best_roles = {p: positions[slot][1] for slot, p in best_lineup.items()}
+            lineup_rows = []
+            for rank, (total, chosen) in enumerate(ranked_lineups, start=1):
+                # Lineups are ranked on the adjusted scores but totalled on the raw ones
+                raw_total = raw_xi_total(chosen, selected_formation)
+                players_in = [f"{player_names[p]} ({positions[slot][0]})" for slot, p in sorted(chosen.items()) if p not in best_roles]
+                players_out = [player_names[p] for p in best_roles if p not in chosen.values()]
+                moved = [
+                    f"{player_names[p]} → {positions[slot][0]}" for slot, p in sorted(chosen.items())
+                    if p in best_roles and best_roles[p] != positions[slot][1]
+                ]
+                lineup_rows.append((
+                    rank, int(round(raw_total)), int(round(total)), int(round(total - best_total)),
+                    ", ".join(players_in) or "-", ", ".join(players_out) or "-", ", ".join(moved) or "-"
+                ))
+            lineups_df = pd.DataFrame(lineup_rows, columns=['Rank', 'XI Total', 'Adjusted Total', 'vs Best', 'In', 'Out', 'Moved'])
+            if not eligibility_adjusted:
+                lineups_df = lineups_df.drop(columns='Adjusted Total')
+            st.dataframe(lineups_df, use_container_width=True, hide_index=True)
+
+    # Squad robustness: re-solve the XI over thousands of random availability scenarios
+    st.markdown("### Squad Robustness")
+    show_robustness = st.checkbox("Simulate injuries and availability", value=False, help="Monte Carlo of the best XI when players randomly drop out")
+    if show_robustness:
+        sim_col1, sim_col2, sim_col3 = st.columns(3)
+        with sim_col1:
+            n_scenarios = st.number_input("Scenarios", min_value=100, max_value=20000, value=2000, step=500)
+        with sim_col2:
+            p_out = st.slider("Chance each player is unavailable", min_value=0.0, max_value=0.5, value=0.1, step=0.01)
+        with sim_col3:
+            remove_flagged = st.checkbox("Always remove injured/banned (Inf column)", value=True)
+
+        always_out = np.flatnonzero(unavailable_mask(df_final)) if remove_flagged else np.zeros(0, dtype=int)
+        simulation = simulate_squad(score_matrix_key, int(n_scenarios), float(p_out), remove_flagged, score_matrix, score_matrix_ranked, always_out)
+
+        sim_totals = simulation["totals"]
+        metric_col1, metric_col2, metric_col3 = st.columns(3)
+        with metric_col1:
+            st.metric("Expected XI Total", int(round(simulation["expected_total"])))
+        with metric_col2:
+            st.metric("Worst 5% XI Total", int(round(np.percentile(sim_totals, 5))) if len(sim_totals) else "N/A")
+        with metric_col3:
+            st.metric("Players Removed (Inf)", len(always_out))
+
+        # Criticality: expected XI total when the player is available minus when they are out
+        criticality_df = pd.DataFrame({
+            'Name': [player_names[p] for p in simulation["players"]],
+            'Start Rate %': (simulation["start_rate"] * 100).round(1),
+            'Criticality': simulation["criticality"].round(1),
+        })
+        criticality_df = criticality_df[criticality_df['Start Rate %'] > 0].sort_values('Criticality', ascending=False)
+        st.dataframe(criticality_df, use_container_width=True, hide_index=True)
+
+    # Transfer targets: rank scouted players by how much they would raise the best XI total
+    st.markdown("### Transfer Targets")
+    scouting_files = st.file_uploader(
+        "Upload scouting HTML exports (players outside your squad)",
+        type=["html", "htm"],
+        accept_multiple_files=True,
+        key="scouting_files"
+    )
+    if not scouting_files:
+        # Cleared uploads let go of the last scouted arrays in the shared store
+        st.session_state.score_lease.release("scouting")
+    else:
+        # Scouted players are filtered and scored against the squad, so key on both uploads
+        scouting_key = f"scouting:{create_file_hash(scouting_files)}:{current_file_hash}"
+        scouted_df = load_scouting_players(scouting_key, scouting_files, df_final['Name'])
+
+        if scouted_df is None or len(scouted_df) == 0:
+            st.session_state.score_lease.release("scouting")
+            st.warning("⚠️ No new players found in the scouting uploads.")
+        else:
+            # Score the scouted players exactly like the squad, missing attributes count as 0
+            scouted_attrs = scouted_df.reindex(columns=available_attrs + ['Position'])
+            scouted_data = st.session_state.score_lease.acquire(
+                "scouting", scouting_key, lambda: calculate_role_scores(scouted_attrs, available_attrs)
+            )
+            # Same position eligibility as the squad, so gains compare like with like
+            scouted_role_matrix = scouted_data["role_scores"]
+            if eligibility_mode != "Ignore":
+                scouted_role_matrix = apply_position_eligibility(
+                    scouted_role_matrix, scouted_data["positions"], eligibility_mode, natural_bonus / 100
+                )
+            scouted_matrix = compute_score_matrix(
+                f"{scouting_key}:{eligibility_mode}:{natural_bonus}", scouted_role_matrix, selected_formation
+            )
+            scouted_values, scouted_ages = get_constraint_columns(scouting_key, scouted_df)
+
+            targets = rank_transfer_targets(
+                score_matrix_key, scouting_key, score_matrix, score_matrix_ranked, scouted_matrix, scouted_values
+            )
+            gains = np.where(targets["exact"], targets["gain"], np.nan)
+            value_m = scouted_values / 1_000_000.0
+            targets_df = pd.DataFrame({
+                'Name': scouted_df['Name'],
+                'Age': scouted_ages,
+                'Transfer Value': scouted_df.get('Transfer Value', pd.Series(['N/A'] * len(scouted_df))),
+                'XI Gain': np.round(gains, 1),
+                'Gain Bound': np.round(targets["bound"], 1),
+                # Free agents (a value of 0) gain infinitely per €M, players with no known price get none
+                'Gain per €M': np.round(np.divide(gains, value_m, out=np.where(value_m == 0, np.inf, np.nan), where=value_m > 0), 2),
+            })
+            # Only candidates re-solved exactly are listed, the rest trail them on bound and bound per €
+            targets_df = targets_df[targets_df['XI Gain'] > 0].sort_values('Gain per €M', ascending=False)
+            st.caption(
+                f"{len(scouted_df)} scouted players, {int(targets['exact'].sum())} with exact gains "
+                f"(current XI total {int(round(targets['base_total']))}). Free agents show an infinite gain per €M, "
+                "players not for sale or with an unknown value show none."
+            )
+            st.dataframe(targets_df, use_container_width=True, hide_index=True)
+
+    # Similar players: nearest neighbours of one player's attribute vector, e.g. a cheaper version of a target
+    st.markdown("### Similar Players")
+    name_query = st.text_input("Find players similar to", placeholder="Type part of a player's name")
+    if name_query:
+        matches = np.flatnonzero(df_final['Name'].str.contains(name_query, case=False, regex=False, na=False).to_numpy())[:50]
+        if len(matches) == 0:
+            st.info("No player matches that name")
+        else:
+            target_row = st.selectbox(
+                "Player", matches,
+                format_func=lambda row: f"{df_final['Name'].iat[row]} ({df_final['Position'].iat[row] if 'Position' in df_final.columns else '-'})"
+            )
+            role_col, mode_col, size_col = st.columns(3)
+            with role_col:
+                similarity_role = st.selectbox("Weight attributes by", ["All attributes"] + ROLES)
+            with mode_col:
+                search_mode = st.radio("Search", ["Nearest", "Within distance"], horizontal=True)
+            with size_col:
+                if search_mode == "Nearest":
+                    n_similar = st.slider("Players", min_value=5, max_value=50, value=10)
+                else:
+                    radius = st.number_input(
+                        "Max distance (attribute points)", min_value=1.0, value=20.0, step=1.0,
+                        help="Euclidean distance between attribute vectors; 20 is about 3 points apart on each of 44 attributes"
+                    )
+            age_col, value_col = st.columns(2)
+            with age_col:
+                age_range = st.slider("Age", min_value=15, max_value=45, value=(15, 45))
+            with value_col:
+                max_value_m = st.number_input("Max transfer value (€M, 0 = no limit)", min_value=0.0, value=0.0, step=1.0)
+
+            transfer_values, player_ages = get_constraint_columns(current_file_hash, df_final)
+            allowed = filter_mask(
+                player_ages, transfer_values,
+                age_range if age_range != (15, 45) else None,
+                max_value_m * 1_000_000 if max_value_m > 0 else None
+            )
+            similarity_index = build_similarity_index(f"{current_file_hash}:{similarity_role}", attrs_matrix, similarity_role)
+            search_start = time.perf_counter()
+            if search_mode == "Nearest":
+                similar_rows, distances = similarity_index.nearest(target_row, n_similar, allowed)
+            else:
+                similar_rows, distances = similarity_index.within(target_row, radius, allowed)
+            search_ms = (time.perf_counter() - search_start) * 1000
+
+            similar_df = pd.DataFrame({
+                'Name': df_final['Name'].to_numpy()[similar_rows],
+                'Age': pd.Series(player_ages[similar_rows]).astype('Int64'),
+                'Position': df_final['Position'].to_numpy()[similar_rows] if 'Position' in df_final.columns else '-',
+                'Transfer Value': df_final['Transfer Value'].to_numpy()[similar_rows] if 'Transfer Value' in df_final.columns else '-',
+                'Distance': np.round(distances, 1),
+            })
+            if similarity_role != "All attributes":
+                similar_df[f'{similarity_role} Score'] = np.round(role_scores[similarity_role][similar_rows]).astype(int)
+            st.caption(f"{len(similar_df)} players found in {search_ms:.1f} ms (distance in attribute points)")
+            st.dataframe(similar_df, use_container_width=True, hide_index=True)
+
+@cached("styling", ttl=1800)  # Cache for 30 minutes
+def chart_sample(chart_key, _x, _y, _keep):
+    """Density-aware sample of a scatter's points, at most MAX_SCATTER_POINTS"""
+    return density_sample(_x, _y, MAX_SCATTER_POINTS, _keep)
+
+with tab1:
+    # Charts: scatters are sampled server-side, so the figure stays the same size for any upload
+    st.markdown("### Charts")
+    chart_kind = st.radio("Chart", ["Role vs role", "Score vs transfer value", "Radar comparison"], horizontal=True)
+    if chart_kind == "Radar comparison":
+        radar_col, players_col = st.columns([1, 3])
+        with radar_col:
+            radar_role = st.selectbox("Role", ROLES, key="radar_role")
+        role_index = ROLES.index(radar_role)
+        # The role's heaviest weighted attributes, so the axes are the ones that drive the score
+        weights = score_data["weights"][:, role_index]
+        radar_columns = [c for c in np.argsort(-weights, kind="stable")[:RADAR_ATTRIBUTES] if weights[c] > 0]
+        with players_col:
+            radar_rows = st.multiselect(
+                "Players", [int(row) for row in top_k_index[role_index]], default=[int(row) for row in top_k_index[role_index][:3]], max_selections=5,
+                format_func=lambda row: f"{df_final['Name'].iat[row]} ({int(round(role_score_matrix[row, role_index]))})",
+                help="The role's top players"
+            )
+        if radar_rows:
+            st.plotly_chart(radar_figure(
+                attrs_matrix[np.ix_(radar_rows, radar_columns)],
+                [df_final['Name'].iat[row] for row in radar_rows],
+                [available_attrs[c] for c in radar_columns]
+            ), use_container_width=True)
+    else:
+        if chart_kind == "Role vs role":
+            x_col, y_col = st.columns(2)
+            with x_col:
+                x_role = st.selectbox("X axis", ROLES, index=ROLES.index('CB'))
+            with y_col:
+                y_role = st.selectbox("Y axis", ROLES, index=ROLES.index('DM'))
+            chart_rows = np.arange(len(df_final))
+            x_values, y_values = role_scores[x_role], role_scores[y_role]
+            top_rows = np.union1d(top_k_index[ROLES.index(x_role)][:25], top_k_index[ROLES.index(y_role)][:25])
+            x_title, y_title, log_x = f"{x_role} score", f"{y_role} score", False
+            chart_key = f"{current_file_hash}:roles:{x_role}:{y_role}"
+        else:
+            y_role = st.selectbox("Role", ROLES, index=ROLES.index('ST'), key="value_chart_role")
+            transfer_values, _ = get_constraint_columns(current_file_hash, df_final)
+            # Log axis: players without a known, positive value are left out
+            chart_rows = np.flatnonzero(np.isfinite(transfer_values) & (transfer_values > 0))
+            x_values, y_values = transfer_values[chart_rows], role_scores[y_role][chart_rows]
+            top_rows = top_k_index[ROLES.index(y_role)][:50]
+            x_title, y_title, log_x = "Transfer value (€)", f"{y_role} score", True
+            chart_key = f"{current_file_hash}:value:{y_role}"
+
+        with rerun_trace.stage("chart sample", rows=len(chart_rows)) as span:
+            # Sampling is done in log space for the value axis, matching what the chart shows
+            keep = np.flatnonzero(np.isin(chart_rows, top_rows))
+            sampled, represents = span.output(chart_sample(chart_key, np.log10(x_values) if log_x else x_values, y_values, keep))
+        shown_rows = chart_rows[sampled]
+        figure = scatter_figure(
+            x_values[sampled], y_values[sampled], df_final['Name'].to_numpy()[shown_rows], x_title, y_title,
+            represents, np.isin(shown_rows, top_rows), log_x
+        )
+        st.plotly_chart(figure, use_container_width=True)
+        if len(sampled) < len(chart_rows):
+            st.caption(
+                f"Showing {len(sampled):,} of {len(chart_rows):,} players: crowded areas are thinned, "
+                "sparse areas and the top players are kept in full"
+            )
+
+def render_performance_panel(trace):
+    """Waterfall of this rerun's stage timings, exportable as JSON"""
+    spans = pd.DataFrame([span.to_dict() for span in trace.spans])
+    if spans.empty:
+        return
+    spans['end_ms'] = spans['start_ms'] + spans['wall_ms']
+    spans['cache'] = np.where(spans['cache_misses'] > 0, 'miss', np.where(spans['cache_hits'] > 0, 'hit', 'uncached'))
+
+    chart = alt.Chart(spans).mark_bar().encode(
+        x=alt.X('start_ms:Q', title='ms since rerun start'),
+        x2='end_ms:Q',
+        y=alt.Y('stage:N', sort=None, title=None),
+        color=alt.Color('cache:N', scale=alt.Scale(domain=['hit', 'miss', 'uncached'], range=['#00d4aa', '#ff6b6b', '#8888aa'])),
+        tooltip=['stage', 'wall_ms', 'rows', 'cache_hits', 'cache_misses', 'bytes'],
+    ).properties(height=22 * len(spans) + 40)
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"Rerun: {trace.total_seconds() * 1000:.0f} ms, {int(spans['cache_hits'].sum())} cache hits, {int(spans['cache_misses'].sum())} misses")
+    st.download_button(
+        "⬇️ Export timings (JSON)",
+        trace.to_json(),
+        file_name=f"rerun_timings_{time.strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json"
+    )
+
+finish_profile()
+
+def render_profile_download():
+    """Download link for this session's latest profiling dump"""
+    if rerun_profiler is None:
+        st.caption("Profiling is busy with another session, this rerun was not profiled")
+    prefix = st.session_state.get('profile_dump')
+    if not prefix or not os.path.exists(prefix + ".pstats"):
+        return
+    st.caption(f"Profile saved to {prefix}.pstats")
+    st.download_button(
+        "⬇️ Download profile (pstats + allocations)",
+        profiling.bundle(prefix),
+        file_name=f"{os.path.basename(prefix)}.zip",
+        mime="application/zip"
+    )
 
+with performance_panel:
+    render_performance_panel(rerun_trace)
+    if profiling_requested:
+        render_profile_download()
@@ -0,0 +1,815 @@
+"""Assignment solvers used by the teambuilders.
+
+Everything in here is plain numpy so it can be imported (and pickled into
+worker processes) without pulling in Streamlit.
+"""
+import heapq
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_linear_sum_assignment
+except Exception:
+    _scipy_linear_sum_assignment = None
+
+# Created on first use by get_worker_pool() and get_process_pool()
+_WORKER_POOL = None
+_PROCESS_POOL = None
+
+
+def hungarian(cost_matrix, u=None, v=None, row_match=None):
+    """Solve a min-cost assignment for a (rows <= cols) cost matrix.
+
+    Shortest augmenting path Hungarian method with dual potentials. Each row
+    is inserted with a Dijkstra-style search whose inner loop over columns is
+    vectorized, so the cost is O(rows^2 * cols) numpy work - cheap for the
+    11 x N player matrices used here.
+
+    Pass the potentials and matching (row_match[i] = column or -1) from an
+    earlier solve to warm start: they are repaired against the new matrix
+    and only the rows left unmatched are re-augmented.
+
+    Returns (row_ind, col_ind, u, v) where u/v are the row/column potentials
+    satisfying u[i] + v[j] <= cost[i, j] with equality on assigned pairs.
+    """
+    cost = np.asarray(cost_matrix, dtype=float)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("hungarian() expects rows <= cols, transpose the matrix first")
+
+    u_ = np.zeros(n + 1)
+    v_ = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)      # p[j] = 1-based row matched to column j (0 = free)
+    way = np.zeros(m + 1, dtype=int)
+
+    if u is not None:
+        u_[1:] = u
+    if v is not None:
+        v_[1:] = np.minimum(v, 0.0)
+    if row_match is not None:
+        for i, j in enumerate(row_match):
+            if 0 <= j < m and p[j + 1] == 0:
+                p[j + 1] = i + 1
+    if u is not None or v is not None or row_match is not None:
+        _repair_duals(cost, u_, v_, p)
+
+    matched_rows = set(p[1:][p[1:] > 0].tolist())
+    for i in range(1, n + 1):
+        if i in matched_rows:
+            continue
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u_[i0] - v_[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            u_[p[used]] += delta
+            v_[used] -= delta
+            minv[~used] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # Flip the augmenting path back to the root
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order], u_[1:], v_[1:]
+
+
+def _repair_duals(cost, u, v, p, eps=1e-9):
+    """Make warm-start potentials valid for cost, unmatching rows as needed.
+
+    Works on hungarian()'s 1-based arrays in place. Afterwards every reduced
+    cost is >= 0, matched pairs are tight and free columns have v = 0, which
+    is what the augmenting phase needs for an optimal result.
+    """
+    while True:
+        v[1:][p[1:] == 0] = 0.0
+        reduced = cost - u[1:, None] - v[None, 1:]
+
+        bad = reduced.min(axis=1) < -eps
+        matched_cols = np.nonzero(p[1:])[0]
+        matched_rows = p[1:][matched_cols] - 1
+        loose = np.abs(reduced[matched_rows, matched_cols]) > eps * np.maximum(1.0, np.abs(cost[matched_rows, matched_cols]))
+        bad[matched_rows[loose]] = True
+        if not bad.any():
+            return
+
+        for i in np.nonzero(bad)[0]:
+            p[1:][p[1:] == i + 1] = 0
+        # Any feasible value works for a free row; the tightest keeps the search short
+        u[1:][bad] = (cost[bad] - v[None, 1:]).min(axis=1)
+
+
+def linear_sum_assignment(cost_matrix, maximize=False):
+    """Drop-in replacement for scipy.optimize.linear_sum_assignment.
+
+    As in scipy, an infinite cost (-inf when maximizing) marks a forbidden
+    pair, and ValueError is raised for NaN entries or when every full
+    assignment needs a forbidden pair.
+    """
+    cost = np.asarray(cost_matrix, dtype=float)
+    if cost.ndim != 2:
+        raise ValueError("cost_matrix must be 2-D")
+    if cost.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    if maximize:
+        cost = -cost
+    if np.isnan(cost).any() or np.isneginf(cost).any():
+        raise ValueError("matrix contains invalid numeric entries")
+
+    forbidden = np.isposinf(cost)
+    if forbidden.any():
+        # A penalty above any all-allowed assignment's total, so forbidden pairs are only used when unavoidable
+        finite = cost[~forbidden]
+        span = float(finite.max() - finite.min()) if finite.size else 0.0
+        cost = np.where(forbidden, (span + 1.0) * (min(cost.shape) + 1) + (finite.max() if finite.size else 0.0), cost)
+
+    # Rectangular problems are solved exactly by putting the short side on the rows
+    if cost.shape[0] <= cost.shape[1]:
+        rows, cols, _, _ = hungarian(cost)
+    else:
+        cols, rows, _, _ = hungarian(cost.T)
+        order = np.argsort(rows)
+        rows, cols = rows[order], cols[order]
+    if forbidden[rows, cols].any():
+        raise ValueError("cost matrix is infeasible")
+    return rows, cols
+
+
+def build_top_k_index(role_score_matrix, k=64):
+    """Per-role player indices of the k best scores, best first (roles x k)"""
+    role_score_matrix = np.asarray(role_score_matrix, dtype=float)
+    n_players = role_score_matrix.shape[0]
+    k = min(k, n_players)
+    if k == 0:
+        return np.zeros((role_score_matrix.shape[1], 0), dtype=int)
+
+    top = np.argpartition(-role_score_matrix, k - 1, axis=0)[:k]
+    order = np.argsort(-np.take_along_axis(role_score_matrix, top, axis=0), axis=0, kind="stable")
+    return np.take_along_axis(top, order, axis=0).T
+
+
+def prune_candidates(score_matrix, excluded=(), ranked=None):
+    """Players that can appear in an optimal XI, as sorted row indices.
+
+    With n slots, suppose an optimal XI puts a player outside the top-n for
+    slot j into that slot. The other n - 1 slots can hold at most n - 1 of
+    slot j's top-n, so one of them is free and swapping it in cannot lower
+    the total. Repeating the swap gives an optimal XI drawn only from the
+    union of the per-slot top-n, so solving on that union is exact.
+
+    `ranked` is an optional (slots x K) array of row indices sorted by
+    score for each slot (see build_top_k_index). Slots sharing a role share
+    a ranking, and the full column is only scanned when exclusions use up
+    a ranking.
+    """
+    n_players, n_slots = score_matrix.shape
+    excluded = np.unique(np.asarray(list(excluded), dtype=int))
+    if n_players - len(excluded) <= n_slots:
+        return np.setdiff1d(np.arange(n_players), excluded)
+
+    keep = []
+    if ranked is not None:
+        ranked = np.asarray(ranked, dtype=int)
+        # Slots with the same ranking (usually the same role) share one lookup
+        slot_rankings = {}
+        for j, row in enumerate(ranked):
+            slot_rankings.setdefault(tuple(row), []).append(j)
+        for row, slots in slot_rankings.items():
+            row = np.asarray(row, dtype=int)
+            picks = row[~np.isin(row, excluded)][:n_slots]
+            if len(picks) == n_slots or len(row) == n_players:
+                keep.append(picks)
+            else:
+                # Different roles can share a short ranking, so each slot's own column is scanned
+                for j in slots:
+                    keep.append(_top_rows(score_matrix[:, j], n_slots, excluded))
+    else:
+        for j in range(n_slots):
+            keep.append(_top_rows(score_matrix[:, j], n_slots, excluded))
+
+    return np.unique(np.concatenate(keep))
+
+
+def _top_rows(column, n, excluded):
+    """Indices of the n largest values in column, skipping excluded rows"""
+    column = np.array(column, dtype=float)
+    column[excluded] = -np.inf
+    return np.argpartition(-column, n - 1)[:n]
+
+
+def solve_xi(score_matrix, excluded=(), ranked=None):
+    """Best XI for a players x slots score matrix, returns (total, {slot: player})"""
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    if score_matrix.shape[1] == 0:
+        return 0.0, {}
+
+    candidates = prune_candidates(score_matrix, excluded, ranked)
+    if len(candidates) == 0:
+        return 0.0, {}
+
+    solver = _scipy_linear_sum_assignment or linear_sum_assignment
+    sub = score_matrix[candidates, :]
+    row_ind, col_ind = solver(-sub)
+    chosen = {int(c): int(candidates[r]) for r, c in zip(row_ind, col_ind)}
+    return float(sub[row_ind, col_ind].sum()), chosen
+
+
+def get_worker_pool():
+    """Lazily created pool shared by the batched solvers.
+
+    Threads rather than processes: scipy's solver releases the GIL, so
+    nothing is gained by pickling the score matrices to another process.
+    """
+    global _WORKER_POOL
+    if _WORKER_POOL is None:
+        workers = max(1, min(8, os.cpu_count() or 1))
+        _WORKER_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xi-solver")
+    return _WORKER_POOL
+
+
+def get_process_pool():
+    """Lazily created process pool for CPU-bound batches, or None on a single core.
+
+    Workers come from a forkserver (spawn where there is none), never a
+    fork of the Streamlit server: forking a process with other threads
+    running can leave a lock held forever in the child. Under `streamlit
+    run`, __main__ is Streamlit's guarded entry script, so the workers
+    only import this module, where the chunk functions live.
+    """
+    global _PROCESS_POOL
+    workers = min(8, os.cpu_count() or 1)
+    if _PROCESS_POOL is None and workers > 1:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # Workers start with numpy and the solvers already imported
+            context.set_forkserver_preload(["assignment"])
+        _PROCESS_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return _PROCESS_POOL
+
+
+def _map_chunks(func, chunks):
+    """Run func over chunks on the process pool, in-process if there is none"""
+    global _PROCESS_POOL
+    pool = get_process_pool()
+    if pool is None or len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+    try:
+        return list(pool.map(func, chunks))
+    except BrokenProcessPool:
+        _PROCESS_POOL = None
+        return [func(chunk) for chunk in chunks]
+
+
+def solve_batch(score_matrices, ranked=None):
+    """Solve several independent XI problems in parallel, results in input order"""
+    if ranked is None:
+        ranked = [None] * len(score_matrices)
+    excluded = [()] * len(score_matrices)
+    if len(score_matrices) <= 1:
+        return list(map(solve_xi, score_matrices, excluded, ranked))
+    return list(get_worker_pool().map(solve_xi, score_matrices, excluded, ranked))
+
+
+def _lagrangian_xi(score_matrix, weights, lam, excluded, forced):
+    """Solve the assignment with constraint weights priced in at multipliers lam.
+
+    Returns (relaxed value without the lam * capacity term, rows, cols, usage).
+    Forced players get a bonus larger than any score range so they are always
+    placed; the bonus is taken back out of the relaxed value.
+    """
+    adjusted = score_matrix - (lam @ weights)[:, None]
+    if len(forced):
+        bonus = 2.0 * (np.abs(adjusted).max() + 1.0) * score_matrix.shape[1]
+        adjusted = adjusted.copy()
+        adjusted[forced] += bonus
+    else:
+        bonus = 0.0
+
+    candidates = prune_candidates(adjusted, excluded)
+    solver = _scipy_linear_sum_assignment or linear_sum_assignment
+    row_ind, col_ind = solver(-adjusted[candidates])
+    rows = candidates[row_ind]
+    relaxed = adjusted[rows, col_ind].sum() - bonus * len(forced)
+    return relaxed, rows, col_ind, weights[:, rows].sum(axis=1)
+
+
+def _repair_xi(score_matrix, weights, capacities, rows, cols, excluded, forced):
+    """Greedy primal heuristic: swap players out of a relaxed XI until it fits.
+
+    While a constraint is exceeded, the unforced player carrying the most of
+    the violated weight gives up their slot to the best scoring unused player
+    whose swap lowers the total excess. Returns (total, rows, cols) or None.
+    """
+    rows = np.array(rows, dtype=int)
+    usable = np.ones(score_matrix.shape[0], dtype=bool)
+    usable[excluded] = False
+    usable[rows] = False
+    movable = ~np.isin(rows, forced)
+    usage = weights[:, rows].sum(axis=1)
+    for _ in range(3 * len(rows)):
+        excess = np.maximum(usage - capacities, 0.0)
+        if np.all(excess <= 1e-9):
+            return float(score_matrix[rows, cols].sum()), rows, cols
+        load = np.where(movable, weights[excess > 1e-9][:, rows].sum(axis=0), -np.inf)
+        i = int(np.argmax(load))
+        if not np.isfinite(load[i]):
+            return None
+        swapped_usage = usage[:, None] - weights[:, [rows[i]]] + weights
+        lowers = usable & (np.maximum(swapped_usage - capacities[:, None], 0.0).sum(axis=0) < excess.sum() - 1e-12)
+        if not lowers.any():
+            movable[i] = False
+            continue
+        incoming = int(np.argmax(np.where(lowers, score_matrix[:, cols[i]], -np.inf)))
+        usable[rows[i]], usable[incoming] = True, False
+        usage = swapped_usage[:, incoming]
+        rows[i] = incoming
+    return None
+
+
+def _dual_bound(score_matrix, weights, capacities, excluded, forced, lam, incumbent, iterations, n_required):
+    """Projected subgradient descent on the Lagrangian dual of one B&B node.
+
+    Returns (bound, lam, best relaxed rows, feasible solutions seen). Any
+    lam >= 0 gives a valid upper bound, so stopping early is always safe.
+    A node that can no longer fill n_required slots is infeasible (-inf).
+    `incumbent` may start at a floor every full lineup reaches, so a bound
+    that falls below it also proves the node infeasible.
+    """
+    n_slots = score_matrix.shape[1]
+    if len(forced) > n_slots:
+        return -np.inf, lam, None, []
+    # Even the lightest players that could complete the lineup break a constraint
+    free = np.ones(score_matrix.shape[0], dtype=bool)
+    free[excluded] = False
+    free[forced] = False
+    n_free = n_required - len(forced)
+    if 0 < n_free <= free.sum():
+        lightest = np.partition(weights[:, free], n_free - 1, axis=1)[:, :n_free].sum(axis=1)
+        if np.any(weights[:, forced].sum(axis=1) + lightest > capacities + 1e-9):
+            return -np.inf, lam, None, []
+
+    best_bound = np.inf
+    best_rows = None
+    feasible = []
+    for _ in range(iterations):
+        relaxed, rows, cols, usage = _lagrangian_xi(score_matrix, weights, lam, excluded, forced)
+        if len(rows) < n_required or len(rows) == 0:
+            return -np.inf, lam, None, []
+        bound = relaxed + lam @ capacities
+        if bound < best_bound:
+            best_bound, best_rows = bound, rows
+
+        slack = capacities - usage
+        if np.all(slack >= -1e-9):
+            total = float(score_matrix[rows, cols].sum())
+            feasible.append((total, rows, cols))
+            incumbent = max(incumbent, total)
+            # Complementary slackness: the relaxation is exact at this node
+            if abs(lam @ slack) <= 1e-9 * max(1.0, abs(total)):
+                return total, lam, rows, feasible
+        else:
+            repaired = _repair_xi(score_matrix, weights, capacities, rows, cols, excluded, forced)
+            if repaired is not None:
+                feasible.append(repaired)
+                incumbent = max(incumbent, repaired[0])
+
+        subgradient = -slack
+        norm = subgradient @ subgradient
+        if norm <= 0 or best_bound - incumbent <= 1e-9 * max(1.0, abs(best_bound)):
+            break
+        target = incumbent if np.isfinite(incumbent) else bound - 0.05 * abs(bound)
+        step = max(bound - target, 1e-6 * abs(bound)) / norm
+        lam = np.maximum(0.0, lam + step * subgradient)
+
+    return best_bound, lam, best_rows, feasible
+
+
+def solve_constrained_xi(score_matrix, constraints, excluded=(), time_limit=1.0, tol=1e-6):
+    """Best XI subject to per-player linear constraints, sum(weights[p]) <= capacity.
+
+    `constraints` is a list of (weights per player, capacity), e.g. transfer
+    values against a budget. Bounds come from Lagrangian relaxation over the
+    assignment solver and branch-and-bound (exclude / force a player) closes
+    the gap until `time_limit` seconds. Every relaxed solution that breaks a
+    constraint is greedily repaired into an incumbent. Only full lineups
+    count (every slot filled, or every player when the squad is short), so
+    total is None when no full lineup satisfies the constraints. The result
+    reports the remaining optimality gap; optimal is True when it is closed.
+    """
+    started = time.perf_counter()
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    n_players, n_slots = score_matrix.shape
+    result = {"total": None, "chosen": {}, "bound": None, "gap": None, "optimal": False, "nodes": 0}
+    if n_players == 0 or n_slots == 0:
+        result.update(total=0.0, bound=0.0, gap=0.0, optimal=True)
+        return result
+
+    # Scale each constraint so the multipliers live on comparable ranges
+    weights = np.array([np.asarray(w, dtype=float) for w, _ in constraints]).reshape(len(constraints), n_players)
+    capacities = np.array([float(c) for _, c in constraints])
+    scale = np.maximum(np.maximum(np.abs(capacities), np.abs(weights).max(axis=1, initial=0.0)), 1e-12)
+    weights = weights / scale[:, None]
+    capacities = capacities / scale
+
+    base_excluded = np.unique(np.asarray(list(excluded), dtype=int))
+    n_required = min(n_slots, n_players - len(base_excluded))
+    incumbent, best = -np.inf, None
+    # Every full lineup scores at least this, so nodes bounded below it hold none
+    allowed = np.setdiff1d(np.arange(n_players), base_excluded)
+    floor = n_required * score_matrix[allowed].min() - 1.0 if n_required > 0 else -np.inf
+
+    def evaluate(forced, banned, lam, iterations):
+        nonlocal incumbent, best
+        node_excluded = np.union1d(base_excluded, np.asarray(banned, dtype=int))
+        bound, lam, rows, feasible = _dual_bound(
+            score_matrix, weights, capacities, node_excluded,
+            np.asarray(forced, dtype=int), lam, max(incumbent, floor), iterations, n_required
+        )
+        for total, f_rows, f_cols in feasible:
+            if total > incumbent:
+                incumbent, best = total, (f_rows, f_cols)
+        return bound, lam, rows
+
+    root_bound, root_lam, root_rows = evaluate((), (), np.zeros(len(capacities)), 60)
+    result["nodes"] = 1
+    counter = 0
+    heap = [(-root_bound, counter, (), (), root_lam, root_rows)]
+    global_bound = root_bound
+
+    while heap and time.perf_counter() - started < time_limit:
+        neg_bound, _, forced, banned, lam, rows = heapq.heappop(heap)
+        global_bound = -neg_bound
+        if global_bound - max(incumbent, floor) <= tol * max(1.0, abs(global_bound)):
+            heap = []
+            break
+        if rows is None:
+            continue
+
+        # Branch on the relaxed solution's heaviest free player
+        free = [r for r in rows if r not in forced]
+        if not free:
+            continue
+        pick = int(max(free, key=lambda r: weights[:, r].sum()))
+        for child_forced, child_banned in (((*forced, pick), banned), (forced, (*banned, pick))):
+            bound, child_lam, child_rows = evaluate(child_forced, child_banned, lam, 20)
+            result["nodes"] += 1
+            if bound > max(incumbent, floor) + tol * max(1.0, abs(bound)):
+                counter += 1
+                heapq.heappush(heap, (-bound, counter, child_forced, child_banned, child_lam, child_rows))
+
+    open_bound = max([-entry[0] for entry in heap], default=-np.inf)
+    bound = max(open_bound, incumbent) if heap else (incumbent if best is not None else global_bound)
+    result["bound"] = float(bound)
+    if best is None:
+        return result
+
+    rows, cols = best
+    result["total"] = float(incumbent)
+    result["chosen"] = {int(c): int(r) for r, c in zip(rows, cols)}
+    result["gap"] = float(max(0.0, bound - incumbent) / max(abs(bound), 1e-12))
+    result["optimal"] = result["gap"] <= tol
+    return result
+
+
+def reoptimize_xi(score_matrix, locked=None, excluded=(), ranked=None, warm=None):
+    """Fill the unlocked slots optimally around locked and excluded players.
+
+    `locked` maps slot -> player and those players are kept out of the other
+    slots. `warm` is the state returned by the previous call for the same
+    score matrix; its slot/player potentials and matching seed the solve, so
+    a single lock or exclusion only re-augments the slots it disturbed.
+
+    Returns (chosen {slot: player} including the locked slots, warm state).
+    """
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    n_slots = score_matrix.shape[1]
+    locked = {int(slot): int(player) for slot, player in (locked or {}).items()}
+    warm = warm or {"u": np.zeros(n_slots), "v": {}, "match": {}}
+    chosen = dict(locked)
+
+    free_slots = [j for j in range(n_slots) if j not in locked]
+    if not free_slots:
+        return chosen, warm
+
+    banned = set(int(p) for p in excluded) | set(locked.values())
+    sub = score_matrix[:, free_slots]
+    sub_ranked = None if ranked is None else np.asarray(ranked)[free_slots]
+    candidates = prune_candidates(sub, sorted(banned), sub_ranked)
+    if len(candidates) == 0:
+        return chosen, warm
+
+    # Slots on the rows, maximise by minimising the negated scores
+    cost = -sub[candidates].T
+    if len(candidates) < len(free_slots):
+        # Short squad: nothing worth warm starting, solve the transposed problem cold
+        rows, cols = linear_sum_assignment(cost)
+        chosen.update({free_slots[r]: int(candidates[c]) for r, c in zip(rows, cols)})
+        return chosen, warm
+
+    position = {int(p): k for k, p in enumerate(candidates)}
+    u0 = np.asarray(warm["u"], dtype=float)[free_slots]
+    v0 = np.array([warm["v"].get(int(p), 0.0) for p in candidates])
+    match0 = [position.get(warm["match"].get(slot, -1), -1) for slot in free_slots]
+    rows, cols, u, v = hungarian(cost, u0, v0, match0)
+
+    new_u = np.array(warm["u"], dtype=float)
+    new_u[free_slots] = u
+    new_v = dict(warm["v"])
+    new_v.update({int(p): float(pot) for p, pot in zip(candidates, v)})
+    match = {free_slots[r]: int(candidates[c]) for r, c in zip(rows, cols)}
+    chosen.update(match)
+    return chosen, {"u": new_u, "v": new_v, "match": match}
+
+
+def _solve_partition(score_matrix, slot_groups, forced, forbidden, excluded):
+    """One Murty subproblem: (player, group) pairs forced into / kept out of the XI.
+
+    Returns (total, {slot: player}) or None when the subproblem is infeasible.
+    """
+    n_players, n_slots = score_matrix.shape
+    locked = {}
+    for player, group in forced:
+        slot = next((j for j in range(n_slots) if slot_groups[j] == group and j not in locked), None)
+        if slot is None:
+            return None
+        locked[slot] = player
+
+    free_slots = [j for j in range(n_slots) if j not in locked]
+    total = float(sum(score_matrix[player, slot] for slot, player in locked.items()))
+    chosen = dict(locked)
+    if not free_slots:
+        return total, chosen
+
+    sub = score_matrix[:, free_slots]
+    floor = sub.min() - 1.0
+    penalty = floor - 2.0 * (sub.max() - floor + 1.0) * len(free_slots)
+    for player, group in forbidden:
+        for k, slot in enumerate(free_slots):
+            if slot_groups[slot] == group:
+                sub[player, k] = penalty
+
+    banned = set(excluded) | set(locked.values())
+    candidates = prune_candidates(sub, sorted(banned))
+    if len(candidates) < len(free_slots):
+        return None
+    solver = _scipy_linear_sum_assignment or linear_sum_assignment
+    row_ind, col_ind = solver(-sub[candidates])
+    picked = sub[candidates[row_ind], col_ind]
+    if np.any(picked <= penalty):
+        return None
+
+    chosen.update({free_slots[c]: int(candidates[r]) for r, c in zip(row_ind, col_ind)})
+    return total + float(picked.sum()), chosen
+
+
+def k_best_xis(score_matrix, k, slot_groups=None, excluded=()):
+    """The k best distinct lineups in score order (Murty's ranked assignments).
+
+    Slots in the same group (e.g. both CB slots) are interchangeable, so a
+    lineup is the set of (player, group) pairs and swapping two CBs is not a
+    new lineup. Each popped lineup splits its remaining search space into
+    disjoint subproblems - keep the first i - 1 pairs, forbid the i-th - and
+    those re-solves run in parallel on the worker pool.
+
+    Returns a list of (total, {slot: player}), best first.
+    """
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    n_slots = score_matrix.shape[1]
+    if slot_groups is None:
+        slot_groups = list(range(n_slots))
+    excluded = tuple(int(p) for p in excluded)
+
+    first = _solve_partition(score_matrix, slot_groups, (), (), excluded)
+    if first is None or k <= 0:
+        return []
+
+    counter = 0
+    heap = [(-first[0], counter, (), (), first)]
+    results = []
+    while heap and len(results) < k:
+        _, _, forced, forbidden, (total, chosen) = heapq.heappop(heap)
+        results.append((total, chosen))
+
+        forced_set = set(forced)
+        pairs = sorted((player, slot_groups[slot]) for slot, player in chosen.items())
+        free_pairs = [pair for pair in pairs if pair not in forced_set]
+        subproblems = [
+            (forced + tuple(free_pairs[:i]), forbidden + (pair,))
+            for i, pair in enumerate(free_pairs)
+        ]
+        solved = get_worker_pool().map(
+            lambda sp: _solve_partition(score_matrix, slot_groups, sp[0], sp[1], excluded),
+            subproblems
+        )
+        for (child_forced, child_forbidden), solution in zip(subproblems, solved):
+            if solution is not None:
+                counter += 1
+                heapq.heappush(heap, (-solution[0], counter, child_forced, child_forbidden, solution))
+
+    return results
+
+
+def _availability_chunk(args):
+    """Solve one chunk of availability scenarios on the candidate pool.
+
+    Scenarios where some slot's ranking runs out of available players are
+    not solved here (the pool may not hold the true best XI); their absence
+    masks are returned for an exact solve on the full matrix.
+    """
+    scores, rankings, complete, p_out, always_out, n_scenarios, seed = args
+    rng = np.random.default_rng(seed)
+    n_pool, n_slots = scores.shape
+    solver = _scipy_linear_sum_assignment or linear_sum_assignment
+
+    totals = []
+    starts = np.zeros(n_pool)
+    absent_total = np.zeros(n_pool)
+    absent_count = np.zeros(n_pool)
+    deep = []
+    for _ in range(n_scenarios):
+        out = (rng.random(n_pool) < p_out) | always_out
+        available = ~out
+        keep = []
+        for row, full in zip(rankings, complete):
+            picks = row[available[row]][:n_slots]
+            if len(picks) < n_slots and not full:
+                keep = None
+                break
+            keep.append(picks)
+        if keep is None:
+            deep.append(out)
+            continue
+
+        candidates = np.unique(np.concatenate(keep))
+        row_ind, col_ind = solver(-scores[candidates])
+        total = scores[candidates[row_ind], col_ind].sum()
+        totals.append(total)
+        starts[candidates[row_ind]] += 1
+        absent_total[out] += total
+        absent_count[out] += 1
+
+    return np.array(totals), starts, absent_total, absent_count, deep
+
+
+def simulate_availability(score_matrix, ranked, p_out, n_scenarios, always_out=(), seed=0, chunk_size=1000):
+    """Monte Carlo of the best XI when players randomly drop out.
+
+    Each scenario removes every player independently with probability p_out
+    (plus everyone in always_out) and re-solves the XI. Scenarios run in
+    chunks on the process pool over the pruned candidate pool - the union
+    of the per-slot rankings - so a scenario costs a tiny assignment solve.
+
+    Returns a dict with the scenario totals, the expected total, and per
+    pool player the start rate and criticality (expected XI total when
+    available minus when out).
+    """
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    n_players, n_slots = score_matrix.shape
+    ranked = np.asarray(ranked, dtype=int)
+    pool = np.unique(ranked)
+    local = np.full(n_players, -1)
+    local[pool] = np.arange(len(pool))
+
+    distinct = np.unique(ranked, axis=0)
+    rankings = [local[row] for row in distinct]
+    complete = [len(row) >= n_players for row in distinct]
+    forced_out = np.zeros(n_players, dtype=bool)
+    forced_out[np.asarray(list(always_out), dtype=int)] = True
+
+    n_chunks = max(1, -(-n_scenarios // chunk_size))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks + 1)
+    chunks = [
+        (score_matrix[pool], rankings, complete, p_out, forced_out[pool],
+         min(chunk_size, n_scenarios - i * chunk_size), seeds[i])
+        for i in range(n_chunks)
+    ]
+    results = _map_chunks(_availability_chunk, chunks)
+
+    totals = [r[0] for r in results]
+    starts = sum(r[1] for r in results)
+    absent_total = sum(r[2] for r in results)
+    absent_count = sum(r[3] for r in results)
+
+    # Rare scenarios that exhausted a ranking: sample everyone outside the pool and solve exactly
+    rng = np.random.default_rng(seeds[-1])
+    outside = np.setdiff1d(np.arange(n_players), pool)
+    deep_totals = []
+    for out in (mask for r in results for mask in r[4]):
+        excluded = np.concatenate([pool[out], outside[(rng.random(len(outside)) < p_out) | forced_out[outside]]])
+        total, chosen = solve_xi(score_matrix, excluded)
+        deep_totals.append(total)
+        picked = local[list(chosen.values())]
+        starts[picked[picked >= 0]] += 1
+        absent_total[out] += total
+        absent_count[out] += 1
+    totals = np.concatenate(totals + [np.array(deep_totals)])
+
+    grand_total = totals.sum()
+    present_count = len(totals) - absent_count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_present = (grand_total - absent_total) / present_count
+        mean_absent = absent_total / absent_count
+    return {
+        "totals": totals,
+        "expected_total": float(totals.mean()) if len(totals) else 0.0,
+        "players": pool,
+        "start_rate": starts / max(len(totals), 1),
+        "criticality": np.nan_to_num(mean_present - mean_absent),
+        "deep_scenarios": len(deep_totals),
+    }
+
+
+def _solve_total(score_matrix):
+    """Best XI total for a small players x slots matrix (no pruning)"""
+    solver = _scipy_linear_sum_assignment or linear_sum_assignment
+    row_ind, col_ind = solver(-score_matrix)
+    return float(score_matrix[row_ind, col_ind].sum())
+
+
+def marginal_gains(score_matrix, candidate_scores, ranked=None, values=None, n_exact=300, tol=1e-9):
+    """How much each external candidate would raise the best XI total.
+
+    One squad solve gives slot potentials a (and player potentials b >= 0)
+    with a[j] + b[i] >= score[i, j]. Pricing a newcomer at
+    max_j(score[x, j] - a[j])+ keeps that dual feasible, so it bounds the
+    gain from signing x; for every candidate that is one vectorized pass.
+    The candidates with the largest bounds (and largest bound per unit of
+    `values`, if given) are then re-solved exactly on the squad's pruned
+    pool plus the candidate, which is exact for the same exchange reason as
+    prune_candidates. Candidates with a zero bound gain exactly nothing.
+
+    Returns a dict of per-candidate arrays: bound, gain (nan where not
+    re-solved) and exact, plus the squad's base_total.
+    """
+    score_matrix = np.asarray(score_matrix, dtype=float)
+    candidate_scores = np.asarray(candidate_scores, dtype=float)
+    n_players, n_slots = score_matrix.shape
+    n_candidates = len(candidate_scores)
+
+    # Empty slots score 0: pad a short squad with zero-score stand-ins
+    pool = prune_candidates(score_matrix, (), ranked)
+    padding = np.zeros((max(0, n_slots - len(pool)), n_slots))
+    squad = np.vstack([score_matrix[pool], padding])
+
+    rows, cols, u, _ = hungarian(-squad.T)
+    base_total = float(squad[cols, rows].sum())
+    slot_prices = -u
+
+    # Pool duals must also cover the pruned squad players, else solve the full squad
+    outside = np.setdiff1d(np.arange(n_players), pool)
+    if len(outside) and (score_matrix[outside] - slot_prices).max() > tol * max(1.0, abs(base_total)):
+        squad = np.vstack([score_matrix, padding])
+        rows, cols, u, _ = hungarian(-squad.T)
+        slot_prices = -u
+
+    bound = np.maximum((candidate_scores - slot_prices).max(axis=1), 0.0) if n_candidates else np.zeros(0)
+    gain = np.full(n_candidates, np.nan)
+    exact = bound <= tol * max(1.0, abs(base_total))
+    gain[exact] = 0.0
+
+    # Exact re-solves for the most promising candidates by bound and bound per value
+    open_idx = np.flatnonzero(~exact)
+    picks = [open_idx[np.argsort(-bound[open_idx], kind="stable")[:n_exact]]]
+    if values is not None:
+        values = np.asarray(values, dtype=float)
+        open_values = values[open_idx]
+        # Free candidates first, unknown values (NaN, e.g. not for sale) never picked on value
+        per_value = np.where(open_values == 0, np.inf, -np.inf)
+        np.divide(bound[open_idx], open_values, out=per_value, where=open_values > 0)
+        priced = np.flatnonzero(~np.isnan(open_values))
+        picks.append(open_idx[priced[np.argsort(-per_value[priced], kind="stable")[:n_exact]]])
+    picks = np.unique(np.concatenate(picks)).astype(int)
+
+    matrices = [np.vstack([squad, candidate_scores[x]]) for x in picks]
+    totals = np.array(list(get_worker_pool().map(_solve_total, matrices)), dtype=float)
+    if len(picks):
+        gain[picks] = np.maximum(totals - base_total, 0.0)
+        exact[picks] = True
+
+    return {"base_total": base_total, "bound": bound, "gain": gain, "exact": exact}
@@ -0,0 +1,139 @@
+"""End-to-end benchmark of the pipeline stages on synthetic exports.
+
+    python benchmark.py                          # 260, 10k and 100k players
+    python benchmark.py --sizes 260 10000 --output bench.json
+
+Every stage is timed on its own (best of --repeat runs) and run once more
+under tracemalloc for peak memory. Results go to a JSON file so runs from
+different commits can be diffed.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from assignment import solve_xi
+from formations import DEFAULT_FORMATION, ROLES, formation_role_columns
+from generate_export import generate_export
+from pipeline import (
+    CANONICAL_ATTRIBUTES, parse_players_from_html, parse_players_from_stream, merge_duplicate_columns,
+    deduplicate_players, calculate_role_scores, create_comprehensive_table, compute_score_matrix
+)
+from styling import NUMERIC_COLUMNS, build_display_table, table_styles
+
+DEFAULT_SIZES = [260, 10_000, 100_000]
+
+
+def measure(func, repeat):
+    """(best wall seconds, peak traced bytes, result) for func()"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def styled_table(df_final, role_scores):
+    """Full Table view: rankings table, blanked display copy and cell styles"""
+    comprehensive_df = create_comprehensive_table(df_final, role_scores)
+    _, display_df = build_display_table(comprehensive_df)
+    return table_styles(display_df, NUMERIC_COLUMNS)
+
+
+def both_xis(score_matrix, ranked):
+    """First XI, then the second XI without the first XI's players"""
+    _, first = solve_xi(score_matrix, (), ranked)
+    return solve_xi(score_matrix, tuple(sorted(first.values())), ranked)
+
+
+def run_size(n_players, repeat, seed):
+    """Time every stage on one generated export, returns a list of result dicts"""
+    html_text = generate_export(n_players, seed=seed)
+    results = []
+
+    def record(stage, func, rows):
+        seconds, peak, value = measure(func, repeat)
+        results.append({
+            "players": n_players,
+            "stage": stage,
+            "rows": int(rows),
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds > 0 else None,
+            "peak_bytes": int(peak),
+        })
+        print(f"{n_players:>8} {stage:<20} {seconds * 1000:10.1f} ms {peak / 2**20:9.1f} MB")
+        return value
+
+    html_bytes = html_text.encode("utf-8")
+    df, _ = record("parse", lambda: parse_players_from_html(html_text), n_players)
+    record("parse_stream", lambda: parse_players_from_stream(io.BytesIO(html_bytes), len(html_bytes)), n_players)
+    df = record("merge", lambda: merge_duplicate_columns(df), len(df)).reset_index(drop=True)
+    df['Player ID'] = np.arange(len(df), dtype=np.int64)
+    df_final = record("dedup", lambda: deduplicate_players(df), len(df))
+
+    available_attrs = [a for a in CANONICAL_ATTRIBUTES if a in df_final.columns]
+    score_data = record("role_scores", lambda: calculate_role_scores(df_final, available_attrs), len(df_final))
+    role_scores = {role: score_data["role_scores"][:, i] for i, role in enumerate(ROLES)}
+
+    record("styling", lambda: styled_table(df_final, role_scores), len(df_final))
+    score_matrix = record(
+        "score_matrix", lambda: compute_score_matrix(score_data["role_scores"], DEFAULT_FORMATION), len(df_final)
+    )
+    ranked = score_data["top_k"][formation_role_columns(DEFAULT_FORMATION)]
+    record("choose_starting_xi", lambda: both_xis(score_matrix, ranked), len(df_final))
+    return results
+
+
+def environment():
+    """Versions and commit, so results from different machines/commits can be told apart"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the player ranker pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="players per export")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = []
+    for n_players in args.sizes:
+        results.extend(run_size(n_players, args.repeat, args.seed))
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
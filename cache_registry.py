@@ -0,0 +1,214 @@
+"""Process-wide cache registry for the pipeline stages.
+
+Every cached function belongs to a stage (parse, dedup, scoring, styling,
+assignment). Each stage has its own entry and byte budget with LRU eviction
+and keeps hit/miss/evict counters, so the sidebar can report what is really
+resident and clear one stage at a time. As with st.cache_data, arguments
+whose names start with an underscore are left out of the cache key.
+
+Cached values are shared, not copied: callers must treat them as read-only.
+"""
+import functools
+import hashlib
+import inspect
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MB = 1024 * 1024
+
+# Per-stage budgets: (max entries, max resident bytes)
+STAGE_BUDGETS = {
+    "parse": (32, 256 * MB),
+    "dedup": (16, 256 * MB),
+    "scoring": (32, 256 * MB),
+    "styling": (16, 128 * MB),
+    "assignment": (256, 64 * MB),
+}
+
+
+class CacheStage:
+    """LRU cache for one stage with an entry and byte budget"""
+
+    def __init__(self, name, max_entries, max_bytes):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> (value, nbytes, expires_at)
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        """Return (found, value), refreshing the entry's LRU position"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                _THREAD.misses = getattr(_THREAD, "misses", 0) + 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            _THREAD.hits = getattr(_THREAD, "hits", 0) + 1
+            _THREAD.last_value = (entry[0], entry[1])
+            return True, entry[0]
+
+    def put(self, key, value, ttl=None):
+        nbytes = estimate_nbytes(value)
+        _THREAD.last_value = (value, nbytes)
+        if nbytes > self.max_bytes:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, nbytes, expires_at)
+            self.resident_bytes += nbytes
+            while len(self.entries) > self.max_entries or self.resident_bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "stage": self.name,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _drop(self, key):
+        _, nbytes, _ = self.entries.pop(key)
+        self.resident_bytes -= nbytes
+
+
+# One LRU per stage; every @cached function of a stage shares its budget
+STAGES = {name: CacheStage(name, *budget) for name, budget in STAGE_BUDGETS.items()}
+# Lookups made by the current thread (each session's script run has its own)
+_THREAD = threading.local()
+
+
+def cached(stage, ttl=None):
+    """Decorator caching a function's results in the given stage"""
+    cache = STAGES[stage]
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            hasher = hashlib.blake2b(name.encode(), digest_size=16)
+            for arg_name, value in bound.arguments.items():
+                if not arg_name.startswith("_"):
+                    hasher.update(arg_name.encode())
+                    _update_hash(hasher, value)
+            key = hasher.hexdigest()
+
+            found, value = cache.get(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            cache.put(key, value, ttl)
+            return value
+
+        wrapper.cache_stage = stage
+        return wrapper
+
+    return decorator
+
+
+def clear(stage=None):
+    """Clear one stage, or every stage when stage is None"""
+    for cache in ([STAGES[stage]] if stage else STAGES.values()):
+        cache.clear()
+
+
+def thread_counters():
+    """(hits, misses) across all stages made by the calling thread so far"""
+    return getattr(_THREAD, "hits", 0), getattr(_THREAD, "misses", 0)
+
+
+def known_nbytes(value):
+    """Size the registry measured for value, if it is what the calling thread's last lookup returned"""
+    last = getattr(_THREAD, "last_value", None)
+    return last[1] if last is not None and last[0] is value else None
+
+
+def stats():
+    """Per-stage counters and resident bytes, in STAGE_BUDGETS order"""
+    return [cache.stats() for cache in STAGES.values()]
+
+
+def _update_hash(hasher, value):
+    """Feed a cache-key argument into hasher"""
+    hasher.update(type(value).__name__.encode())
+    if value is None or isinstance(value, (bool, int, float, complex, str)):
+        hasher.update(repr(value).encode())
+    elif isinstance(value, bytes):
+        hasher.update(value)
+    elif isinstance(value, np.ndarray):
+        hasher.update(f"{value.dtype}{value.shape}".encode())
+        if value.dtype == object:
+            hasher.update(pickle.dumps(value.tolist()))
+        else:
+            hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        if isinstance(value, pd.DataFrame):
+            _update_hash(hasher, [str(c) for c in value.columns])
+        hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, (list, tuple)):
+        hasher.update(str(len(value)).encode())
+        for item in value:
+            _update_hash(hasher, item)
+    elif isinstance(value, dict):
+        hasher.update(str(len(value)).encode())
+        for item_key, item in value.items():
+            _update_hash(hasher, item_key)
+            _update_hash(hasher, item)
+    else:
+        hasher.update(pickle.dumps(value))
+
+
+def estimate_nbytes(value, deep=True):
+    """Approximate resident size of a cached value.
+
+    deep=False skips measuring the strings in object columns, which is the
+    slow part on large frames.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=deep).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=deep))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item, deep) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(k, deep) + estimate_nbytes(v, deep) for k, v in value.items())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
@@ -0,0 +1,120 @@
+"""Plotly scatter and radar charts that stay small for any dataset size.
+
+Scatter plots use WebGL (Scattergl) traces and are downsampled on the
+server before the figure is built, so the payload sent to the browser is
+capped at max_points whatever the number of players. Sampling is density
+aware: the plane is cut into a grid and every cell keeps at most the same
+number of points, so crowded cells are thinned while sparse cells (the
+outliers a scout is looking for) are kept whole.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+MAX_SCATTER_POINTS = 5000
+GRID_CELLS = 64  # Per axis
+RADAR_ATTRIBUTES = 10
+
+_LAYOUT = dict(template="plotly_dark", margin=dict(l=10, r=10, t=40, b=10), height=500)
+
+
+def density_sample(x, y, max_points=MAX_SCATTER_POINTS, keep=None, grid=GRID_CELLS, seed=0):
+    """(rows, represents): at most max_points rows of (x, y), and how many players each stands for.
+
+    Values must be finite. Rows in keep (e.g. the top of a ranking) are
+    always included; the other rows share what is left of the budget as a
+    per-cell cap, the largest under which the capped cell counts still fit.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    keep = np.unique(np.asarray([] if keep is None else keep, dtype=int))[:max_points]
+    if n <= max_points:
+        return np.arange(n), np.ones(n, dtype=np.int64)
+
+    def bins(values):
+        low, high = values.min(), values.max()
+        scaled = (values - low) / (high - low) if high > low else np.zeros(len(values))
+        return np.minimum((scaled * grid).astype(np.int64), grid - 1)
+
+    cells = bins(x) * grid + bins(y)
+    kept = np.zeros(n, dtype=bool)
+    kept[keep] = True
+    budget = max_points - len(keep)
+    remaining = np.bincount(cells[~kept], minlength=grid * grid)
+
+    # Largest per-cell cap whose capped total fits the budget
+    cap = _largest_cap(remaining, budget)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n)
+    order = order[~kept[order]]
+    order = order[np.argsort(cells[order], kind="stable")]
+    sorted_cells = cells[order]
+    first = np.searchsorted(sorted_cells, sorted_cells, side="left")
+    within = np.arange(len(order)) - first
+    sampled = order[within < cap]
+    # Spend what the whole-number cap leaves over on random cells that were at the cap
+    spare = budget - len(sampled)
+    if spare > 0:
+        sampled = np.concatenate([sampled, rng.permutation(order[within == cap])[:spare]])
+
+    rows = np.sort(np.concatenate([keep, sampled]))
+    # Each sampled point stands for its share of its cell, kept rows for themselves
+    shown = np.bincount(cells[sampled], minlength=grid * grid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_point = np.where(shown > 0, remaining / np.maximum(shown, 1), 1.0)
+    represents = np.where(kept[rows], 1, np.round(per_point[cells[rows]])).astype(np.int64)
+    return rows, represents
+
+
+def _largest_cap(counts, budget):
+    """Largest c with sum(min(counts, c)) <= budget"""
+    if budget <= 0:
+        return 0
+    counts = np.sort(counts[counts > 0])
+    if counts.sum() <= budget:
+        return int(counts[-1]) if len(counts) else 0
+    low, high = 0, int(counts[-1])
+    while low < high:
+        mid = (low + high + 1) // 2
+        if np.minimum(counts, mid).sum() <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def scatter_figure(x, y, names, x_title, y_title, represents=None, highlight=None, log_x=False):
+    """WebGL scatter of already sampled points, with highlighted rows drawn on top"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    names = np.asarray(names)
+    represents = np.ones(len(x), dtype=np.int64) if represents is None else np.asarray(represents)
+    highlight = np.zeros(len(x), dtype=bool) if highlight is None else np.asarray(highlight, dtype=bool)
+
+    figure = go.Figure()
+    for mask, label, marker in (
+        (~highlight, "Players", dict(size=5, color="#8888aa", opacity=0.6)),
+        (highlight, "Top players", dict(size=8, color="#00d4aa", line=dict(width=1, color="white"))),
+    ):
+        if not mask.any():
+            continue
+        figure.add_trace(go.Scattergl(
+            x=x[mask], y=y[mask], mode="markers", name=label, marker=marker,
+            text=names[mask], customdata=represents[mask],
+            hovertemplate="%{text}<br>" + x_title + ": %{x:,.0f}<br>" + y_title + ": %{y:,.0f}"
+                          "<br>stands for %{customdata} player(s)<extra></extra>",
+        ))
+    figure.update_layout(xaxis_title=x_title, yaxis_title=y_title, **_LAYOUT)
+    if log_x:
+        figure.update_xaxes(type="log")
+    return figure
+
+
+def radar_figure(values, names, attributes):
+    """Radar of attribute values (players x attributes) on the 1-20 attribute scale"""
+    figure = go.Figure()
+    closed = list(attributes) + [attributes[0]]
+    for name, row in zip(names, np.asarray(values, dtype=float)):
+        figure.add_trace(go.Scatterpolar(r=np.append(row, row[0]), theta=closed, name=str(name), fill="toself", opacity=0.5))
+    figure.update_layout(polar=dict(radialaxis=dict(range=[0, 20])), **_LAYOUT)
+    return figure
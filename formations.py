@@ -0,0 +1,97 @@
+"""Formation registry shared by the automatic and custom teambuilders.
+
+A formation is a list of lines (back to front), each line a list of
+(slot label, role) tuples. Roles are the keys of WEIGHTS_BY_ROLE so every
+formation can be scored from the same players x roles score matrix.
+"""
+
+ROLES = ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']
+ROLE_INDEX = {role: i for i, role in enumerate(ROLES)}
+
+DEFAULT_FORMATION = "4-2-3-1"
+
+FORMATIONS = {
+    "4-2-3-1": [
+        [("GK", "GK")],
+        [("RB", "DL/DR"), ("CB", "CB"), ("CB", "CB"), ("LB", "DL/DR")],
+        [("DM", "DM"), ("DM", "DM")],
+        [("AMR", "AML/AMR"), ("AMC", "AMC"), ("AML", "AML/AMR")],
+        [("ST", "ST")],
+    ],
+    "4-4-2": [
+        [("GK", "GK")],
+        [("RB", "DL/DR"), ("CB", "CB"), ("CB", "CB"), ("LB", "DL/DR")],
+        [("MR", "ML/MR"), ("CM", "CM"), ("CM", "CM"), ("ML", "ML/MR")],
+        [("ST", "ST"), ("ST", "ST")],
+    ],
+    "4-3-3": [
+        [("GK", "GK")],
+        [("RB", "DL/DR"), ("CB", "CB"), ("CB", "CB"), ("LB", "DL/DR")],
+        [("DM", "DM")],
+        [("CM", "CM"), ("CM", "CM")],
+        [("AMR", "AML/AMR"), ("ST", "ST"), ("AML", "AML/AMR")],
+    ],
+    "4-1-2-1-2": [
+        [("GK", "GK")],
+        [("RB", "DL/DR"), ("CB", "CB"), ("CB", "CB"), ("LB", "DL/DR")],
+        [("DM", "DM")],
+        [("CM", "CM"), ("CM", "CM")],
+        [("AMC", "AMC")],
+        [("ST", "ST"), ("ST", "ST")],
+    ],
+    "3-5-2": [
+        [("GK", "GK")],
+        [("CB", "CB"), ("CB", "CB"), ("CB", "CB")],
+        [("DM", "DM")],
+        [("WBR", "WBL/WBR"), ("CM", "CM"), ("CM", "CM"), ("WBL", "WBL/WBR")],
+        [("ST", "ST"), ("ST", "ST")],
+    ],
+    "3-4-3": [
+        [("GK", "GK")],
+        [("CB", "CB"), ("CB", "CB"), ("CB", "CB")],
+        [("MR", "ML/MR"), ("CM", "CM"), ("CM", "CM"), ("ML", "ML/MR")],
+        [("AMR", "AML/AMR"), ("ST", "ST"), ("AML", "AML/AMR")],
+    ],
+    "5-2-1-2": [
+        [("GK", "GK")],
+        [("WBR", "WBL/WBR"), ("CB", "CB"), ("CB", "CB"), ("CB", "CB"), ("WBL", "WBL/WBR")],
+        [("CM", "CM"), ("CM", "CM")],
+        [("AMC", "AMC")],
+        [("ST", "ST"), ("ST", "ST")],
+    ],
+    "5-3-2": [
+        [("GK", "GK")],
+        [("WBR", "WBL/WBR"), ("CB", "CB"), ("CB", "CB"), ("CB", "CB"), ("WBL", "WBL/WBR")],
+        [("DM", "DM")],
+        [("CM", "CM"), ("CM", "CM")],
+        [("ST", "ST"), ("ST", "ST")],
+    ],
+}
+
+
+def formation_positions(name):
+    """Flat list of (slot label, role) for a formation, in assignment column order"""
+    return [slot for line in FORMATIONS[name] for slot in line]
+
+
+def formation_slot_keys(name):
+    """Unique slot labels (CB1, CB2, ...) for widget keys and custom selections"""
+    positions = formation_positions(name)
+    totals = {}
+    for label, _ in positions:
+        totals[label] = totals.get(label, 0) + 1
+
+    seen = {}
+    keys = []
+    for label, _ in positions:
+        if totals[label] > 1:
+            seen[label] = seen.get(label, 0) + 1
+            keys.append(f"{label}{seen[label]}")
+        else:
+            keys.append(label)
+    return keys
+
+
+def formation_role_columns(name):
+    """Column indices into the shared players x ROLES score matrix"""
+    return [ROLE_INDEX[role] for _, role in formation_positions(name)]
@@ -0,0 +1,124 @@
+"""Synthetic FM24 squad/search view HTML exports for benchmarks and manual testing.
+
+    python generate_export.py 10000 --output search_10k.html --duplicate-rate 0.05
+
+The exports mimic what FM24's "Print screen -> Web page" produces: a
+single <table> with abbreviated attribute headers, accented names,
+multi-position strings, Inf codes and transfer value ranges. Knobs cover
+the awkward cases the pipeline has to cope with: players repeated across
+views, repeated header columns, missing attribute columns and blank cells.
+"""
+import argparse
+import html
+import random
+
+from pipeline import ABBR_MAP
+
+ATTRIBUTE_HEADERS = [abbr for abbr, name in ABBR_MAP.items() if abbr != name and abbr != "LTh"] + ["Weaker Foot"]
+INFO_HEADERS = ["Inf", "Name", "Age", "Position", "Transfer Value"]
+
+FIRST_NAMES = [
+    "João", "José", "Luís", "André", "Sébastien", "Jérôme", "Noé", "Éric", "Iñaki", "Álvaro",
+    "Óscar", "Ángel", "Mikaël", "Zoë", "Søren", "Bjørn", "Łukasz", "Mário", "Çağlar", "Ömer",
+    "James", "Tom", "Lucas", "Marco", "David", "Daniel", "Kai", "Leon", "Adam", "Ryan",
+]
+LAST_NAMES = [
+    "Gonçalves", "Muñoz", "Peña", "Núñez", "Sánchez", "Müller", "Schürrle", "Ødegaard", "Kovačić", "Modrić",
+    "Dembélé", "Lemaître", "Özil", "Çalhanoğlu", "Håland", "Szczęsny", "Fernández", "Gündoğan", "Jović", "Ibáñez",
+    "Smith", "Jones", "Brown", "Taylor", "Wilson", "Silva", "Santos", "Rossi", "Kane", "Walker",
+]
+POSITIONS = [
+    "GK", "D (C)", "D (R)", "D (L)", "D (RL)", "WB (R)", "WB (L)", "DM", "M (C)", "M (R)", "M (L)",
+    "AM (C)", "AM (R)", "AM (L)", "AM (RL)", "ST (C)", "D (C), DM", "D/WB (R)", "DM, M (C)",
+    "M/AM (R)", "AM (RLC)", "AM (C), ST (C)", "D (RLC), DM, M (C)",
+]
+INF_CODES = ["", "", "", "", "", "", "Inj", "Ban", "Sus", "Int", "Wnt", "Lst", "Yth", "PR"]
+
+
+def _transfer_value(rng):
+    """FM style transfer value: single figure, range, or not for sale"""
+    def money(v):
+        return f"€{v / 1000:.0f}K" if v < 1_000_000 else f"€{v / 1_000_000:.1f}M"
+
+    roll = rng.random()
+    if roll < 0.05:
+        return "Not for Sale"
+    low = rng.choice([50_000, 250_000, 1_000_000, 5_000_000, 20_000_000]) * rng.uniform(0.5, 3.0)
+    if roll < 0.55:
+        return money(low)
+    return f"{money(low)} - {money(low * rng.uniform(1.2, 3.0))}"
+
+
+def generate_export(n_players, duplicate_rate=0.05, repeated_columns=1, missing_attributes=2,
+                    missing_cell_rate=0.01, accent_rate=0.5, seed=0):
+    """HTML text of an export with n_players rows (duplicates included in the count)"""
+    rng = random.Random(seed)
+
+    attributes = list(ATTRIBUTE_HEADERS)
+    for abbr in rng.sample(attributes, min(missing_attributes, len(attributes))):
+        attributes.remove(abbr)
+    headers = INFO_HEADERS + attributes + rng.sample(attributes, min(repeated_columns, len(attributes)))
+
+    plain_first = [n for n in FIRST_NAMES if n.isascii()]
+    plain_last = [n for n in LAST_NAMES if n.isascii()]
+
+    players = []
+    for i in range(n_players):
+        if players and rng.random() < duplicate_rate:
+            # Same player seen again in another view, with slightly different ratings
+            base = rng.choice(players)
+            row = dict(base, **{a: str(max(1, min(20, int(base[a]) + rng.choice([-1, 0, 1])))) for a in attributes})
+        else:
+            accented = rng.random() < accent_rate
+            first = rng.choice(FIRST_NAMES if accented else plain_first)
+            last = rng.choice(LAST_NAMES if accented else plain_last)
+            quality = rng.gauss(11, 3)
+            row = {
+                "Inf": rng.choice(INF_CODES),
+                "Name": f"{first} {last} {i}",
+                "Age": str(rng.randint(15, 38)),
+                "Position": rng.choice(POSITIONS),
+                "Transfer Value": _transfer_value(rng),
+            }
+            for abbr in attributes:
+                row[abbr] = str(max(1, min(20, round(rng.gauss(quality, 2.5)))))
+        players.append(row)
+
+    out = ["<html><head><meta charset=\"utf-8\"></head><body><table>"]
+    out.append("<tr>" + "".join(f"<th>{html.escape(h)}</th>" for h in headers) + "</tr>")
+    for row in players:
+        cells = []
+        for header in headers:
+            value = row[header]
+            if header in attributes and rng.random() < missing_cell_rate:
+                value = "-"
+            cells.append(f"<td>{html.escape(value)}</td>")
+        out.append("<tr>" + "".join(cells) + "</tr>")
+    out.append("</table></body></html>")
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic FM24 HTML export")
+    parser.add_argument("players", type=int, help="number of rows, duplicates included")
+    parser.add_argument("--output", default=None, help="output file (default: export_<players>.html)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--repeated-columns", type=int, default=1)
+    parser.add_argument("--missing-attributes", type=int, default=2)
+    parser.add_argument("--missing-cell-rate", type=float, default=0.01)
+    parser.add_argument("--accent-rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text = generate_export(
+        args.players, args.duplicate_rate, args.repeated_columns, args.missing_attributes,
+        args.missing_cell_rate, args.accent_rate, args.seed
+    )
+    output = args.output or f"export_{args.players}.html"
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Wrote {args.players} players to {output}")
+
+
+if __name__ == "__main__":
+    main()
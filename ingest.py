@@ -0,0 +1,132 @@
+"""Background ingestion of uploaded files.
+
+Parsing a large export can take minutes, so it runs in a worker thread
+that outlives the script rerun that started it. The job is kept in session
+state: later reruns (any click) read its progress and finished files
+instead of starting over, and only a different set of uploads replaces it.
+"""
+import threading
+import time
+
+from instrumentation import RerunTrace
+
+
+class IngestCancelled(Exception):
+    """Raised inside the worker when the job has been cancelled"""
+
+
+class FileProgress:
+    """Progress and outcome of one file in a job"""
+
+    def __init__(self, name, file_key, total_bytes):
+        self.name = name
+        self.file_key = file_key
+        self.total_bytes = total_bytes or 0
+        self.bytes_read = 0
+        self.rows = 0
+        self.status = "queued"  # queued, parsing, done, failed, cancelled
+        self.result = None
+        self.error = None
+        # Parse/merge spans recorded by the worker, adopted by the rerun that first shows the file
+        self.trace = None
+
+
+class IngestJob:
+    """Parse a set of uploads one file at a time in a daemon thread.
+
+    process(file_key, uploaded, on_chunk, trace) returns (df, error) for one
+    file and must call on_chunk(bytes_read, rows) as it goes; that is where
+    progress is recorded and cancellation takes effect. Its stages go in
+    trace, a RerunTrace of the file's own.
+    """
+
+    def __init__(self, upload_key, uploads, process):
+        self.upload_key = upload_key
+        self.files = [FileProgress(name, file_key, size) for name, file_key, size, _ in uploads]
+        self._uploads = [uploaded for _, _, _, uploaded in uploads]
+        self._process = process
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._reported = set()
+        self.started_at = time.time()
+        self.finished_at = None
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{upload_key[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or timeout passes, returns done"""
+        return self._done.wait(timeout)
+
+    def _run(self):
+        try:
+            for progress, uploaded in zip(self.files, self._uploads):
+                if self._cancel.is_set():
+                    progress.status = "cancelled"
+                    continue
+                self._run_file(progress, uploaded)
+        finally:
+            self._uploads = []
+            self.finished_at = time.time()
+            self._done.set()
+
+    def _run_file(self, progress, uploaded):
+        def on_chunk(bytes_read, rows):
+            progress.bytes_read, progress.rows = bytes_read, rows
+            if self._cancel.is_set():
+                raise IngestCancelled()
+
+        progress.status = "parsing"
+        progress.trace = RerunTrace()
+        try:
+            df, error = self._process(progress.file_key, uploaded, on_chunk, progress.trace)
+        except IngestCancelled:
+            progress.status = "cancelled"
+            return
+        except Exception as exc:  # A broken file must not take the other files down
+            df, error = None, f"{type(exc).__name__}: {exc}"
+
+        with self._lock:
+            progress.result, progress.error = df, error
+            progress.bytes_read = progress.total_bytes
+            progress.rows = 0 if df is None else len(df)
+            progress.status = "failed" if df is None else "done"
+
+    def finished_files(self):
+        """Files that have been fully processed (parsed or failed), in upload order"""
+        with self._lock:
+            return [f for f in self.files if f.status in ("done", "failed")]
+
+    def unreported_files(self):
+        """Finished files not returned by an earlier call, so each file's timings are shown once"""
+        with self._lock:
+            files = [f for f in self.files if f.status in ("done", "failed") and id(f) not in self._reported]
+            self._reported.update(id(f) for f in files)
+        return files
+
+    def fraction(self):
+        """Share of the uploaded bytes processed so far"""
+        total = sum(f.total_bytes for f in self.files)
+        if total == 0:
+            return 1.0 if self.done else 0.0
+        return min(1.0, sum(f.bytes_read for f in self.files) / total)
+
+    def rows_parsed(self):
+        return sum(f.rows for f in self.files)
+
+    def current_file(self):
+        return next((f for f in self.files if f.status == "parsing"), None)
@@ -0,0 +1,133 @@
+"""Lightweight per-rerun stage timings for the Performance panel.
+
+A RerunTrace is created at the top of every script run; pipeline stages
+are wrapped in trace.stage(...) to record their start offset, wall time,
+rows, cache hits/misses (from the registry's per-thread counters) and the
+size of what they produced. When tracemalloc is already running (the
+profiling mode), the peak traced bytes inside each stage are recorded too;
+that resets tracemalloc's own peak, so whole-rerun peaks come from
+traced_memory() instead.
+"""
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import cache_registry
+
+_PEAK_LOCK = threading.Lock()
+_reset_peak = 0  # Highest traced peak wiped by the stages' reset_peak() calls
+
+
+class Span:
+    """One timed stage of a rerun"""
+
+    def __init__(self, name, offset, rows=None):
+        self.name = name
+        self.offset = offset
+        self.seconds = 0.0
+        self.rows = rows
+        self.bytes = None
+        self.peak_traced_bytes = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def output(self, value, rows=None):
+        """Record the stage's result size (and row count, defaulting to len(value)).
+
+        A value that came from the cache registry uses the size it measured
+        when the entry was stored; anything else gets a shallow estimate, so
+        this stays cheap on every rerun.
+        """
+        nbytes = cache_registry.known_nbytes(value)
+        self.bytes = nbytes if nbytes is not None else cache_registry.estimate_nbytes(value, deep=False)
+        if rows is not None:
+            self.rows = int(rows)
+        elif self.rows is None and hasattr(value, '__len__'):
+            self.rows = len(value)
+        return value
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "start_ms": round(self.offset * 1000, 3),
+            "wall_ms": round(self.seconds * 1000, 3),
+            "rows": self.rows,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "bytes": self.bytes,
+            "peak_traced_bytes": self.peak_traced_bytes,
+        }
+
+
+class RerunTrace:
+    """Stage spans for a single script rerun"""
+
+    def __init__(self, tag=None):
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.tag = tag or {}
+        self.spans = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        span = Span(name, time.perf_counter() - self._origin, rows)
+        hits, misses = cache_registry.thread_counters()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            base = _start_stage_peak()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - self._origin - span.offset
+            new_hits, new_misses = cache_registry.thread_counters()
+            span.cache_hits, span.cache_misses = new_hits - hits, new_misses - misses
+            if tracing and tracemalloc.is_tracing():
+                span.peak_traced_bytes = max(0, tracemalloc.get_traced_memory()[1] - base)
+            self.spans.append(span)
+
+    def adopt(self, other):
+        """Append another trace's spans (e.g. from a worker thread) on this trace's clock"""
+        shift = other._origin - self._origin
+        for span in other.spans:
+            span.offset += shift
+            self.spans.append(span)
+
+    def total_seconds(self):
+        return time.perf_counter() - self._origin
+
+    def to_dict(self):
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "tag": self.tag,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+def traced_memory():
+    """(current, peak) traced bytes, with the peak also covering what the stages reset"""
+    current, peak = tracemalloc.get_traced_memory()
+    with _PEAK_LOCK:
+        return current, max(peak, _reset_peak)
+
+
+def clear_traced_peak():
+    """Start a new peak, e.g. at the start of a profiled rerun"""
+    global _reset_peak
+    with _PEAK_LOCK:
+        _reset_peak = 0
+        tracemalloc.reset_peak()
+
+
+def _start_stage_peak():
+    """Reset the tracemalloc peak for one stage, keeping the old peak for traced_memory()"""
+    global _reset_peak
+    with _PEAK_LOCK:
+        current, peak = tracemalloc.get_traced_memory()
+        _reset_peak = max(_reset_peak, peak)
+        tracemalloc.reset_peak()
+        return current
@@ -0,0 +1,639 @@
+"""Data pipeline stages: HTML parsing, column merging, deduplication and scoring.
+
+Plain pandas/numpy with no Streamlit, so the app can wrap each stage in its
+cache and benchmark.py can time them on their own.
+"""
+import codecs
+import re
+import sys
+from html.parser import HTMLParser
+
+import numpy as np
+import pandas as pd
+
+from assignment import build_top_k_index
+from formations import ROLES, formation_role_columns
+from sketches import DEFAULT_K, sketch_columns
+
+CANONICAL_ATTRIBUTES = [
+    "Corners", "Crossing", "Dribbling", "Finishing", "First Touch", "Free Kick Taking",
+    "Heading", "Long Shots", "Long Throws", "Marking", "Passing", "Penalty Taking",
+    "Tackling", "Technique", "Aggression", "Anticipation", "Bravery", "Composure",
+    "Concentration", "Decisions", "Determination", "Flair", "Leadership", "Off The Ball",
+    "Positioning", "Teamwork", "Vision", "Work Rate", "Acceleration", "Agility",
+    "Balance", "Jumping Reach", "Natural Fitness", "Pace", "Stamina", "Strength",
+    "Weaker Foot", "Aerial Reach", "Command of Area", "Communication", "Eccentricity",
+    "Handling", "Kicking", "One on Ones", "Punching (Tendency)", "Reflexes",
+    "Rushing Out (Tendency)", "Throwing"
+]
+
+WEIGHTS_BY_ROLE = {
+    "GK": {
+        "Corners": 0.0, "Crossing": 0.0, "Dribbling": 0.0, "Finishing": 0.0, "First Touch": 0.0, "Free Kick Taking": 0.0,
+        "Heading": 1.0, "Long Shots": 0.0, "Long Throws": 0.0, "Marking": 0.0, "Passing": 0.0, "Penalty Taking": 0.0,
+        "Tackling": 0.0, "Technique": 1.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 6.0, "Composure": 2.0,
+        "Concentration": 6.0, "Decisions": 10.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 2.0, "Off The Ball": 0.0,
+        "Positioning": 5.0, "Teamwork": 2.0, "Vision": 1.0, "Work Rate": 1.0, "Acceleration": 6.0, "Agility": 8.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 3.0, "Stamina": 1.0, "Strength": 4.0,
+        "Weaker Foot": 3.0, "Aerial Reach": 6.0, "Command of Area": 6.0, "Communication": 5.0, "Eccentricity": 0.0,
+        "Handling": 8.0, "Kicking": 5.0, "One on Ones": 4.0, "Punching (Tendency)": 0.0, "Reflexes": 8.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 3.0
+    },
+    "DL/DR": {
+        "Corners": 1.0, "Crossing": 2.0, "Dribbling": 1.0, "Finishing": 1.0, "First Touch": 3.0, "Free Kick Taking": 1.0,
+        "Heading": 2.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 2.0, "Penalty Taking": 1.0,
+        "Tackling": 4.0, "Technique": 2.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 2.0, "Composure": 2.0,
+        "Concentration": 4.0, "Decisions": 7.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 1.0,
+        "Positioning": 4.0, "Teamwork": 2.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 7.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 2.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 6.0, "Strength": 4.0,
+        "Weaker Foot": 4.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "CB": {
+        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 1.0, "Finishing": 1.0, "First Touch": 2.0, "Free Kick Taking": 1.0,
+        "Heading": 5.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 8.0, "Passing": 2.0, "Penalty Taking": 1.0,
+        "Tackling": 5.0, "Technique": 1.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 2.0, "Composure": 2.0,
+        "Concentration": 4.0, "Decisions": 10.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 2.0, "Off The Ball": 1.0,
+        "Positioning": 8.0, "Teamwork": 1.0, "Vision": 1.0, "Work Rate": 2.0, "Acceleration": 6.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 6.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 3.0, "Strength": 6.0,
+        "Weaker Foot": 4.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "WBL/WBR": {
+        "Corners": 1.0, "Crossing": 3.0, "Dribbling": 2.0, "Finishing": 1.0, "First Touch": 3.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 1.0, "Long Throws": 1.0, "Marking": 2.0, "Passing": 3.0, "Penalty Taking": 1.0,
+        "Tackling": 3.0, "Technique": 3.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 2.0,
+        "Concentration": 3.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
+        "Positioning": 3.0, "Teamwork": 2.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 8.0, "Agility": 5.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 6.0, "Stamina": 7.0, "Strength": 4.0,
+        "Weaker Foot": 4.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "DM": {
+        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 2.0, "Finishing": 2.0, "First Touch": 4.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 4.0, "Penalty Taking": 1.0,
+        "Tackling": 7.0, "Technique": 3.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 1.0, "Composure": 2.0,
+        "Concentration": 3.0, "Decisions": 8.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 1.0,
+        "Positioning": 5.0, "Teamwork": 2.0, "Vision": 4.0, "Work Rate": 4.0, "Acceleration": 6.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 4.0, "Stamina": 4.0, "Strength": 5.0,
+        "Weaker Foot": 5.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "ML/MR": {
+        "Corners": 1.0, "Crossing": 5.0, "Dribbling": 3.0, "Finishing": 2.0, "First Touch": 4.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 3.0, "Penalty Taking": 1.0,
+        "Tackling": 2.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 2.0,
+        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
+        "Positioning": 1.0, "Teamwork": 2.0, "Vision": 3.0, "Work Rate": 3.0, "Acceleration": 8.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 6.0, "Stamina": 5.0, "Strength": 3.0,
+        "Weaker Foot": 5.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "CM": {
+        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 2.0, "Finishing": 2.0, "First Touch": 6.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 3.0, "Passing": 6.0, "Penalty Taking": 1.0,
+        "Tackling": 3.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
+        "Concentration": 2.0, "Decisions": 7.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 3.0,
+        "Positioning": 3.0, "Teamwork": 2.0, "Vision": 6.0, "Work Rate": 3.0, "Acceleration": 6.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 5.0, "Stamina": 6.0, "Strength": 4.0,
+        "Weaker Foot": 6.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "AML/AMR": {
+        "Corners": 1.0, "Crossing": 5.0, "Dribbling": 5.0, "Finishing": 2.0, "First Touch": 5.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 2.0, "Penalty Taking": 1.0,
+        "Tackling": 2.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
+        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 2.0,
+        "Positioning": 1.0, "Teamwork": 2.0, "Vision": 3.0, "Work Rate": 3.0, "Acceleration": 10.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 10.0, "Stamina": 7.0, "Strength": 3.0,
+        "Weaker Foot": 5.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "AMC": {
+        "Corners": 1.0, "Crossing": 1.0, "Dribbling": 3.0, "Finishing": 3.0, "First Touch": 5.0, "Free Kick Taking": 1.0,
+        "Heading": 1.0, "Long Shots": 3.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 4.0, "Penalty Taking": 1.0,
+        "Tackling": 2.0, "Technique": 5.0, "Aggression": 0.0, "Anticipation": 3.0, "Bravery": 1.0, "Composure": 3.0,
+        "Concentration": 2.0, "Decisions": 6.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 3.0,
+        "Positioning": 2.0, "Teamwork": 2.0, "Vision": 6.0, "Work Rate": 3.0, "Acceleration": 9.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 1.0, "Natural Fitness": 0.0, "Pace": 7.0, "Stamina": 6.0, "Strength": 3.0,
+        "Weaker Foot": 7.0, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    },
+    "ST": {
+        "Corners": 1.0, "Crossing": 2.0, "Dribbling": 5.0, "Finishing": 8.0, "First Touch": 6.0, "Free Kick Taking": 1.0,
+        "Heading": 6.0, "Long Shots": 2.0, "Long Throws": 1.0, "Marking": 1.0, "Passing": 2.0, "Penalty Taking": 1.0,
+        "Tackling": 1.0, "Technique": 4.0, "Aggression": 0.0, "Anticipation": 5.0, "Bravery": 1.0, "Composure": 6.0,
+        "Concentration": 2.0, "Decisions": 5.0, "Determination": 0.0, "Flair": 0.0, "Leadership": 1.0, "Off The Ball": 6.0,
+        "Positioning": 2.0, "Teamwork": 1.0, "Vision": 2.0, "Work Rate": 2.0, "Acceleration": 10.0, "Agility": 6.0,
+        "Balance": 2.0, "Jumping Reach": 5.0, "Natural Fitness": 0.0, "Pace": 7.0, "Stamina": 6.0, "Strength": 6.0,
+        "Weaker Foot": 7.5, "Aerial Reach": 0.0, "Command of Area": 0.0, "Communication": 0.0, "Eccentricity": 0.0,
+        "Handling": 0.0, "Kicking": 0.0, "One on Ones": 0.0, "Punching (Tendency)": 0.0, "Reflexes": 0.0,
+        "Rushing Out (Tendency)": 0.0, "Throwing": 0.0
+    }
+}
+
+ABBR_MAP = {
+    "Name": "Name", "Position": "Position", "Inf": "Inf", "Age": "Age", "Transfer Value": "Transfer Value",
+    "Cor": "Corners", "Cro": "Crossing", "Dri": "Dribbling", "Fin": "Finishing", "Fir": "First Touch", "Fre": "Free Kick Taking",
+    "Hea": "Heading", "Lon": "Long Shots", "L Th": "Long Throws", "LTh": "Long Throws", "Mar": "Marking", "Pas": "Passing", "Pen": "Penalty Taking",
+    "Tck": "Tackling", "Tec": "Technique", "Agg": "Aggression", "Ant": "Anticipation", "Bra": "Bravery", "Cmp": "Composure", "Cnt": "Concentration",
+    "Dec": "Decisions", "Det": "Determination", "Fla": "Flair", "Ldr": "Leadership", "OtB": "Off The Ball", "Pos": "Positioning", "Tea": "Teamwork", "Vis": "Vision", "Wor": "Work Rate",
+    "Acc": "Acceleration", "Agi": "Agility", "Bal": "Balance", "Jum": "Jumping Reach", "Nat": "Natural Fitness", "Pac": "Pace", "Sta": "Stamina", "Str": "Strength",
+    "Weaker Foot": "Weaker Foot", "Aer": "Aerial Reach", "Cmd": "Command of Area", "Com": "Communication", "Ecc": "Eccentricity", "Han": "Handling", "Kic": "Kicking",
+    "1v1": "One on Ones", "Pun": "Punching (Tendency)", "Ref": "Reflexes", "TRO": "Rushing Out (Tendency)", "Thr": "Throwing"
+}
+
+TEXT_COLUMNS = ("Name", "Position", "Transfer Value", "Inf")
+# Columns whose few distinct values are interned rather than stored once per row
+INTERNED_COLUMNS = ("Position", "Inf")
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+STREAM_CHUNK_BYTES = 1 << 20
+
+
+class _PlayerTableParser(HTMLParser):
+    """Incremental parser for the first <table> of an export.
+
+    Rows are handed to the column buffers as soon as they close, so only the
+    current row is ever held as Python strings. Cells that are not closed
+    explicitly end at the next cell or row, like a browser would.
+    """
+
+    def __init__(self, capacity_hint=None):
+        super().__init__(convert_charrefs=True)
+        self.capacity_hint = capacity_hint
+        self.table_depth = 0
+        self.table_done = False
+        self.found_table = False
+        self.header = None
+        self.row = None
+        self.cell = None
+        self.text = []
+        self.columns = None
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if self.table_done:
+            return
+        if tag == "table":
+            self.found_table = True
+            self.table_depth += 1
+        elif self.table_depth == 0:
+            return
+        elif tag == "tr":
+            self._close_row()
+            self.row = []
+        elif tag in ("td", "th") and self.row is not None:
+            self._close_cell()
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if self.table_depth == 0 or self.table_done:
+            return
+        if tag in ("td", "th"):
+            self._close_cell()
+        elif tag == "tr":
+            self._close_row()
+        elif tag == "table":
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self._close_row()
+                self.table_done = True
+
+    def handle_data(self, data):
+        # Text can arrive split across feeds, so it is only stripped once a tag ends it
+        if self.cell is not None:
+            self.text.append(data)
+
+    def _end_text(self):
+        if self.text:
+            text = "".join(self.text).strip()
+            self.text = []
+            if text and self.cell is not None:
+                self.cell.append(text)
+
+    def _close_cell(self):
+        self._end_text()
+        if self.cell is not None:
+            self.row.append("".join(self.cell))
+            self.cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self.row is None:
+            return
+        row, self.row = self.row, None
+        if self.header is None:
+            self.header = [ABBR_MAP.get(h, h) for h in row]
+            self.columns = _ColumnBuffers(self.header, self.capacity_hint)
+        else:
+            self.columns.append(row)
+
+
+class _ColumnBuffers:
+    """Typed per-column storage that rows are appended to as they are parsed.
+
+    Numeric columns share one preallocated float64 buffer (grown by half
+    again when full) that the finished frame's columns are views of; text
+    columns are plain lists. A repeated header keeps
+    its last cell, as the dict-per-row parser it replaces did.
+    """
+
+    def __init__(self, header, capacity_hint=None):
+        last_index = {name: i for i, name in enumerate(header) if name}
+        self.names = list(last_index)
+        self.width = len(header)
+        self.name_index = last_index.get("Name")
+        self.text = {name: [] for name in self.names if name in TEXT_COLUMNS}
+        self.text_sources = [(last_index[name], self.text[name], name in INTERNED_COLUMNS) for name in self.text]
+        self.numeric_names = [name for name in self.names if name not in TEXT_COLUMNS]
+        self.numeric_sources = [last_index[name] for name in self.numeric_names]
+        # One row per column, so each finished column is a contiguous slice
+        self.values = np.empty((len(self.numeric_names), max(int(capacity_hint or 0), 256)), dtype=np.float64)
+        self.decimal = [False] * len(self.numeric_names)
+        self.n_rows = 0
+
+    def reserve(self, n_rows):
+        """Grow the numeric block to hold n_rows without further resizing"""
+        if n_rows > self.values.shape[1]:
+            grown = np.empty((self.values.shape[0], n_rows), dtype=np.float64)
+            grown[:, :self.n_rows] = self.values[:, :self.n_rows]
+            self.values = grown
+
+    def append(self, cells):
+        if not cells or not any(cells):
+            return
+        if len(cells) < self.width:
+            cells += [""] * (self.width - len(cells))
+
+        name = cells[self.name_index].strip() if self.name_index is not None else ""
+        if not name or name.lower() == "name":
+            return
+
+        capacity = self.values.shape[1]
+        if self.n_rows == capacity:
+            self.reserve(capacity + capacity // 2)
+        out = self.values[:, self.n_rows]
+        for j, i in enumerate(self.numeric_sources):
+            match = NUMBER_PATTERN.search(cells[i])
+            if match is None:
+                out[j] = np.nan
+                continue
+            number = match.group()
+            out[j] = float(number)
+            if "." in number:
+                self.decimal[j] = True
+        for i, column, intern in self.text_sources:
+            column.append(sys.intern(cells[i]) if intern else cells[i])
+        self.n_rows += 1
+
+    def to_frame(self):
+        n = self.n_rows
+        values = self.values[:, :n]
+        if n < 0.9 * self.values.shape[1]:
+            values = values.copy()  # Let the unused tail of the buffer go
+        self.values = None
+
+        columns = {}
+        for j, name in enumerate(self.numeric_names):
+            column = values[j]
+            # Whole numbers without blanks become int64 in place, as pd.to_numeric gives
+            if not self.decimal[j] and not np.isnan(column).any():
+                ints = column.astype(np.int64)
+                column = column.view(np.int64)
+                column[:] = ints
+            columns[name] = column
+        columns.update(self.text)
+        df = pd.DataFrame({name: columns[name] for name in self.names}, copy=False)
+        if "Age" in df.columns:
+            df["Age"] = df["Age"].astype("Int64")
+        return df
+
+
+def _parse_result(parser):
+    if not parser.found_table:
+        return None, "No <table> found in HTML."
+    if parser.header is None:
+        return None, "No rows in table."
+    if parser.columns.n_rows == 0:
+        return None, "No data rows parsed from HTML table."
+    return parser.columns.to_frame(), None
+
+
+def parse_players_from_stream(stream, total_bytes=None, chunk_bytes=STREAM_CHUNK_BYTES, encoding="utf-8",
+                              on_chunk=None):
+    """Parse an export from a binary file object without holding the decoded text.
+
+    Bytes are decoded and fed to the parser a chunk at a time and each row
+    goes straight into typed column buffers, so peak memory stays close to
+    the finished frame. total_bytes (the upload size) pre-sizes the buffers
+    once the first chunk shows how long a row is. on_chunk(bytes_read, rows)
+    is called after every chunk, for progress reporting.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    parser = _PlayerTableParser()
+    consumed = 0
+    while not parser.table_done:
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            break
+        parser.feed(decoder.decode(chunk))
+        consumed += len(chunk)
+        if total_bytes and consumed == len(chunk) and parser.columns is not None and parser.columns.n_rows:
+            parser.columns.reserve(int(total_bytes / consumed * parser.columns.n_rows * 1.05) + 16)
+        if on_chunk is not None:
+            on_chunk(consumed, parser.columns.n_rows if parser.columns is not None else 0)
+    if not parser.table_done:
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        parser._close_row()
+    return _parse_result(parser)
+
+
+def parse_players_from_html(html_text: str):
+    """Parse an export that is already decoded to text"""
+    parser = _PlayerTableParser()
+    parser.feed(html_text)
+    parser.close()
+    if not parser.table_done:
+        parser._close_row()
+    return _parse_result(parser)
+
+def merge_duplicate_columns(df: pd.DataFrame) -> pd.DataFrame:
+    cols = list(df.columns)
+    if not any(cols.count(c) > 1 for c in cols):
+        return df
+
+    unique_order = []
+    for c in cols:
+        if c not in unique_order:
+            unique_order.append(c)
+
+    merged = pd.DataFrame(index=df.index)
+    for col in unique_order:
+        same_cols = [c for c in cols if c == col]
+        if len(same_cols) == 1:
+            merged[col] = df[col]
+        else:
+            subset = df.loc[:, same_cols]
+            subset_num = subset.apply(pd.to_numeric, errors="coerce")
+            if subset_num.notna().sum().sum() > 0:
+                merged[col] = subset_num.mean(axis=1)
+            else:
+                merged[col] = subset.apply(lambda r: next((v for v in r if isinstance(v, str) and v.strip()), ""), axis=1)
+
+    return merged
+
+def parse_transfer_value(x):
+    """Parse transfer value strings into numeric values"""
+    try:
+        if pd.isna(x):
+            return 0.0
+        s = str(x).strip()
+        if not s or s == "-" or s.lower() in {"n/a", "none"}:
+            return 0.0
+
+        s2 = re.sub(r'[^0-9\.,kKmM]', '', s)
+        if s2 == "":
+            m = re.search(r'(-?\d+(?:\.\d+)?)', s)
+            if m:
+                try:
+                    return float(m.group(1).replace(',', ''))
+                except Exception:
+                    return 0.0
+            return 0.0
+
+        m = re.match(r'([0-9\.,]+)\s*([kKmM]?)', s2)
+        if not m:
+            try:
+                return float(s2.replace(',', ''))
+            except Exception:
+                return 0.0
+
+        num = m.group(1).replace(',', '')
+        try:
+            val = float(num)
+        except Exception:
+            val = 0.0
+
+        suf = m.group(2).lower()
+        if suf == 'k':
+            val *= 1_000.0
+        elif suf == 'm':
+            val *= 1_000_000.0
+
+        return val
+    except Exception:
+        return 0.0
+
+def known_transfer_value(x):
+    """Transfer value, or NaN when the export gives none ("Not for Sale", "Unknown", "-").
+
+    parse_transfer_value maps those to 0, which is fine as a deduplication
+    tie-break but would make untouchable players look free to a budget.
+    """
+    if pd.isna(x) or not re.search(r'\d', str(x)):
+        return np.nan
+    return parse_transfer_value(x)
+
+def create_name_key(name):
+    """Create name key for deduplication"""
+    if pd.isna(name) or not name:
+        return f"_empty_{id(name)}"
+
+    name_str = str(name).strip()
+    if not name_str:
+        return f"_empty_{id(name)}"
+
+    normalized = re.sub(r'\s+', ' ', name_str.lower().strip())
+    normalized = normalized.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
+    normalized = normalized.replace('ñ', 'n').replace('ç', 'c')
+
+    return normalized
+
+_ACCENTS = str.maketrans('áéíóúñç', 'aeiounc')
+
+def name_keys(names):
+    """create_name_key for a whole column; every empty name gets its own key"""
+    names = pd.Series(names)
+    stripped = names.where(names.notna(), '').astype(str).str.strip()
+    keys = stripped.str.lower().str.replace(r'\s+', ' ', regex=True).str.translate(_ACCENTS)
+    empty = stripped == ''
+    keys[empty] = '_empty_' + pd.Series(np.flatnonzero(empty), index=keys.index[empty]).astype(str)
+    return keys
+
+def deduplicate_players(df):
+    """Deduplicate players by name, keeping best version"""
+    if len(df) <= 1:
+        return df
+
+    df = df.copy()
+    
+    # Nothing to match on without names; callers report the missing column
+    if 'Name' not in df.columns:
+        return df
+    
+    df['_name_key'] = name_keys(df['Name'])
+    df['_transfer_val_numeric'] = df.get('Transfer Value', pd.Series('', index=df.index)).apply(parse_transfer_value)
+
+    # Average score across all roles for deduplication: the mean of the per-role
+    # scores is the score under the mean weights, so this is one matrix product
+    available_attrs = [a for a in CANONICAL_ATTRIBUTES if a in df.columns]
+    if available_attrs:
+        attrs_matrix = df[available_attrs].fillna(0).astype(float).to_numpy()
+        role_weights = np.array([[float(weights.get(a, 0.0)) for weights in WEIGHTS_BY_ROLE.values()] for a in available_attrs])
+        df['_avg_score'] = attrs_matrix.dot(role_weights).mean(axis=1)
+    else:
+        df['_avg_score'] = 0
+
+    df_sorted = df.sort_values(['_avg_score', '_transfer_val_numeric'], ascending=[False, False])
+    df_deduped = df_sorted.groupby('_name_key', sort=False).head(1)
+    df_deduped = df_deduped.drop(columns=['_name_key', '_transfer_val_numeric', '_avg_score'])
+
+    return df_deduped.reset_index(drop=True)
+
+# FM 'Inf' column codes that make a player unavailable (injured, banned/suspended, international duty)
+UNAVAILABLE_INF_FLAGS = ["inj", "ban", "sus", "int"]
+
+def unavailable_mask(df):
+    """Boolean array of players flagged as unavailable in the Inf column"""
+    if 'Inf' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    pattern = r'\b(?:' + '|'.join(UNAVAILABLE_INF_FLAGS) + r')'
+    return df['Inf'].fillna('').astype(str).str.lower().str.contains(pattern, regex=True).to_numpy(dtype=bool)
+
+# FM position codes to ROLES, by side ("" for positions without one)
+POSITION_ROLES = {
+    "GK": {"": "GK"},
+    "D": {"R": "DL/DR", "L": "DL/DR", "C": "CB"},
+    "WB": {"R": "WBL/WBR", "L": "WBL/WBR"},
+    "DM": {"": "DM"},
+    "M": {"R": "ML/MR", "L": "ML/MR", "C": "CM"},
+    "AM": {"R": "AML/AMR", "L": "AML/AMR", "C": "AMC"},
+    "ST": {"C": "ST"},
+}
+POSITION_PART = re.compile(r'([A-Z/]+)\s*(?:\(([RLC]+)\))?')
+ELIGIBILITY_MODES = ["Ignore", "Bonus", "Strict"]
+
+def position_bits(position):
+    """Role bitmask (bit i set for ROLES[i]) of an FM position string like 'D (RL), DM, M (C)'"""
+    bits = 0
+    for bases, sides in POSITION_PART.findall(str(position).upper()):
+        for base in bases.split("/"):
+            sides_to_roles = POSITION_ROLES.get(base)
+            if sides_to_roles is None:
+                continue
+            # A base without sides (GK, DM, a bare "ST") covers every side it has
+            roles = [sides_to_roles[side] for side in sides if side in sides_to_roles] if sides else sides_to_roles.values()
+            for role in roles:
+                bits |= 1 << ROLES.index(role)
+    return bits
+
+def position_masks(positions):
+    """uint16 role bitmask per player, parsing each distinct position string once.
+
+    Players with no recognisable position get every bit, so a missing
+    Position column never masks anyone out.
+    """
+    codes, uniques = pd.factorize(pd.Series(positions).fillna("").astype(str))
+    unique_bits = np.array([position_bits(u) for u in uniques], dtype=np.uint16)
+    unique_bits[unique_bits == 0] = (1 << len(ROLES)) - 1
+    return unique_bits[codes] if len(codes) else np.zeros(0, dtype=np.uint16)
+
+def apply_position_eligibility(role_score_matrix, masks, mode, bonus=0.0, unavailable=None):
+    """players x ROLES scores adjusted for listed positions and unavailability.
+
+    "Bonus" multiplies scores at a player's listed roles by (1 + bonus),
+    "Strict" zeroes every other role, "Ignore" leaves them alone. Players
+    flagged in unavailable are zeroed in every role, so a solve only uses
+    them when nobody else is left.
+    """
+    listed = ((masks[:, None] >> np.arange(len(ROLES), dtype=np.uint16)) & 1).astype(bool)
+    if mode == "Bonus":
+        adjusted = np.where(listed, role_score_matrix * (1.0 + bonus), role_score_matrix)
+    elif mode == "Strict":
+        adjusted = np.where(listed, role_score_matrix, 0.0)
+    else:
+        adjusted = np.array(role_score_matrix, dtype=float)
+    if unavailable is not None:
+        adjusted[unavailable] = 0.0
+    return adjusted
+
+def calculate_role_scores(df_final, available_attrs, k=64):
+    """Attribute matrix, attrs x ROLES weights, players x ROLES scores, per-role top-k index and position masks"""
+    attrs_matrix = df_final[available_attrs].fillna(0).astype(float).to_numpy()
+    role_weights = np.array([[float(WEIGHTS_BY_ROLE[role].get(a, 0.0)) for role in ROLES] for a in available_attrs])
+    role_score_matrix = attrs_matrix.dot(role_weights)
+    return {
+        "attrs": attrs_matrix,
+        "weights": role_weights,
+        "role_scores": role_score_matrix,
+        "top_k": build_top_k_index(role_score_matrix, k),
+        "positions": position_masks(df_final['Position'] if 'Position' in df_final.columns else [""] * len(df_final)),
+    }
+
+def attribute_contributions(attrs_matrix, role_weights, top_k_index, available_attrs, row, role, n_reference=10):
+    """Weight x value per weighted attribute for one player and role, best first.
+
+    Each contribution sits next to the average over the role's top
+    n_reference players (from the top-k index), in the 'Top Avg' column. Only those rows of the
+    attribute matrix are read, so this is cheap enough to run on a click.
+    """
+    j = ROLES.index(role)
+    weights = role_weights[:, j]
+    used = np.flatnonzero(weights)
+    reference = top_k_index[j, :n_reference]
+    contribution = attrs_matrix[row, used] * weights[used]
+    reference_contribution = attrs_matrix[reference][:, used].mean(axis=0) * weights[used] if len(reference) else np.zeros(len(used))
+    breakdown = pd.DataFrame({
+        'Attribute': np.asarray(available_attrs)[used],
+        'Value': attrs_matrix[row, used],
+        'Weight': weights[used],
+        'Contribution': contribution,
+        'Top Avg': reference_contribution,
+        'Difference': contribution - reference_contribution,
+    })
+    breakdown = breakdown.sort_values('Contribution', ascending=False, kind='stable').reset_index(drop=True)
+    # Fewer than n_reference players when the squad is small
+    breakdown.attrs['reference_players'] = len(reference)
+    return breakdown
+
+def role_score_sketches(df, k=DEFAULT_K):
+    """Per-role quantile sketches of one frame's scores, in ROLES order.
+
+    Built per upload and merged, so adding a file only sketches the new
+    rows. Attributes missing from the frame count as 0, as in
+    calculate_role_scores.
+    """
+    attrs = [a for a in CANONICAL_ATTRIBUTES if a in df.columns]
+    if not attrs:
+        return sketch_columns(np.zeros((0, len(ROLES))), k)
+    attrs_matrix = df[attrs].fillna(0).astype(float).to_numpy()
+    role_weights = np.array([[float(WEIGHTS_BY_ROLE[role].get(a, 0.0)) for role in ROLES] for a in attrs])
+    return sketch_columns(attrs_matrix.dot(role_weights), k)
+
+def create_comprehensive_table(df_final, role_scores):
+    """Create the comprehensive player rankings table"""
+    comprehensive_data = {
+        'Rank': range(1, len(df_final) + 1),
+        'Name': df_final['Name'],
+        'Age': df_final.get('Age', pd.Series(['N/A'] * len(df_final)))
+    }
+    
+    # Add scores for each role
+    for role in ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']:
+        comprehensive_data[role] = role_scores[role].round(0).astype(int)
+    
+    return pd.DataFrame(comprehensive_data)
+
+def compute_score_matrix(role_score_matrix, formation_name):
+    """Score matrix for team building, sliced from the shared role score matrix"""
+    return role_score_matrix[:, formation_role_columns(formation_name)]
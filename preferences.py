@@ -0,0 +1,100 @@
+"""Per-user preference files with debounced, atomic writes.
+
+Preferences are read once when a session starts and kept in session state,
+so reruns do no file I/O. Saves are queued and flushed together after a
+short quiet period, or after MAX_WAIT_SECONDS when changes keep coming;
+each file is written to a temp file in the same
+directory and renamed over the old one, so a crash or a concurrent reader
+never sees a half-written file.
+"""
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+PREFS_DIR = os.path.join(".streamlit", "user_preferences")
+# Single shared file used before preferences were per user, read as a fallback
+LEGACY_PREFS_FILE = os.path.join(".streamlit", "user_preferences.json")
+DEBOUNCE_SECONDS = 1.0
+MAX_WAIT_SECONDS = 5.0  # Longest a queued save waits while changes keep coming
+
+# Queued saves and the timer that flushes them, guarded by _LOCK
+_LOCK = threading.Lock()
+_PENDING = {}   # user id -> preferences waiting to be written
+_TIMER = None
+_QUEUED_AT = None  # When the oldest pending save was queued
+
+
+def prefs_path(user_id):
+    """Preference file for a user id (sanitised for use as a file name)"""
+    safe_id = re.sub(r'[^A-Za-z0-9_.@-]', '_', str(user_id))[:128] or "default"
+    return os.path.join(PREFS_DIR, f"{safe_id}.json")
+
+
+def load(user_id, defaults):
+    """Defaults updated with the user's saved preferences (or a pending save)"""
+    prefs = dict(defaults)
+    with _LOCK:
+        if user_id in _PENDING:
+            prefs.update(_PENDING[user_id])
+            return prefs
+
+    for path in (prefs_path(user_id), LEGACY_PREFS_FILE):
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    prefs.update(json.load(f))
+                break
+            except (json.JSONDecodeError, OSError):
+                pass  # Use default preferences if file is corrupted
+    return prefs
+
+
+def save(user_id, prefs):
+    """Queue a write of the user's preferences, debounced across rapid toggles"""
+    global _TIMER, _QUEUED_AT
+    with _LOCK:
+        _PENDING[user_id] = dict(prefs)
+        now = time.monotonic()
+        if _QUEUED_AT is None:
+            _QUEUED_AT = now
+        if _TIMER is not None:
+            _TIMER.cancel()
+        delay = max(0.0, min(DEBOUNCE_SECONDS, _QUEUED_AT + MAX_WAIT_SECONDS - now))
+        _TIMER = threading.Timer(delay, flush)
+        _TIMER.daemon = True
+        _TIMER.start()
+
+
+def flush():
+    """Write every queued preference file now"""
+    global _TIMER, _QUEUED_AT
+    with _LOCK:
+        pending = dict(_PENDING)
+        _PENDING.clear()
+        _TIMER = None
+        _QUEUED_AT = None
+
+    for user_id, prefs in pending.items():
+        _write_atomic(prefs_path(user_id), prefs)
+
+
+def _write_atomic(path, prefs):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".prefs-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(prefs, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+atexit.register(flush)
@@ -0,0 +1,174 @@
+"""Opt-in cProfile and tracemalloc dumps of whole script reruns.
+
+Enabled with PLAYER_RANKER_PROFILE=1 in the environment or ?profile=1 in
+the URL. Each profiled rerun writes a .pstats file (open it with
+`python -m pstats` or snakeviz) and a top-allocations report to profiles/,
+named after the upload fingerprint and player count so a scout's dump can
+be matched to their files.
+
+tracemalloc is process wide (and so is cProfile from Python 3.12), so only
+one rerun is profiled at a time; other sessions run unprofiled meanwhile.
+"""
+import cProfile
+import io
+import linecache
+import os
+import threading
+import time
+import tracemalloc
+import zipfile
+
+import instrumentation
+
+PROFILE_DIR = "profiles"
+ENV_FLAG = "PLAYER_RANKER_PROFILE"
+TOP_ALLOCATIONS = 30
+KEEP_DUMPS = 20  # Oldest dumps beyond this are deleted
+
+_LOCK = threading.Lock()
+_ACTIVE = None  # The RerunProfiler currently holding cProfile/tracemalloc
+
+
+def enabled(url_flag=None):
+    """True when profiling is switched on by the environment or the URL flag"""
+    values = (os.environ.get(ENV_FLAG), url_flag)
+    return any(str(v).strip().lower() in ("1", "true", "yes", "on") for v in values if v is not None)
+
+
+class RerunProfiler:
+    """cProfile and tracemalloc around one script rerun"""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.profile = cProfile.Profile()
+        self.started_tracemalloc = False
+        self.started = time.perf_counter()
+
+    def _stop(self):
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        # The stage spans reset tracemalloc's peak, so it is read through instrumentation
+        traced = instrumentation.traced_memory() if snapshot is not None else (0, 0)
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        return snapshot, traced
+
+
+def start():
+    """Start profiling this rerun, or None when another rerun holds the profiler.
+
+    Reruns that end early should finish() or cancel() their profiler; one
+    left running anyway (e.g. by an exception) is discarded first.
+    """
+    global _ACTIVE
+    with _LOCK:
+        if _ACTIVE is not None:
+            owner = _ACTIVE.thread
+            if owner.is_alive() and owner is not threading.current_thread():
+                return None
+            _ACTIVE._stop()
+            _ACTIVE = None
+
+        profiler = RerunProfiler()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            profiler.started_tracemalloc = True
+        instrumentation.clear_traced_peak()
+        profiler.profile.enable()
+        _ACTIVE = profiler
+        return profiler
+
+
+def finish(profiler, tag, extra_files=None):
+    """Stop profiling and write the dumps, returns their path prefix.
+
+    extra_files maps file name suffixes to text written alongside (e.g. the
+    rerun's stage timings).
+    """
+    global _ACTIVE
+    with _LOCK:
+        if _ACTIVE is not profiler:
+            return None
+        snapshot, (current, peak) = profiler._stop()
+        _ACTIVE = None
+    seconds = time.perf_counter() - profiler.started
+
+    fingerprint = str(tag.get("upload_fingerprint") or "no-upload")[:12]
+    players = tag.get("players", 0)
+    prefix = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{fingerprint}_{players}p")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    profiler.profile.dump_stats(prefix + ".pstats")
+    with open(prefix + "_allocations.txt", "w", encoding="utf-8") as f:
+        f.write(allocation_report(snapshot, tag, seconds, current, peak))
+    for suffix, text in (extra_files or {}).items():
+        with open(prefix + suffix, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    _prune()
+    return prefix
+
+
+def cancel(profiler):
+    """Stop profiling without writing dumps, e.g. for a rerun that ended before doing any work"""
+    global _ACTIVE
+    with _LOCK:
+        if _ACTIVE is profiler:
+            profiler._stop()
+            _ACTIVE = None
+
+
+def allocation_report(snapshot, tag, seconds, current, peak, limit=TOP_ALLOCATIONS):
+    """Plain text summary of the largest allocation sites still alive at the end of the rerun"""
+    lines = [f"{key}: {value}" for key, value in tag.items()]
+    lines.append(f"rerun: {seconds * 1000:.0f} ms")
+    lines.append(f"traced memory: {current / 2**20:.1f} MB current, {peak / 2**20:.1f} MB peak")
+    lines.append("")
+    if snapshot is None:
+        lines.append("tracemalloc was not tracing")
+        return "\n".join(lines) + "\n"
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen *>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    stats = snapshot.statistics("lineno")
+    lines.append(f"Top {min(limit, len(stats))} of {len(stats)} allocation sites")
+    for i, stat in enumerate(stats[:limit], 1):
+        frame = stat.traceback[0]
+        lines.append(f"#{i}: {frame.filename}:{frame.lineno}: {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        source = linecache.getline(frame.filename, frame.lineno).strip()
+        if source:
+            lines.append(f"    {source}")
+    rest = stats[limit:]
+    if rest:
+        lines.append(f"{len(rest)} other sites: {sum(s.size for s in rest) / 1024:.1f} KiB")
+    return "\n".join(lines) + "\n"
+
+
+def bundle(prefix):
+    """Zip of every file written for a dump, for the sidebar download"""
+    directory, stem = os.path.split(prefix)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(stem):
+                archive.write(os.path.join(directory, name), name)
+    return buffer.getvalue()
+
+
+def _prune():
+    """Delete the oldest dumps beyond KEEP_DUMPS"""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return
+    stems = sorted({name[:-len(".pstats")] for name in names if name.endswith(".pstats")})
+    for stem in stems[:-KEEP_DUMPS]:
+        for name in names:
+            if name.startswith(stem):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, name))
+                except OSError:
+                    pass
@@ -0,0 +1,91 @@
+"""Process-wide store of score arrays shared by every session.
+
+Streamlit serves each browser session from a thread of the same server
+process, so sessions that upload the same export (same fingerprint) can
+share one copy of the attribute matrix, role scores and top-K index. The
+arrays are handed out read-only, so no session can change another's data.
+Each session holds a Lease; a dataset is released once the last lease
+holding it lets go or is garbage collected along with its session.
+"""
+import threading
+import weakref
+
+import numpy as np
+
+# Guards _DATASETS and every lease's held slots, so reference counts stay exact
+_LOCK = threading.Lock()
+_DATASETS = {}  # fingerprint -> {"arrays": {name: read-only array}, "refs": int, "nbytes": int}
+
+
+class Lease:
+    """One session's hold on store datasets, at most one fingerprint per slot"""
+
+    def __init__(self):
+        self.held = {}
+        weakref.finalize(self, _release_all, self.held)
+
+    def acquire(self, slot, fingerprint, build):
+        """Arrays for fingerprint, calling build() only if no session holds them yet"""
+        with _LOCK:
+            if self.held.get(slot) == fingerprint:
+                return _DATASETS[fingerprint]["arrays"]
+            dataset = _DATASETS.get(fingerprint)
+            if dataset is not None:
+                self._hold(slot, fingerprint)
+                return dataset["arrays"]
+
+        # Build outside the lock so other sessions aren't blocked; first finished build wins
+        arrays = {}
+        for name, array in build().items():
+            array = np.ascontiguousarray(array)
+            array.setflags(write=False)
+            arrays[name] = array
+
+        with _LOCK:
+            if fingerprint not in _DATASETS:
+                _DATASETS[fingerprint] = {
+                    "arrays": arrays,
+                    "refs": 0,
+                    "nbytes": sum(a.nbytes for a in arrays.values()),
+                }
+            self._hold(slot, fingerprint)
+            return _DATASETS[fingerprint]["arrays"]
+
+    def release(self, slot):
+        """Drop this session's hold on slot"""
+        with _LOCK:
+            fingerprint = self.held.pop(slot, None)
+            if fingerprint is not None:
+                _decref(fingerprint)
+
+    def _hold(self, slot, fingerprint):
+        # Caller holds _LOCK
+        previous = self.held.get(slot)
+        if previous is not None:
+            _decref(previous)
+        self.held[slot] = fingerprint
+        _DATASETS[fingerprint]["refs"] += 1
+
+
+def _decref(fingerprint):
+    dataset = _DATASETS[fingerprint]
+    dataset["refs"] -= 1
+    if dataset["refs"] <= 0:
+        del _DATASETS[fingerprint]
+
+
+def _release_all(held):
+    """Finalizer for a garbage collected lease"""
+    with _LOCK:
+        for fingerprint in held.values():
+            _decref(fingerprint)
+        held.clear()
+
+
+def stats():
+    """Resident datasets with their reference counts and sizes"""
+    with _LOCK:
+        return [
+            {"fingerprint": fingerprint, "refs": dataset["refs"], "nbytes": dataset["nbytes"]}
+            for fingerprint, dataset in _DATASETS.items()
+        ]
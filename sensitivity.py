@@ -0,0 +1,105 @@
+"""How much a role ranking depends on the exact attribute weights.
+
+Every sample multiplies each of the role's weights by its own lognormal
+factor (noise is the standard deviation of its log) and re-ranks every
+player. The samples are processed in chunks with one matrix product each,
+(samples x attrs) @ (attrs x players), and a chunk holds as many samples as
+fit in memory_budget bytes of scores. Only each sample's top `window` is
+ever sorted, so a player's rank is known exactly down to the window and
+is reported as window + 1 below it.
+"""
+import numpy as np
+
+MEMORY_BUDGET_BYTES = 64 * 2**20
+RANK_PERCENTILES = (5, 50, 95)
+
+
+def weight_sensitivity(attrs_matrix, weights, n_samples=2000, noise=0.2, top_n=20, track=50, window=None,
+                       memory_budget=MEMORY_BUDGET_BYTES, seed=0):
+    """Rank intervals and weight importance under random weight perturbations.
+
+    Returns a dict with:
+      tracked: the rows of the base top `track` players, best first
+      rank_low/rank_median/rank_high: their rank percentiles (RANK_PERCENTILES)
+        over the samples, capped at window + 1
+      top_share: share of samples in which each tracked player is in the top_n
+      entrants/entrant_share/entrant_base_rank: players outside the base top_n
+        who reach it in some samples, most often first
+      overlap: per sample, how many of the base top_n are still in the top_n
+      importance: per attribute, the correlation between how far its weight
+        was moved and how much the top_n changed (NaN for unweighted attributes)
+    """
+    attrs_matrix = np.asarray(attrs_matrix, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    n_players = attrs_matrix.shape[0]
+    top_n = min(top_n, n_players)
+    track = min(max(track, top_n), n_players)
+    window = min(n_players, window or 2 * track)
+
+    base_order = np.argsort(-attrs_matrix.dot(weights), kind="stable")
+    tracked = base_order[:track]
+    tracked_local = np.full(n_players, -1)
+    tracked_local[tracked] = np.arange(track)
+    in_base_top = np.zeros(n_players, dtype=bool)
+    in_base_top[base_order[:top_n]] = True
+
+    rng = np.random.default_rng(seed)
+    log_factors = rng.standard_normal((n_samples, len(weights))) * noise
+    # Scores plus the argpartition indices, per sample
+    chunk_size = max(1, int(memory_budget // (max(n_players, 1) * 16)))
+
+    ranks = np.empty((n_samples, track), dtype=np.int32)
+    top_counts = np.zeros(n_players, dtype=np.int64)
+    overlap = np.empty(n_samples, dtype=np.int32)
+    for start in range(0, n_samples, chunk_size):
+        stop = min(start + chunk_size, n_samples)
+        sample_weights = weights * np.exp(log_factors[start:stop])
+        scores = sample_weights.dot(attrs_matrix.T)
+
+        top = np.argpartition(-scores, window - 1, axis=1)[:, :window]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        del scores
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1, kind="stable"), axis=1)
+
+        chunk_ranks = np.full((stop - start, track), window + 1, dtype=np.int32)
+        local = tracked_local[top]
+        rows, positions = np.nonzero(local >= 0)
+        chunk_ranks[rows, local[rows, positions]] = positions + 1
+        ranks[start:stop] = chunk_ranks
+
+        top_counts += np.bincount(top[:, :top_n].ravel(), minlength=n_players)
+        overlap[start:stop] = in_base_top[top[:, :top_n]].sum(axis=1)
+
+    low, median, high = np.percentile(ranks, RANK_PERCENTILES, axis=0, method="nearest") if n_samples else np.full((3, track), np.nan)
+    entrants = np.flatnonzero((top_counts > 0) & ~in_base_top)
+    entrants = entrants[np.argsort(-top_counts[entrants], kind="stable")]
+    return {
+        "tracked": tracked,
+        "rank_low": low,
+        "rank_median": median,
+        "rank_high": high,
+        "top_share": top_counts[tracked] / max(n_samples, 1),
+        "entrants": entrants,
+        "entrant_share": top_counts[entrants] / max(n_samples, 1),
+        "entrant_base_rank": np.argsort(base_order)[entrants] + 1,
+        "overlap": overlap,
+        "importance": weight_importance(log_factors, top_n - overlap, weights),
+        "window": window,
+    }
+
+
+def weight_importance(log_factors, churn, weights):
+    """Correlation of each weight's perturbation size with the top-n churn.
+
+    The size (not the sign) is used: pushing a weight either way can
+    reshuffle the top, which a signed correlation would average away.
+    """
+    importance = np.full(len(weights), np.nan)
+    churn = np.asarray(churn, dtype=float)
+    if len(churn) < 2 or churn.std() == 0:
+        importance[weights != 0] = 0.0
+        return importance
+    size = np.abs(log_factors[:, weights != 0])
+    size = (size - size.mean(axis=0)) / size.std(axis=0)
+    importance[weights != 0] = size.T.dot(churn - churn.mean()) / (len(churn) * churn.std())
+    return importance
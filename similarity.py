@@ -0,0 +1,89 @@
+"""Nearest-neighbour search over player attribute vectors.
+
+Each attribute is scaled by the square root of its weight, so Euclidean
+distance in the index is the weighted distance between attribute vectors.
+Unweighted, every attribute counts once; weighted by a role, attributes
+the role ignores drop out of the tree entirely. Distances stay in
+attribute points either way (weights are normalised to a mean of 1).
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Filters letting through at most this share of players are searched by brute force
+BRUTE_FORCE_SHARE = 0.1
+
+
+class SimilarityIndex:
+    """KD-tree over (optionally weighted) attribute vectors, built once per dataset"""
+
+    def __init__(self, attrs_matrix, weights=None):
+        attrs_matrix = np.asarray(attrs_matrix, dtype=float)
+        if weights is None:
+            weights = np.ones(attrs_matrix.shape[1])
+        weights = np.asarray(weights, dtype=float)
+        self.columns = np.flatnonzero(weights > 0)
+        scale = np.sqrt(weights[self.columns] / weights[self.columns].mean()) if len(self.columns) else weights[:0]
+        self.points = attrs_matrix[:, self.columns] * scale
+        self.tree = cKDTree(self.points)
+
+    @property
+    def nbytes(self):
+        # Points plus the tree's own copy and index arrays, roughly
+        return int(self.points.nbytes * 2 + self.tree.indices.nbytes)
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, row, k=10, allowed=None):
+        """(rows, distances) of the k players closest to row, nearest first.
+
+        allowed is an optional boolean mask of players that may be
+        returned; the query widens until k of them are found or every
+        player has been considered.
+        """
+        n = len(self.points)
+        want = min(k, n - 1)
+        if want <= 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        if allowed is not None:
+            candidates = np.flatnonzero(allowed & (np.arange(n) != row))
+            if len(candidates) <= BRUTE_FORCE_SHARE * n:
+                # Tight filters: scanning the few allowed players beats widening the tree query
+                distances = np.linalg.norm(self.points[candidates] - self.points[row], axis=1)
+                order = np.argsort(distances, kind="stable")[:want]
+                return candidates[order], distances[order]
+        fetch = want + 1
+        while True:
+            distances, rows = self.tree.query(self.points[row], k=min(fetch, n))
+            distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+            keep = rows != row
+            if allowed is not None:
+                keep &= allowed[rows]
+            if keep.sum() >= want or fetch >= n:
+                return rows[keep][:want], distances[keep][:want]
+            fetch *= 4
+
+    def within(self, row, radius, allowed=None):
+        """(rows, distances) of every player within radius of row, nearest first"""
+        rows = np.asarray(self.tree.query_ball_point(self.points[row], radius), dtype=int)
+        rows = rows[rows != row]
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        distances = np.linalg.norm(self.points[rows] - self.points[row], axis=1)
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+
+def filter_mask(ages, values, age_range=None, max_value=None):
+    """Players inside an age range and under a transfer value cap (None = no limit).
+
+    Unknown values (NaN, e.g. not for sale) never pass a cap, and unknown
+    ages never pass an age range.
+    """
+    allowed = np.ones(len(ages), dtype=bool)
+    if age_range is not None:
+        low, high = age_range
+        allowed &= (ages >= low) & (ages <= high)
+    if max_value is not None:
+        allowed &= values <= max_value
+    return allowed
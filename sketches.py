@@ -0,0 +1,98 @@
+"""Mergeable streaming quantile sketches (KLL) for score distributions.
+
+A sketch keeps O(k log n) of the values it has seen, in levels where an
+item at level h stands for 2**h originals. When a level fills up it is
+sorted and every other item is promoted to the level above, so only
+small buffers are ever sorted. Sketches of separate uploads merge into a
+sketch of their union with the same rank error (about 1.7/k).
+"""
+import numpy as np
+
+DEFAULT_K = 200
+
+
+class QuantileSketch:
+    """KLL quantile sketch over a stream of floats"""
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        # Seeded so the same data always gives the same cut points (and cache entries)
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        """Add values (NaNs are skipped), in k sized batches so level 0 stays small"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        for start in range(0, len(values), self.k):
+            batch = values[start:start + self.k]
+            self.levels[0] = np.concatenate([self.levels[0], batch])
+            self.n += len(batch)
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def copy(self):
+        sketch = QuantileSketch(self.k)
+        sketch.n = self.n
+        sketch.levels = [items.copy() for items in self.levels]
+        return sketch
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so the total weight is exact
+                leftover, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = leftover
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs):
+        """Approximate values at the given quantiles (NaN for an empty sketch)"""
+        qs = np.asarray(qs, dtype=float)
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        ranks = np.searchsorted(cumulative, qs * cumulative[-1], side="left")
+        return items[order][np.minimum(ranks, len(items) - 1)]
+
+
+def sketch_columns(matrix, k=DEFAULT_K):
+    """One sketch per column of a 2-D array"""
+    matrix = np.asarray(matrix, dtype=float)
+    return [QuantileSketch(k).update(matrix[:, j]) for j in range(matrix.shape[1])]
+
+
+def merge_columns(sketch_lists):
+    """Column-wise merge of several sketch_columns results, leaving the inputs untouched"""
+    sketch_lists = list(sketch_lists)
+    if not sketch_lists:
+        return []
+    merged = [sketch.copy() for sketch in sketch_lists[0]]
+    for sketches in sketch_lists[1:]:
+        for target, sketch in zip(merged, sketches):
+            target.merge(sketch)
+    return merged
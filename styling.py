@@ -0,0 +1,198 @@
+"""Colour coding for the Full Table view.
+
+Each coloured role has six thresholds (blue, green, white, yellow, orange,
+red, best first); scores in between are interpolated and scores under the
+red threshold are blanked out. The fixed thresholds suit top-division
+squads; adaptive_thresholds derives them from the dataset's own quantiles.
+"""
+import numpy as np
+import pandas as pd
+
+# Define color thresholds for each position (RGB tuples)
+BLUE = (0, 255, 255)
+GREEN = (0, 255, 0)
+WHITE = (255, 255, 255)
+YELLOW = (255, 255, 0)
+ORANGE = (255, 150, 0)
+RED = (255, 0, 0)
+
+GK_THRESHOLDS = [
+    (1600, BLUE), (1550, GREEN), (1400, WHITE),
+    (1300, YELLOW), (1200, ORANGE), (1100, RED)
+]
+
+DLDR_THRESHOLDS = [
+    (1300, BLUE), (1250, GREEN), (1100, WHITE),
+    (1000, YELLOW), (900, ORANGE), (800, RED)
+]
+
+CB_THRESHOLDS = [
+    (1500, BLUE), (1450, GREEN), (1300, WHITE),
+    (1200, YELLOW), (1100, ORANGE), (1000, RED)
+]
+
+DM_THRESHOLDS = [
+    (1400, BLUE), (1350, GREEN), (1200, WHITE),
+    (1100, YELLOW), (1000, ORANGE), (900, RED)
+]
+
+AM_THRESHOLDS = [
+    (1500, BLUE), (1450, GREEN), (1300, WHITE),
+    (1200, YELLOW), (1100, ORANGE), (1000, RED)
+]
+
+ST_THRESHOLDS = [
+    (1700, BLUE), (1650, GREEN), (1450, WHITE),
+    (1300, YELLOW), (1200, ORANGE), (1100, RED)
+]
+
+ROLE_THRESHOLDS = {
+    'GK': GK_THRESHOLDS,
+    'DL/DR': DLDR_THRESHOLDS,
+    'CB': CB_THRESHOLDS,
+    'DM': DM_THRESHOLDS,
+    'AML/AMR': AM_THRESHOLDS,
+    'AMC': AM_THRESHOLDS,
+    'ST': ST_THRESHOLDS,
+}
+
+# Uncoloured roles are only blanked below a floor
+EMPTY_CELL_FLOORS = {'WBL/WBR': 700, 'ML/MR': 700, 'CM': 800}
+
+NUMERIC_COLUMNS = ['GK', 'DL/DR', 'CB', 'WBL/WBR', 'DM', 'ML/MR', 'CM', 'AML/AMR', 'AMC', 'ST']
+
+# Tier codes, best first; a code's cut point is the threshold at the same position
+TIER_NAMES = ['blue', 'green', 'white', 'yellow', 'orange', 'red', 'hidden']
+HIDDEN_TIER = TIER_NAMES.index('hidden')
+# Visible scores in roles without colours count as white, the colour they are shown in
+PLAIN_TIER = TIER_NAMES.index('white')
+
+# Adaptive mode: dataset quantile each tier starts at (blue, green, white, yellow, orange, red)
+ADAPTIVE_TIER_QUANTILES = [0.99, 0.95, 0.80, 0.60, 0.40, 0.25]
+
+
+def interpolate_color(val, thresholds):
+    """Interpolate between color thresholds"""
+    if val >= thresholds[0][0]:  # Above highest threshold
+        return thresholds[0][1]
+
+    if val < thresholds[-1][0]:  # Below lowest threshold
+        return ''  # Empty for black zone
+
+    # Find the two thresholds we're between
+    for i in range(len(thresholds) - 1):
+        high_val, high_color = thresholds[i]
+        low_val, low_color = thresholds[i + 1]
+
+        if low_val <= val < high_val:
+            # Calculate how far we are between thresholds (0.0 to 1.0)
+            ratio = (val - low_val) / (high_val - low_val)
+
+            # Interpolate each RGB component
+            r = int(low_color[0] + (high_color[0] - low_color[0]) * ratio)
+            g = int(low_color[1] + (high_color[1] - low_color[1]) * ratio)
+            b = int(low_color[2] + (high_color[2] - low_color[2]) * ratio)
+
+            return (r, g, b)
+
+    return thresholds[-1][1]  # Fallback to lowest threshold color
+
+
+def score_style(x, thresholds):
+    """CSS for one formatted score cell"""
+    try:
+        val = float(x)
+        color = interpolate_color(val, thresholds)
+        if color:
+            return f'color: rgb{color}; font-weight: bold'
+    except (ValueError, TypeError):
+        pass
+    return ''
+
+
+def adaptive_thresholds(role_cut_points):
+    """(role thresholds, floors) from per-role cut points at ADAPTIVE_TIER_QUANTILES.
+
+    Cut points are rounded and forced strictly decreasing, so a role with
+    many tied scores still gets six distinct tiers to interpolate between.
+    """
+    def tiers(cuts):
+        cuts = [int(round(c)) for c in cuts]
+        for i in range(len(cuts) - 2, -1, -1):
+            cuts[i] = max(cuts[i], cuts[i + 1] + 1)
+        return cuts
+
+    role_thresholds = {
+        role: list(zip(tiers(role_cut_points[role]), (colour for _, colour in thresholds)))
+        for role, thresholds in ROLE_THRESHOLDS.items()
+    }
+    floors = {role: tiers(role_cut_points[role])[-1] for role in EMPTY_CELL_FLOORS}
+    return role_thresholds, floors
+
+
+def tier_codes(score_matrix, columns, role_thresholds=ROLE_THRESHOLDS, empty_cell_floors=EMPTY_CELL_FLOORS):
+    """int8 tier code (index into TIER_NAMES) for every score, players x columns.
+
+    Scores are rounded as in the table, so a code always matches the colour
+    band a cell is shown in: code k means at least the k-th threshold.
+    """
+    scores = np.round(np.asarray(score_matrix, dtype=float))
+    codes = np.full(scores.shape, HIDDEN_TIER, dtype=np.int8)
+    for j, col in enumerate(columns):
+        if col in role_thresholds:
+            cuts = np.array([value for value, _ in role_thresholds[col]][::-1], dtype=float)
+            # Number of cut points at or below each score, 0 (hidden) to 6 (blue)
+            passed = np.searchsorted(cuts, scores[:, j], side='right')
+            codes[:, j] = HIDDEN_TIER - passed
+        elif col in empty_cell_floors:
+            codes[:, j] = np.where(scores[:, j] >= empty_cell_floors[col], PLAIN_TIER, HIDDEN_TIER)
+    return codes
+
+
+def tier_counts(codes, columns):
+    """Players per tier for each column, as a columns x TIER_NAMES frame"""
+    counts = np.stack([np.bincount(codes[:, j], minlength=len(TIER_NAMES)) for j in range(codes.shape[1])])
+    return pd.DataFrame(counts, index=columns, columns=TIER_NAMES)
+
+
+def tier_filter(codes, best_tier, min_roles=1, column_indices=None):
+    """Boolean mask of players at best_tier or better in at least min_roles of the columns"""
+    selected = codes if column_indices is None else codes[:, column_indices]
+    return (selected <= best_tier).sum(axis=1) >= min_roles
+
+
+def build_display_table(comprehensive_df, role_thresholds=ROLE_THRESHOLDS, empty_cell_floors=EMPTY_CELL_FLOORS):
+    """(sort_df, display_df): numeric scores for sorting, formatted strings for display.
+
+    Scores below a role's red threshold (or floor, for uncoloured roles)
+    are blanked in both.
+    """
+    blanked_df = comprehensive_df.copy()
+    floors = dict(empty_cell_floors)
+    floors.update({role: thresholds[-1][0] for role, thresholds in role_thresholds.items()})
+    for col, floor in floors.items():
+        if col in blanked_df.columns:
+            blanked_df[col] = blanked_df[col].apply(lambda x: '' if pd.notna(x) and float(x) < floor else x)
+
+    # Numeric copy keeps the columns sortable
+    sort_df = blanked_df
+    for col in NUMERIC_COLUMNS:
+        if col in sort_df.columns:
+            sort_df[col] = pd.to_numeric(sort_df[col], errors='coerce')
+
+    display_df = sort_df.copy()
+    for col in NUMERIC_COLUMNS:
+        if col in display_df.columns:
+            display_df[col] = display_df[col].apply(lambda x: f"{int(x)}" if pd.notna(x) and x != '' else '')
+
+    return sort_df, display_df
+
+
+def table_styles(display_df, numeric_columns=NUMERIC_COLUMNS, role_thresholds=ROLE_THRESHOLDS):
+    """Per-cell CSS for the formatted table, same shape as display_df"""
+    styles = pd.DataFrame('', index=display_df.index, columns=display_df.columns)
+    for col in numeric_columns:
+        if col in display_df.columns and col in role_thresholds:
+            thresholds = role_thresholds[col]
+            styles[col] = display_df[col].apply(lambda x: score_style(x, thresholds) if x != '' else '')
+    return styles
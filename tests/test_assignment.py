@@ -0,0 +1,363 @@
+"""Randomized checks of the assignment solvers against scipy"""
+import itertools
+
+import numpy as np
+import pytest
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.optimize import linear_sum_assignment as scipy_linear_sum_assignment
+
+from assignment import (build_top_k_index, k_best_xis, linear_sum_assignment, marginal_gains, prune_candidates,
+                        reoptimize_xi, simulate_availability, solve_constrained_xi, solve_xi)
+from formations import FORMATIONS, ROLES, formation_role_columns
+
+
+def _scipy_solve(cost, maximize):
+    """(feasible, total) from scipy"""
+    try:
+        rows, cols = scipy_linear_sum_assignment(cost, maximize=maximize)
+    except ValueError:
+        return False, None
+    return True, cost[rows, cols].sum()
+
+
+def _assert_matches_scipy(cost, maximize):
+    feasible, expected = _scipy_solve(cost, maximize)
+    if not feasible:
+        with pytest.raises(ValueError):
+            linear_sum_assignment(cost, maximize=maximize)
+        return
+    rows, cols = linear_sum_assignment(cost, maximize=maximize)
+    assert len(rows) == min(cost.shape)
+    assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+    assert np.all(np.diff(rows) > 0)
+    assert np.isclose(cost[rows, cols].sum(), expected)
+
+
+@pytest.mark.parametrize("maximize", [False, True])
+@pytest.mark.parametrize("shape", ["square", "wide", "tall"])
+def test_linear_sum_assignment_matches_scipy(shape, maximize):
+    rng = np.random.default_rng(26)
+    for _ in range(300):
+        n = int(rng.integers(1, 12))
+        m = {"square": n, "wide": n + int(rng.integers(1, 6)), "tall": max(1, n - int(rng.integers(1, 6)))}[shape]
+        _assert_matches_scipy(rng.normal(0, 100, (n, m)), maximize)
+
+
+@pytest.mark.parametrize("maximize", [False, True])
+def test_linear_sum_assignment_ties(maximize):
+    rng = np.random.default_rng(27)
+    for _ in range(300):
+        n, m = rng.integers(1, 10, 2)
+        # Few distinct values, so many optimal assignments tie
+        _assert_matches_scipy(rng.integers(0, 3, (n, m)).astype(float), maximize)
+
+
+@pytest.mark.parametrize("maximize", [False, True])
+def test_linear_sum_assignment_forbidden_entries(maximize):
+    rng = np.random.default_rng(28)
+    forbidden_value = -np.inf if maximize else np.inf
+    infeasible = 0
+    for _ in range(500):
+        n, m = rng.integers(1, 10, 2)
+        cost = rng.integers(0, 20, (n, m)).astype(float)
+        cost[rng.random((n, m)) < rng.uniform(0.1, 0.7)] = forbidden_value
+        infeasible += not _scipy_solve(cost, maximize)[0]
+        _assert_matches_scipy(cost, maximize)
+    # Both outcomes were exercised
+    assert 0 < infeasible < 500
+
+
+def test_linear_sum_assignment_invalid_entries():
+    with pytest.raises(ValueError):
+        linear_sum_assignment(np.array([[np.nan, 1.0], [1.0, 2.0]]))
+    with pytest.raises(ValueError):
+        linear_sum_assignment(np.array([[-np.inf, 1.0], [1.0, 2.0]]))
+    with pytest.raises(ValueError):
+        linear_sum_assignment(np.zeros(3))
+    rows, cols = linear_sum_assignment(np.zeros((0, 4)))
+    assert len(rows) == len(cols) == 0
+
+
+def _full_solve_total(score_matrix, excluded):
+    """Best XI total over every non-excluded player, no pruning"""
+    allowed = np.setdiff1d(np.arange(len(score_matrix)), excluded)
+    sub = score_matrix[allowed]
+    rows, cols = scipy_linear_sum_assignment(sub, maximize=True)
+    return sub[rows, cols].sum()
+
+
+def _check_pruned_solve(score_matrix, excluded, ranked):
+    total, chosen = solve_xi(score_matrix, excluded, ranked)
+    players = list(chosen.values())
+    assert len(set(players)) == len(players)
+    assert not set(players) & set(excluded)
+    assert np.isclose(total, sum(score_matrix[p, slot] for slot, p in chosen.items()))
+    assert np.isclose(total, _full_solve_total(score_matrix, excluded))
+
+
+@pytest.mark.parametrize("formation", sorted(FORMATIONS))
+def test_pruned_solve_xi_matches_full_solve(formation):
+    rng = np.random.default_rng(sorted(FORMATIONS).index(formation))
+    columns = formation_role_columns(formation)
+    for trial in range(40):
+        n_players = int(rng.integers(12, 120))
+        # Integer scores tie often, which is where a pruning argument would slip
+        role_scores = rng.integers(0, 30, (n_players, len(ROLES))).astype(float)
+        score_matrix = role_scores[:, columns]
+        excluded = rng.choice(n_players, int(rng.integers(0, n_players - len(columns))), replace=False).tolist()
+        # A short top-k index, so exclusions often use a ranking up and force the full-column scan
+        ranked = build_top_k_index(role_scores, int(rng.integers(1, 20)))[columns] if trial % 2 else None
+        _check_pruned_solve(score_matrix, excluded, ranked)
+
+
+@pytest.mark.parametrize("formation", sorted(FORMATIONS))
+def test_small_squads_keep_everyone(formation):
+    rng = np.random.default_rng(29)
+    columns = formation_role_columns(formation)
+    n_slots = len(columns)
+    for n_players in range(1, n_slots + 4):
+        score_matrix = rng.integers(0, 30, (n_players, n_slots)).astype(float)
+        excluded = rng.choice(n_players, int(rng.integers(0, min(3, n_players) + 1)), replace=False).tolist()
+        if n_players - len(excluded) <= n_slots:
+            expected = np.setdiff1d(np.arange(n_players), excluded)
+            assert np.array_equal(prune_candidates(score_matrix, excluded), expected)
+        if n_players > len(excluded):
+            _check_pruned_solve(score_matrix, excluded, None)
+
+
+def _milp_constrained_total(score_matrix, constraints, excluded):
+    """Best full-XI total from scipy's MILP solver, None when there is none.
+
+    A short squad's full lineup uses every available player, and an empty
+    one does not count.
+    """
+    n_players, n_slots = score_matrix.shape
+    allowed = np.ones((n_players, n_slots))
+    allowed[list(excluded)] = 0
+    n_filled = min(n_slots, n_players - len(set(excluded)))
+    if n_filled == 0:
+        return None
+    # x[p, s] flattened row-major: each slot and player used at most once, n_filled pairs in all
+    slot_rows = np.kron(np.ones(n_players), np.eye(n_slots))
+    player_rows = np.kron(np.eye(n_players), np.ones(n_slots))
+    limits = [LinearConstraint(slot_rows, 0, 1), LinearConstraint(player_rows, 0, 1),
+              LinearConstraint(np.ones((1, n_players * n_slots)), n_filled, n_filled)]
+    for weights, capacity in constraints:
+        limits.append(LinearConstraint(np.repeat(weights, n_slots)[None, :], -np.inf, capacity))
+    result = milp(-score_matrix.ravel(), constraints=limits, integrality=np.ones(n_players * n_slots),
+                  bounds=Bounds(0, allowed.ravel()))
+    return -result.fun if result.status == 0 else None
+
+
+def _check_constrained_solve(score_matrix, constraints, excluded):
+    result = solve_constrained_xi(score_matrix, constraints, excluded, time_limit=30.0)
+    expected = _milp_constrained_total(score_matrix, constraints, excluded)
+    if expected is None:
+        assert result["total"] is None and result["chosen"] == {}
+        return
+    players = list(result["chosen"].values())
+    assert len(players) == min(score_matrix.shape[1], len(score_matrix) - len(set(excluded)))
+    assert len(set(players)) == len(players) and not set(players) & set(excluded)
+    for weights, capacity in constraints:
+        assert weights[players].sum() <= capacity + 1e-6
+    assert result["optimal"]
+    assert np.isclose(result["total"], expected)
+    assert np.isclose(result["total"], sum(score_matrix[p, slot] for slot, p in result["chosen"].items()))
+
+
+def test_constrained_solve_matches_milp():
+    rng = np.random.default_rng(30)
+    infeasible = 0
+    for _ in range(150):
+        n_slots = int(rng.integers(1, 6))
+        n_players = int(rng.integers(n_slots, 16))
+        score_matrix = rng.integers(0, 30, (n_players, n_slots)).astype(float)
+        ages = rng.integers(17, 35, n_players).astype(float)
+        values = rng.choice([0.0, 1.0, 5.0, 20.0, 60.0], n_players)
+        # Caps around the typical lineup, so both tight and infeasible cases come up
+        constraints = [(ages, rng.uniform(18, 28) * n_slots)]
+        if rng.random() < 0.5:
+            constraints.append((values, rng.uniform(0, 20) * n_slots))
+        excluded = rng.choice(n_players, int(rng.integers(0, 3)), replace=False).tolist()
+        infeasible += _milp_constrained_total(score_matrix, constraints, excluded) is None
+        _check_constrained_solve(score_matrix, constraints, excluded)
+    assert 0 < infeasible < 150
+
+
+def test_constrained_solve_repairs_into_incumbent():
+    # 12 stars aged 26 and 13 youngsters aged 18 under an average age of 24 over 11 slots
+    scores = np.r_[np.full(12, 100.0), np.full(13, 10.0)]
+    ages = np.r_[np.full(12, 26.0), np.full(13, 18.0)]
+    score_matrix = np.repeat(scores[:, None], 11, axis=1)
+    result = solve_constrained_xi(score_matrix, [(ages, 24.0 * 11)], time_limit=1.0)
+    # 8 stars and 3 youngsters is the best that fits
+    assert result["total"] == 830.0
+    assert ages[list(result["chosen"].values())].sum() <= 24.0 * 11
+    # Interchangeable stars keep branching from closing the gap, but the bound stays close
+    assert result["bound"] >= 830.0 and result["gap"] < 0.05
+
+
+def _cold_fill_total(score_matrix, locked, excluded):
+    """Best total of the unlocked slots, solved from scratch"""
+    free_slots = [j for j in range(score_matrix.shape[1]) if j not in locked]
+    allowed = np.setdiff1d(np.arange(len(score_matrix)), list(set(excluded) | set(locked.values())))
+    sub = score_matrix[np.ix_(allowed, free_slots)]
+    rows, cols = scipy_linear_sum_assignment(sub, maximize=True)
+    return sub[rows, cols].sum(), min(len(allowed), len(free_slots))
+
+
+@pytest.mark.parametrize("use_ranked", [False, True])
+def test_warm_reoptimize_matches_cold_solves(use_ranked):
+    rng = np.random.default_rng(31 + use_ranked)
+    for _ in range(20):
+        n_players, n_slots = int(rng.integers(12, 60)), 11
+        role_scores = rng.integers(0, 40, (n_players, n_slots)).astype(float)
+        ranked = build_top_k_index(role_scores, 15) if use_ranked else None
+        locked, excluded, warm = {}, set(), None
+        # A session's worth of lock / unlock / exclude / include clicks on one score matrix
+        for _ in range(25):
+            action = rng.integers(4)
+            if action == 0:
+                locked[int(rng.integers(n_slots))] = int(rng.integers(n_players))
+                locked = {slot: p for slot, p in locked.items() if list(locked.values()).count(p) == 1}
+            elif action == 1 and locked:
+                locked.pop(int(rng.choice(list(locked))))
+            elif action == 2:
+                excluded.add(int(rng.integers(n_players)))
+            elif excluded:
+                excluded.discard(int(rng.choice(sorted(excluded))))
+            excluded -= set(locked.values())
+
+            chosen, warm = reoptimize_xi(role_scores, locked, sorted(excluded), ranked, warm)
+            expected, n_filled = _cold_fill_total(role_scores, locked, excluded)
+            filled = {slot: p for slot, p in chosen.items() if slot not in locked}
+            assert {slot: chosen[slot] for slot in locked} == locked
+            assert len(filled) == n_filled
+            assert len(set(chosen.values())) == len(chosen)
+            assert not set(filled.values()) & (excluded | set(locked.values()))
+            assert np.isclose(sum(role_scores[p, slot] for slot, p in filled.items()), expected)
+
+
+def test_reoptimize_from_random_potentials():
+    rng = np.random.default_rng(33)
+    for _ in range(200):
+        n_players, n_slots = int(rng.integers(11, 40)), int(rng.integers(1, 12))
+        score_matrix = rng.normal(100, 20, (n_players, n_slots)).round()
+        # Arbitrary stale state: potentials and a matching that fit some other problem
+        warm = {
+            "u": rng.normal(0, 50, n_slots),
+            "v": {int(p): float(rng.normal(0, 50)) for p in rng.choice(n_players, n_players // 2, replace=False)},
+            "match": {j: int(rng.integers(n_players)) for j in range(n_slots) if rng.random() < 0.5},
+        }
+        excluded = rng.choice(n_players, int(rng.integers(0, n_players - n_slots + 1)), replace=False).tolist()
+        chosen, _ = reoptimize_xi(score_matrix, {}, excluded, None, warm)
+        expected, n_filled = _cold_fill_total(score_matrix, {}, excluded)
+        assert len(chosen) == n_filled and len(set(chosen.values())) == n_filled
+        assert np.isclose(sum(score_matrix[p, slot] for slot, p in chosen.items()), expected)
+
+
+def _brute_force_lineups(score_matrix, slot_groups, excluded):
+    """Total of every distinct lineup (set of (player, group) pairs), best first"""
+    allowed = [p for p in range(len(score_matrix)) if p not in excluded]
+    lineups = {}
+    for players in itertools.permutations(allowed, score_matrix.shape[1]):
+        key = frozenset((p, slot_groups[j]) for j, p in enumerate(players))
+        lineups[key] = sum(score_matrix[p, j] for j, p in enumerate(players))
+    return sorted(lineups.values(), reverse=True)
+
+
+@pytest.mark.parametrize("grouped", [False, True])
+def test_k_best_matches_brute_force(grouped):
+    rng = np.random.default_rng(34 + grouped)
+    for _ in range(60):
+        n_slots = int(rng.integers(1, 5))
+        n_players = int(rng.integers(n_slots, 8))
+        slot_groups = sorted(rng.integers(0, 2, n_slots).tolist()) if grouped else list(range(n_slots))
+        # Slots in one group are the same role, so they share a score column
+        group_scores = rng.integers(0, 10, (n_players, max(slot_groups) + 1)).astype(float)
+        score_matrix = group_scores[:, slot_groups]
+        excluded = rng.choice(n_players, int(rng.integers(0, n_players - n_slots + 1)), replace=False).tolist()
+        k = int(rng.integers(1, 30))
+
+        expected = _brute_force_lineups(score_matrix, slot_groups, set(excluded))
+        results = k_best_xis(score_matrix, k, slot_groups, excluded)
+        assert len(results) == min(k, len(expected))
+        assert np.allclose([total for total, _ in results], expected[:len(results)])
+        keys = set()
+        for total, chosen in results:
+            assert sorted(chosen) == list(range(n_slots))
+            assert len(set(chosen.values())) == n_slots and not set(chosen.values()) & set(excluded)
+            assert np.isclose(total, sum(score_matrix[p, j] for j, p in chosen.items()))
+            keys.add(frozenset((p, slot_groups[j]) for j, p in chosen.items()))
+        assert len(keys) == len(results)
+
+
+@pytest.mark.parametrize("k", [3, 64])
+def test_availability_without_dropouts_is_the_best_xi(k):
+    rng = np.random.default_rng(36)
+    score_matrix = rng.integers(0, 50, (40, 5)).astype(float)
+    always_out = [0, 1, 2, 3]
+    expected, chosen = solve_xi(score_matrix, always_out)
+    result = simulate_availability(score_matrix, build_top_k_index(score_matrix, k), 0.0, 200, always_out)
+    assert np.allclose(result["totals"], expected)
+    # A top-3 ranking runs out once four players are always out, so those scenarios take the exact path
+    assert (result["deep_scenarios"] > 0) == (k == 3)
+    started = result["players"][result["start_rate"] > 0]
+    assert not set(started.tolist()) & set(always_out)
+
+
+def _exact_expected_total(score_matrix, p_out):
+    """Expected best-XI total over every availability pattern of a small squad"""
+    n_players = len(score_matrix)
+    expected = 0.0
+    for out in itertools.product([False, True], repeat=n_players):
+        n_out = sum(out)
+        weight = p_out ** n_out * (1 - p_out) ** (n_players - n_out)
+        expected += weight * solve_xi(score_matrix, np.flatnonzero(out))[0]
+    return expected
+
+
+@pytest.mark.parametrize("k", [2, 10])
+def test_availability_mean_matches_exact_expectation(k):
+    rng = np.random.default_rng(37)
+    score_matrix = rng.integers(0, 30, (10, 3)).astype(float)
+    result = simulate_availability(score_matrix, build_top_k_index(score_matrix, k), 0.3, 20000, seed=k)
+    totals = result["totals"]
+    assert len(totals) == 20000
+    # The short ranking sends many scenarios down the exact path; both must agree with the enumeration
+    assert (result["deep_scenarios"] > 0) == (k == 2)
+    standard_error = totals.std() / np.sqrt(len(totals))
+    assert abs(totals.mean() - _exact_expected_total(score_matrix, 0.3)) < 4 * standard_error
+
+
+def test_marginal_gains_match_brute_force():
+    rng = np.random.default_rng(38)
+    for trial in range(300):
+        n_slots = int(rng.integers(1, 12))
+        # Short squads included: empty slots score 0
+        n_players = int(rng.integers(1, 40))
+        score_matrix = rng.integers(0, 30, (n_players, n_slots)).astype(float)
+        candidates = rng.integers(0, 40, (int(rng.integers(1, 50)), n_slots)).astype(float)
+        values = rng.choice([0.0, 1.0, 10.0, np.nan], len(candidates))
+        n_exact = int(rng.integers(1, 10))
+        # The app passes the squad's top-k index; a short one forces the full-squad dual fallback
+        ranked = build_top_k_index(score_matrix, int(rng.integers(1, 20))) if trial % 3 else None
+        result = marginal_gains(score_matrix, candidates, ranked, values if trial % 2 else None, n_exact=n_exact)
+
+        base_total = _scipy_solve(score_matrix, True)[1]
+        assert np.isclose(result["base_total"], base_total)
+        true_gain = np.array([_scipy_solve(np.vstack([score_matrix, c]), True)[1] - base_total for c in candidates])
+        assert np.all(result["bound"] >= true_gain - 1e-6)
+        exact = result["exact"]
+        assert np.allclose(result["gain"][exact], true_gain[exact])
+        assert np.all(np.isnan(result["gain"][~exact]))
+        # The n_exact largest bounds are always re-solved
+        assert exact[np.argsort(-result["bound"], kind="stable")[:n_exact]].all()
+        if trial % 2:
+            # Free candidates come first on value; unknown values are never picked for it
+            free = np.flatnonzero((values == 0) & (result["bound"] > 1e-9))
+            if len(free) <= n_exact:
+                assert exact[free].all()
+            by_bound = np.argsort(-result["bound"], kind="stable")[:n_exact]
+            unknown = np.flatnonzero(np.isnan(values) & exact & (result["bound"] > 1e-9))
+            assert set(unknown.tolist()) <= set(by_bound.tolist())
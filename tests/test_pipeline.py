@@ -0,0 +1,145 @@
+"""Checks of the vectorized pipeline stages against row-by-row references"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from generate_export import generate_export
+from pipeline import (ABBR_MAP, CANONICAL_ATTRIBUTES, WEIGHTS_BY_ROLE, create_name_key, deduplicate_players,
+                      merge_duplicate_columns, name_keys, parse_players_from_html, parse_players_from_stream,
+                      parse_transfer_value)
+
+
+def _reference_deduplicate(df):
+    """The original iterrows implementation, with one key per empty name"""
+    if len(df) <= 1 or 'Name' not in df.columns:
+        return df
+    df = df.copy()
+    keys = [create_name_key(name) for name in df['Name']]
+    df['_name_key'] = [f"_empty_{i}" if key.startswith("_empty_") else key for i, key in enumerate(keys)]
+    values = df['Transfer Value'] if 'Transfer Value' in df.columns else pd.Series('', index=df.index)
+    df['_transfer_val_numeric'] = values.apply(parse_transfer_value)
+    available_attrs = [a for a in CANONICAL_ATTRIBUTES if a in df.columns]
+    avg_scores = []
+    for _, player in df[available_attrs].fillna(0).astype(float).iterrows():
+        player_scores = [player.values.dot([float(weights.get(a, 0.0)) for a in available_attrs])
+                         for weights in WEIGHTS_BY_ROLE.values()]
+        avg_scores.append(np.mean(player_scores))
+    df['_avg_score'] = avg_scores
+    df_sorted = df.sort_values(['_avg_score', '_transfer_val_numeric'], ascending=[False, False])
+    df_deduped = df_sorted.drop_duplicates(subset=['_name_key'], keep='first')
+    return df_deduped.drop(columns=['_name_key', '_transfer_val_numeric', '_avg_score']).reset_index(drop=True)
+
+
+def _export_frame(n_players, seed):
+    html_text = generate_export(n_players, duplicate_rate=0.3, missing_cell_rate=0.05, seed=seed)
+    df, _ = parse_players_from_html(html_text)
+    return merge_duplicate_columns(df).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_deduplicate_matches_reference(seed):
+    df = _export_frame(300, seed)
+    pd.testing.assert_frame_equal(deduplicate_players(df), _reference_deduplicate(df))
+
+
+def test_deduplicate_normalizes_names():
+    df = pd.DataFrame({
+        'Name': ['José  Ruiz', 'jose ruiz', ' JOSÉ RUIZ ', 'Ángel Núñez', 'angel nunez', 'Iñaki Peña'],
+        'Transfer Value': ['€1.0M', '€2.0M', '€3.0M', 'Not for Sale', '€50K', '€10K'],
+        'Passing': [5, 9, 9, 7, 6, 1],
+    })
+    result = deduplicate_players(df)
+    pd.testing.assert_frame_equal(result, _reference_deduplicate(df))
+    # Higher score wins; equal scores fall back to the higher transfer value
+    assert result['Transfer Value'].tolist() == ['€3.0M', 'Not for Sale', '€10K']
+
+
+def test_deduplicate_keeps_every_empty_name():
+    df = pd.DataFrame({
+        'Name': ['Tom Kane', None, np.nan, '', '   ', 'tom kane'],
+        'Transfer Value': ['€1.0M'] * 6,
+        'Passing': [5, 4, 3, 2, 1, 6],
+    })
+    result = deduplicate_players(df)
+    pd.testing.assert_frame_equal(result, _reference_deduplicate(df))
+    assert result['Passing'].tolist() == [6, 4, 3, 2, 1]
+    assert name_keys(df['Name']).nunique() == 5
+
+
+def test_deduplicate_without_transfer_value():
+    df = _export_frame(200, 7).drop(columns=['Transfer Value'])
+    pd.testing.assert_frame_equal(deduplicate_players(df), _reference_deduplicate(df))
+
+
+def _reference_parse(html_text):
+    """The original BeautifulSoup parser"""
+    bs4 = pytest.importorskip("bs4")
+    table = bs4.BeautifulSoup(html_text, "html.parser").find("table")
+    if table is None:
+        return None, "No <table> found in HTML."
+    header_row = table.find("tr")
+    if header_row is None:
+        return None, "No rows in table."
+    canonical = [ABBR_MAP.get(h, h) for h in (th.get_text(strip=True) for th in header_row.find_all(["th", "td"]))]
+
+    rows = []
+    for tr in table.find_all("tr")[1:]:
+        cols = [td.get_text(strip=True) for td in tr.find_all(["td", "th"])]
+        if not cols or all(not c for c in cols):
+            continue
+        cols = (cols + [""] * (len(canonical) - len(cols)))[:len(canonical)]
+        row = {col_name: val for col_name, val in zip(canonical, cols) if col_name}
+        name = (row.get("Name") or "").strip()
+        if not name or name.lower() == "name":
+            continue
+        rows.append(row)
+    if not rows:
+        return None, "No data rows parsed from HTML table."
+
+    df = pd.DataFrame(rows)
+    for c in df.columns:
+        if c in ("Name", "Position", "Transfer Value", "Inf"):
+            continue
+        df[c] = pd.to_numeric(df[c].astype(str).str.extract(r'(-?\d+(?:\.\d+)?)')[0], errors="coerce")
+    if "Age" in df.columns:
+        df["Age"] = pd.to_numeric(df["Age"], errors="coerce").astype("Int64")
+    return df, None
+
+
+def _assert_parses_like_reference(html_text, chunk_sizes):
+    expected, expected_error = _reference_parse(html_text)
+    data = html_text.encode("utf-8")
+    # Small chunks split tags, entities and multi-byte characters across feeds
+    streamed = [parse_players_from_stream(io.BytesIO(data), len(data), chunk_bytes=size) for size in chunk_sizes]
+    for df, error in [parse_players_from_html(html_text)] + streamed:
+        assert error == expected_error
+        if expected is None:
+            assert df is None
+        else:
+            pd.testing.assert_frame_equal(df, expected)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_stream_parser_matches_reference_on_exports(seed):
+    html_text = generate_export(150, repeated_columns=seed, missing_attributes=seed + 1, missing_cell_rate=0.05, seed=seed)
+    _assert_parses_like_reference(html_text, (4096, 997))
+
+
+@pytest.mark.parametrize("html_text", [
+    "<html><body><p>no table here</p></body></html>",
+    "<table></table>",
+    "<table><tr><th>Name</th><th>Age</th></tr></table>",
+    # Blank rows, repeated header rows and short rows
+    "<table><tr><th>Name</th><th>Age</th><th>Pas</th><th>Pas</th></tr>"
+    "<tr><td></td><td></td></tr><tr><td>Name</td><td>Age</td></tr>"
+    "<tr><td>Zé &amp; Co</td><td>21</td><td>12</td><td>14</td></tr>"
+    "<tr><td>Ana</td><td>-</td></tr></table>",
+    # Only the first table is read, text cells keep their text
+    "<table><tr><td>Name</td><td>Inf</td><td>Transfer Value</td><td>Fin</td></tr>"
+    "<tr><td> Iñaki  Peña </td><td>Inj</td><td>€1.5M - €3M</td><td>15.5</td></tr></table>"
+    "<table><tr><td>Name</td></tr><tr><td>Other</td></tr></table>",
+])
+def test_stream_parser_matches_reference_on_edge_cases(html_text):
+    _assert_parses_like_reference(html_text, (4096, 7, 1))
@@ -0,0 +1,43 @@
+"""Debounced preference writes"""
+import json
+import os
+import time
+
+import pytest
+
+import preferences
+
+
+@pytest.fixture
+def prefs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(preferences, "PREFS_DIR", str(tmp_path))
+    monkeypatch.setattr(preferences, "DEBOUNCE_SECONDS", 0.2)
+    monkeypatch.setattr(preferences, "MAX_WAIT_SECONDS", 0.6)
+    yield tmp_path
+    preferences.flush()
+
+
+def test_save_is_debounced_and_atomic(prefs_dir):
+    for i in range(5):
+        preferences.save("scout", {"n": i})
+    path = preferences.prefs_path("scout")
+    assert not os.path.exists(path)
+    assert preferences.load("scout", {})["n"] == 4
+    time.sleep(0.5)
+    with open(path) as f:
+        assert json.load(f) == {"n": 4}
+    # Only the renamed file is left, no temp files
+    assert os.listdir(prefs_dir) == ["scout.json"]
+
+
+def test_continuous_saves_flush_after_max_wait(prefs_dir):
+    path = preferences.prefs_path("scout")
+    started = time.monotonic()
+    written_after = None
+    # A save every 50 ms never leaves the 200 ms quiet period the debounce waits for
+    while time.monotonic() - started < 2.0:
+        preferences.save("scout", {"at": time.monotonic()})
+        if written_after is None and os.path.exists(path):
+            written_after = time.monotonic() - started
+        time.sleep(0.05)
+    assert written_after is not None and written_after < 1.2
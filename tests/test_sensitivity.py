@@ -0,0 +1,80 @@
+"""Ranking sensitivity against a full argsort of every weight sample"""
+import numpy as np
+import pytest
+
+from sensitivity import RANK_PERCENTILES, weight_sensitivity
+
+
+def _reference_sensitivity(attrs_matrix, weights, n_samples, noise, top_n, track, window, seed):
+    """Re-rank every player in every sample with a full sort"""
+    base_order = np.argsort(-attrs_matrix.dot(weights), kind="stable")
+    tracked = base_order[:track]
+    log_factors = np.random.default_rng(seed).standard_normal((n_samples, len(weights))) * noise
+    ranks, top_counts, overlap = [], np.zeros(len(attrs_matrix), dtype=int), []
+    for factors in log_factors:
+        order = np.argsort(-attrs_matrix.dot(weights * np.exp(factors)), kind="stable")
+        position = np.argsort(order) + 1
+        ranks.append(np.minimum(position[tracked], window + 1))
+        top_counts[order[:top_n]] += 1
+        overlap.append(len(set(order[:top_n]) & set(base_order[:top_n])))
+    churn = top_n - np.array(overlap)
+    importance = np.array([np.corrcoef(np.abs(log_factors[:, i]), churn)[0, 1] if w else np.nan
+                           for i, w in enumerate(weights)])
+    return {
+        "tracked": tracked,
+        "ranks": np.array(ranks),
+        "top_share": top_counts[tracked] / n_samples,
+        "top_counts": top_counts,
+        "overlap": np.array(overlap),
+        "importance": importance,
+        "base_rank": np.argsort(base_order) + 1,
+    }
+
+
+@pytest.mark.parametrize("memory_budget", [64 * 2**20, 3_000 * 16 * 7])
+@pytest.mark.parametrize("window", [None, 60])
+def test_matches_full_sort(memory_budget, window):
+    rng = np.random.default_rng(48)
+    attrs_matrix = rng.integers(1, 21, (3_000, 14)) + rng.random((3_000, 14))
+    weights = rng.uniform(0.5, 4.0, 14)
+    weights[[2, 9]] = 0.0
+    result = weight_sensitivity(attrs_matrix, weights, n_samples=300, noise=0.3, top_n=20, track=40, window=window,
+                                memory_budget=memory_budget, seed=5)
+    expected = _reference_sensitivity(attrs_matrix, weights, 300, 0.3, 20, 40, result["window"], 5)
+    assert result["window"] == (window or 80)
+    assert np.array_equal(result["tracked"], expected["tracked"])
+    low, median, high = np.percentile(expected["ranks"], RANK_PERCENTILES, axis=0, method="nearest")
+    assert np.array_equal(result["rank_low"], low)
+    assert np.array_equal(result["rank_median"], median)
+    assert np.array_equal(result["rank_high"], high)
+    np.testing.assert_allclose(result["top_share"], expected["top_share"])
+    assert np.array_equal(result["overlap"], expected["overlap"])
+    np.testing.assert_allclose(result["importance"], expected["importance"], atol=1e-9)
+
+    # Entrants: every non-base player that reached the top, most often first
+    top_counts = expected["top_counts"]
+    entrants = result["entrants"]
+    assert set(entrants) == set(np.flatnonzero(top_counts > 0)) - set(expected["tracked"][:20])
+    assert np.all(np.diff(top_counts[entrants]) <= 0)
+    np.testing.assert_allclose(result["entrant_share"], top_counts[entrants] / 300)
+    assert np.array_equal(result["entrant_base_rank"], expected["base_rank"][entrants])
+    assert np.all(result["entrant_base_rank"] > 20)
+
+
+def test_no_noise_keeps_base_ranking():
+    rng = np.random.default_rng(49)
+    attrs_matrix = rng.random((500, 6))
+    result = weight_sensitivity(attrs_matrix, np.ones(6), n_samples=50, noise=0.0, top_n=10, track=25)
+    assert np.array_equal(result["rank_low"], np.arange(1, 26))
+    assert np.array_equal(result["rank_high"], np.arange(1, 26))
+    assert np.array_equal(result["top_share"], [1.0] * 10 + [0.0] * 15)
+    assert (result["overlap"] == 10).all() and len(result["entrants"]) == 0
+    assert np.array_equal(result["importance"], np.zeros(6))
+
+
+def test_fewer_players_than_top_n():
+    attrs_matrix = np.random.default_rng(50).random((8, 4))
+    result = weight_sensitivity(attrs_matrix, np.ones(4), n_samples=40, top_n=20, track=50)
+    assert result["window"] == 8 and len(result["tracked"]) == 8
+    assert np.array_equal(result["top_share"], np.ones(8))
+    assert np.all(result["rank_high"] <= 8)
@@ -0,0 +1,85 @@
+"""Similar-player search against a brute-force weighted distance scan"""
+import numpy as np
+import pytest
+
+from similarity import BRUTE_FORCE_SHARE, SimilarityIndex, filter_mask
+
+
+def _weights(kind, n_attrs, rng):
+    if kind == "unweighted":
+        return None
+    weights = rng.uniform(0.5, 3.0, n_attrs)
+    # A role ignores some attributes
+    weights[rng.choice(n_attrs, n_attrs // 3, replace=False)] = 0.0
+    return weights
+
+
+def _reference_distances(attrs_matrix, weights, row):
+    weights = np.ones(attrs_matrix.shape[1]) if weights is None else weights
+    weights = weights / weights[weights > 0].mean()
+    return np.sqrt((weights * (attrs_matrix - attrs_matrix[row]) ** 2).sum(axis=1))
+
+
+def _reference_nearest(distances, row, k, allowed):
+    candidates = [i for i in range(len(distances)) if i != row and (allowed is None or allowed[i])]
+    rows = np.array(sorted(candidates, key=lambda i: distances[i])[:k], dtype=int)
+    return rows, distances[rows]
+
+
+def _allowed(kind, n, rng):
+    share = {"none": None, "loose": 0.5, "selective": BRUTE_FORCE_SHARE / 2, "sparse": 5 / n}[kind]
+    return None if share is None else rng.random(n) < share
+
+
+@pytest.mark.parametrize("weights_kind", ["unweighted", "role"])
+@pytest.mark.parametrize("allowed_kind", ["none", "loose", "selective", "sparse"])
+def test_nearest_matches_brute_force(weights_kind, allowed_kind):
+    rng = np.random.default_rng(47)
+    attrs_matrix = rng.integers(1, 21, (3_000, 12)) + rng.random((3_000, 12))
+    weights = _weights(weights_kind, attrs_matrix.shape[1], rng)
+    index = SimilarityIndex(attrs_matrix, weights)
+    for row in rng.choice(len(attrs_matrix), 10, replace=False):
+        allowed = _allowed(allowed_kind, len(attrs_matrix), rng)
+        distances = _reference_distances(attrs_matrix, weights, row)
+        for k in (1, 10, 40):
+            rows, found = index.nearest(row, k, allowed)
+            expected_rows, expected = _reference_nearest(distances, row, k, allowed)
+            assert np.array_equal(rows, expected_rows)
+            np.testing.assert_allclose(found, expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("weights_kind", ["unweighted", "role"])
+@pytest.mark.parametrize("allowed_kind", ["none", "loose", "selective"])
+def test_within_matches_brute_force(weights_kind, allowed_kind):
+    rng = np.random.default_rng(48)
+    attrs_matrix = rng.integers(1, 21, (2_000, 10)) + rng.random((2_000, 10))
+    weights = _weights(weights_kind, attrs_matrix.shape[1], rng)
+    index = SimilarityIndex(attrs_matrix, weights)
+    for row in rng.choice(len(attrs_matrix), 10, replace=False):
+        allowed = _allowed(allowed_kind, len(attrs_matrix), rng)
+        distances = _reference_distances(attrs_matrix, weights, row)
+        radius = np.quantile(distances, 0.05)
+        rows, found = index.within(row, radius, allowed)
+        expected_rows, expected = _reference_nearest(distances, row, len(distances), allowed)
+        inside = expected <= radius
+        assert np.array_equal(rows, expected_rows[inside])
+        np.testing.assert_allclose(found, expected[inside], rtol=1e-9, atol=1e-9)
+
+
+def test_nearest_small_index():
+    attrs_matrix = np.array([[1.0, 2.0], [2.0, 2.0], [9.0, 9.0]])
+    index = SimilarityIndex(attrs_matrix)
+    rows, distances = index.nearest(0, k=10)
+    assert rows.tolist() == [1, 2] and np.allclose(distances, [1.0, np.hypot(8, 7)])
+    assert len(SimilarityIndex(attrs_matrix[:1]).nearest(0)[0]) == 0
+    # Nothing allowed but the query row itself
+    assert len(index.nearest(0, k=2, allowed=np.array([True, False, False]))[0]) == 0
+
+
+def test_filter_mask_excludes_unknowns():
+    ages = np.array([17, 21, np.nan, 30, 25])
+    values = np.array([1.0, np.nan, 2.0, 50.0, 0.0])
+    assert filter_mask(ages, values).tolist() == [True] * 5
+    assert filter_mask(ages, values, age_range=(18, 30)).tolist() == [False, True, False, True, True]
+    assert filter_mask(ages, values, max_value=10.0).tolist() == [True, False, True, False, True]
+    assert filter_mask(ages, values, (18, 30), 10.0).tolist() == [False, False, False, False, True]
@@ -0,0 +1,75 @@
+"""Rank error of the KLL quantile sketches against exact quantiles"""
+import numpy as np
+import pytest
+
+from sketches import QuantileSketch, merge_columns, sketch_columns
+
+QS = np.array([0.01, 0.05, 0.25, 0.4, 0.5, 0.6, 0.8, 0.95, 0.99])
+MAX_RANK_ERROR = 0.02
+
+
+def _rank_error(values, qs, estimates):
+    """How far each estimate's rank in values is from its target quantile (0 inside a run of ties)"""
+    values = np.sort(values)
+    below = np.searchsorted(values, estimates, side="left") / len(values)
+    at_or_below = np.searchsorted(values, estimates, side="right") / len(values)
+    return np.maximum(np.maximum(below - qs, qs - at_or_below), 0.0)
+
+
+def _distributions(rng, n):
+    return {
+        "normal": rng.normal(1500, 300, n),
+        "skewed": rng.lognormal(7, 0.5, n),
+        # Whole-number scores tie a lot, like rounded role scores
+        "ties": rng.integers(0, 40, n).astype(float),
+        "sorted": np.sort(rng.normal(0, 1, n)),
+    }
+
+
+@pytest.mark.parametrize("name", ["normal", "skewed", "ties", "sorted"])
+def test_quantiles_within_rank_error(name):
+    values = _distributions(np.random.default_rng(45), 200_000)[name]
+    sketch = QuantileSketch().update(values)
+    assert sketch.n == len(values)
+    # Far fewer items than values are kept
+    assert sum(len(level) for level in sketch.levels) < 2000
+    assert _rank_error(values, QS, sketch.quantiles(QS)).max() < MAX_RANK_ERROR
+
+
+@pytest.mark.parametrize("name", ["normal", "skewed", "ties", "sorted"])
+def test_merged_sketch_matches_union(name):
+    values = _distributions(np.random.default_rng(46), 200_000)[name]
+    # Uneven parts, as uploads of different sizes would be
+    parts = np.split(values, [1_000, 31_000, 120_000])
+    merged = QuantileSketch().update(parts[0])
+    for part in parts[1:]:
+        merged.merge(QuantileSketch(seed=len(part)).update(part))
+    assert merged.n == len(values)
+    assert _rank_error(values, QS, merged.quantiles(QS)).max() < MAX_RANK_ERROR
+
+
+def test_merge_columns_leaves_inputs_untouched():
+    rng = np.random.default_rng(47)
+    first, second = rng.normal(0, 1, (5_000, 3)), rng.normal(2, 1, (7_000, 3))
+    sketches = [sketch_columns(first), sketch_columns(second)]
+    before = [[level.copy() for level in sketch.levels] for sketch in sketches[0]]
+    merged = merge_columns(sketches)
+    assert [sketch.n for sketch in merged] == [12_000] * 3
+    for sketch, levels in zip(sketches[0], before):
+        assert sketch.n == 5_000
+        assert all(np.array_equal(a, b) for a, b in zip(sketch.levels, levels))
+    union = np.vstack([first, second])
+    for j, sketch in enumerate(merged):
+        assert _rank_error(union[:, j], QS, sketch.quantiles(QS)).max() < MAX_RANK_ERROR
+
+
+def test_same_data_gives_same_cut_points():
+    values = np.random.default_rng(48).normal(0, 1, 50_000)
+    assert np.array_equal(QuantileSketch().update(values).quantiles(QS), QuantileSketch().update(values).quantiles(QS))
+
+
+def test_nan_and_empty():
+    sketch = QuantileSketch().update([np.nan, 1.0, np.nan, 3.0, 2.0])
+    assert sketch.n == 3
+    assert np.array_equal(sketch.quantiles([0.0, 0.5, 1.0]), [1.0, 2.0, 3.0])
+    assert np.isnan(QuantileSketch().quantiles(QS)).all()
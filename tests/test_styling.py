@@ -0,0 +1,104 @@
+"""Tier codes against the cell-by-cell colouring of the Full Table"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from formations import ROLES
+from pipeline import create_comprehensive_table
+from styling import (ADAPTIVE_TIER_QUANTILES, EMPTY_CELL_FLOORS, HIDDEN_TIER, NUMERIC_COLUMNS, ROLE_THRESHOLDS,
+                     TIER_NAMES, adaptive_thresholds, build_display_table, interpolate_color, table_styles,
+                     tier_codes, tier_counts, tier_filter)
+
+
+def _reference_code(score, col, role_thresholds, empty_cell_floors):
+    """The tier a single rounded score is shown in"""
+    if col in role_thresholds:
+        for code, (cut, _) in enumerate(role_thresholds[col]):
+            if score >= cut:
+                return code
+    elif col in empty_cell_floors and score >= empty_cell_floors[col]:
+        return TIER_NAMES.index('white')
+    return HIDDEN_TIER
+
+
+def _role_scores(n_players, seed):
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(1150, 250, (n_players, len(ROLES)))
+    # Scores exactly on, and half a point around, the cut points
+    cuts = np.array([cut for thresholds in ROLE_THRESHOLDS.values() for cut, _ in thresholds], dtype=float)
+    on_cuts = rng.random(matrix.shape) < 0.2
+    matrix[on_cuts] = rng.choice(cuts, on_cuts.sum()) + rng.choice([-0.5, 0.0, 0.5, 0.49, -0.51], on_cuts.sum())
+    return matrix
+
+
+def _thresholds(mode, matrix):
+    if mode == "fixed":
+        return ROLE_THRESHOLDS, EMPTY_CELL_FLOORS
+    cut_points = {role: np.quantile(matrix[:, ROLES.index(role)], ADAPTIVE_TIER_QUANTILES) for role in NUMERIC_COLUMNS}
+    return adaptive_thresholds(cut_points)
+
+
+@pytest.mark.parametrize("mode", ["fixed", "adaptive"])
+def test_codes_match_reference(mode):
+    matrix = _role_scores(2_000, 46)
+    role_thresholds, floors = _thresholds(mode, matrix)
+    codes = tier_codes(matrix, ROLES, role_thresholds, floors)
+    assert codes.dtype == np.int8
+    rounded = np.round(matrix)
+    expected = np.array([[_reference_code(rounded[i, j], col, role_thresholds, floors) for j, col in enumerate(ROLES)]
+                         for i in range(len(matrix))])
+    assert np.array_equal(codes, expected)
+
+
+@pytest.mark.parametrize("mode", ["fixed", "adaptive"])
+def test_codes_match_display_table(mode):
+    matrix = _role_scores(1_000, 47)
+    role_thresholds, floors = _thresholds(mode, matrix)
+    codes = tier_codes(matrix, ROLES, role_thresholds, floors)
+    df_final = pd.DataFrame({'Name': [f"Player {i}" for i in range(len(matrix))], 'Age': 25})
+    role_scores = {role: pd.Series(matrix[:, j]) for j, role in enumerate(ROLES)}
+    _, display_df = build_display_table(create_comprehensive_table(df_final, role_scores), role_thresholds, floors)
+    styles = table_styles(display_df, role_thresholds=role_thresholds)
+    for col in NUMERIC_COLUMNS:
+        col_codes = codes[:, ROLES.index(col)]
+        # Hidden exactly where the table blanks the cell
+        assert np.array_equal(col_codes == HIDDEN_TIER, (display_df[col] == '').to_numpy())
+        if col not in role_thresholds:
+            continue
+        cuts = [cut for cut, _ in role_thresholds[col]]
+        for code, cell, style in zip(col_codes, display_df[col], styles[col]):
+            if code == HIDDEN_TIER:
+                assert style == ''
+                continue
+            # Each coloured cell lies in its code's band and is drawn in that band's colours
+            score = int(cell)
+            assert score >= cuts[code] and (code == 0 or score < cuts[code - 1])
+            assert style == f"color: rgb{interpolate_color(score, role_thresholds[col])}; font-weight: bold"
+
+
+def test_counts_and_filter_match_brute_force():
+    codes = tier_codes(_role_scores(3_000, 48), ROLES)
+    counts = tier_counts(codes, ROLES)
+    for j, role in enumerate(ROLES):
+        assert counts.loc[role].tolist() == [int((codes[:, j] == t).sum()) for t in range(len(TIER_NAMES))]
+    assert (counts.sum(axis=1) == len(codes)).all()
+
+    rng = np.random.default_rng(49)
+    for best_tier in range(len(TIER_NAMES)):
+        for min_roles in (1, 2, 3):
+            column_indices = np.sort(rng.choice(len(ROLES), 4, replace=False))
+            for indices in (None, column_indices):
+                columns = range(len(ROLES)) if indices is None else indices
+                expected = [sum(row[j] <= best_tier for j in columns) >= min_roles for row in codes]
+                assert tier_filter(codes, best_tier, min_roles, indices).tolist() == expected
+
+
+def test_adaptive_thresholds_stay_distinct():
+    # Every quantile of a role with one repeated score lands on the same value
+    cut_points = {role: [1000.0] * len(ADAPTIVE_TIER_QUANTILES) for role in NUMERIC_COLUMNS}
+    role_thresholds, floors = adaptive_thresholds(cut_points)
+    for role, thresholds in role_thresholds.items():
+        cuts = [cut for cut, _ in thresholds]
+        assert cuts == [1005, 1004, 1003, 1002, 1001, 1000]
+        assert [colour for _, colour in thresholds] == [colour for _, colour in ROLE_THRESHOLDS[role]]
+    assert floors == {role: 1000 for role in EMPTY_CELL_FLOORS}